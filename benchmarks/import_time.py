@@ -0,0 +1,56 @@
+"""Time taken by `import rapidhrv` in a fresh interpreter.
+
+Reports the best wall time over several interpreters,
+and which optional, slow to import dependencies are imported along with RapidHRV,
+as JSON. Fails if any of them is.
+
+Usage::
+
+    python benchmarks/import_time.py --output import_results.json [--repeats 10]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from run_benchmarks import metadata
+
+LAZY_MODULES = ["dash", "plotly", "sklearn"]
+SCRIPT = f"""
+import sys, time
+started = time.perf_counter()
+import rapidhrv
+seconds = time.perf_counter() - started
+print(seconds, *[module for module in {LAZY_MODULES!r} if module in sys.modules])
+"""
+
+
+def measure_import() -> tuple[float, list]:
+    """Import time of RapidHRV in a new interpreter and the lazy modules it imported."""
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], check=True, capture_output=True, text=True
+    ).stdout.split()
+    return float(output[0]), output[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="import_results.json", help="JSON results file")
+    parser.add_argument("--repeats", type=int, default=5, help="Interpreters (best kept)")
+    args = parser.parse_args()
+
+    measure_import()  # Warm up file system caches
+    times, imported = zip(*(measure_import() for _ in range(args.repeats)))
+    result = {"seconds": min(times), "imported": sorted(set().union(*imported))}
+    print(f"import rapidhrv: {result['seconds']:.3f}s, imported {result['imported'] or 'none'}")
+
+    with open(args.output, "w") as f:
+        json.dump({"metadata": metadata(), "results": [result]}, f, indent=2)
+
+    if result["imported"]:
+        sys.exit(f"Imported lazily loaded modules: {', '.join(result['imported'])}")
+
+
+if __name__ == "__main__":
+    main()
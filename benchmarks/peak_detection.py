@@ -0,0 +1,89 @@
+"""Per-window cost of peak detection with and without peak widths.
+
+Times `peak_detection` on every window of synthetic signals preprocessed to 1000Hz,
+computing only the peak properties used by outlier detection (the default without clustering)
+and additionally computing peak widths (as required by ECG P/R/T clustering),
+and saves the time per window as JSON.
+
+Usage::
+
+    python benchmarks/peak_detection.py --output peak_detection_results.json [--quick]
+"""
+
+import argparse
+import json
+import time
+from typing import Literal
+
+from run_benchmarks import metadata
+
+import rapidhrv as rhv
+from rapidhrv import windowing
+from rapidhrv.synthetic import synthetic_signal
+
+MATRIX: dict = {"duration": [3600], "signals": [("ppg", 100), ("ecg", 250)], "window": [10, 30]}
+QUICK_MATRIX: dict = {"duration": [300], "signals": [("ppg", 100), ("ecg", 250)], "window": [10]}
+
+
+def run_case(
+    kind: Literal["ppg", "ecg"], sample_rate: int, duration: int, width: int, repeats: int
+) -> list:
+    preprocessed = rhv.preprocess(
+        synthetic_signal(kind, duration=duration, sample_rate=sample_rate)
+    )
+    window_samples = width * preprocessed.sample_rate
+    windows = [
+        windowing.minmax_scale(preprocessed.data[start : start + window_samples])
+        for start in range(0, len(preprocessed.data) - window_samples + 1, window_samples)
+    ]
+    distance = int(0.25 * preprocessed.sample_rate)  # Default `distance_threshold` of 250ms
+    prominence = 30 if kind == "ppg" else 50
+
+    results = []
+    for name, widths in (("lean", False), ("widths", True)):
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for window in windows:
+                rhv.analysis.peak_detection(window, distance, prominence, False, widths=widths)
+            times.append(time.perf_counter() - started)
+        result = {
+            "detection": name,
+            "kind": kind,
+            "sample_rate": preprocessed.sample_rate,
+            "duration": duration,
+            "window_width": width,
+            "windows": len(windows),
+            "seconds": min(times),
+            "microseconds_per_window": min(times) / len(windows) * 1e6,
+        }
+        results.append(result)
+        print(
+            f"{name:6} {kind} {duration:>5}s window {width:>2}s: {result['seconds']:7.3f}s "
+            f"{result['microseconds_per_window']:8.1f}us/window"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--output", default="peak_detection_results.json", help="JSON results file"
+    )
+    parser.add_argument("--quick", action="store_true", help="Run a reduced matrix")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per benchmark (best kept)")
+    args = parser.parse_args()
+
+    matrix = QUICK_MATRIX if args.quick else MATRIX
+    results = []
+    for duration in matrix["duration"]:
+        for kind, sample_rate in matrix["signals"]:
+            for width in matrix["window"]:
+                results.extend(run_case(kind, sample_rate, duration, width, args.repeats))
+
+    with open(args.output, "w") as f:
+        json.dump({"metadata": metadata(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
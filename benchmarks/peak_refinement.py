@@ -0,0 +1,97 @@
+"""Accuracy and speed of analyzing signals at their recorded rate with peak refinement.
+
+Preprocesses and analyzes synthetic signals at their recorded rate (`resample_rate=None`),
+without and with parabolic peak refinement (`peak_refinement="parabolic"`),
+and compares the resulting HRV metrics window by window with those of the default 1000Hz path,
+reporting time, peak memory and metric differences as JSON.
+
+Usage::
+
+    python benchmarks/peak_refinement.py --output peak_refinement_results.json [--quick]
+"""
+
+import argparse
+import json
+from typing import Literal, Optional
+
+from resampling import compare_metrics
+from run_benchmarks import measure, metadata
+
+import rapidhrv as rhv
+from rapidhrv.synthetic import synthetic_signal
+
+MATRIX: dict = {"duration": [600, 3600], "signals": [("ppg", 20), ("ppg", 100), ("ecg", 250)]}
+QUICK_MATRIX: dict = {"duration": [300], "signals": [("ppg", 20), ("ecg", 250)]}
+PATHS: dict = {
+    "1000Hz": {"resample_rate": 1000, "peak_refinement": "none"},
+    "native": {"resample_rate": None, "peak_refinement": "none"},
+    "native-parabolic": {"resample_rate": None, "peak_refinement": "parabolic"},
+}
+
+
+def smoothing(sample_rate: int, resample_rate: Optional[int]) -> Optional[tuple[int, int]]:
+    """Default Savitzky-Golay settings, or None if their window is too short at the output rate."""
+    poly_order, window_ms = 3, 100
+    window_length = round(window_ms / 1000 * (resample_rate or sample_rate)) | 1  # Odd
+    return (poly_order, window_ms) if window_length > poly_order else None
+
+
+def run_case(kind: Literal["ppg", "ecg"], sample_rate: int, duration: int, repeats: int) -> list:
+    signal = synthetic_signal(kind, duration=duration, sample_rate=sample_rate)
+    amplitude_threshold = 30 if kind == "ppg" else 50
+
+    def pipeline(resample_rate, peak_refinement):
+        preprocessed = rhv.preprocess(
+            signal,
+            resample_rate=resample_rate,
+            sg_settings=smoothing(sample_rate, resample_rate),
+        )
+        return rhv.analyze(
+            preprocessed,
+            amplitude_threshold=amplitude_threshold,
+            window_output="none",
+            peak_refinement=peak_refinement,
+        )
+
+    reference = pipeline(**PATHS["1000Hz"])
+    results = []
+    for path, kwargs in PATHS.items():
+        result = {
+            "path": path,
+            "kind": kind,
+            "sample_rate": sample_rate,
+            "duration": duration,
+            **measure(lambda: pipeline(**kwargs), repeats),
+        }
+        result.update(compare_metrics(pipeline(**kwargs), reference))
+        results.append(result)
+        print(
+            f"{path:16} {kind} {sample_rate:>4}Hz {duration:>5}s: {result['seconds']:7.3f}s "
+            f"{result['peak_memory_mb']:7.1f}MB "
+            f"median |dBPM| {result['BPM_median_abs_diff']:.2e} "
+            f"|dRMSSD| {result['RMSSD_median_abs_diff']:.2e}ms"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--output", default="peak_refinement_results.json", help="JSON results file"
+    )
+    parser.add_argument("--quick", action="store_true", help="Run a reduced matrix")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per benchmark (best kept)")
+    args = parser.parse_args()
+
+    matrix = QUICK_MATRIX if args.quick else MATRIX
+    results = []
+    for duration in matrix["duration"]:
+        for kind, sample_rate in matrix["signals"]:
+            results.extend(run_case(kind, sample_rate, duration, args.repeats))
+
+    with open(args.output, "w") as f:
+        json.dump({"metadata": metadata(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Accuracy and speed of the resampling methods of `preprocess`.
+
+Preprocesses synthetic signals with every method of `rapidhrv.preprocessing.RESAMPLING_METHODS`,
+and compares the resulting HRV metrics window by window with those of the "spline" method,
+reporting time, peak memory and metric differences as JSON.
+
+Usage::
+
+    python benchmarks/resampling.py --output resampling_results.json [--quick]
+"""
+
+import argparse
+import json
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+from run_benchmarks import measure, metadata
+
+import rapidhrv as rhv
+from rapidhrv.preprocessing import RESAMPLING_METHODS
+from rapidhrv.synthetic import synthetic_signal
+
+MATRIX: dict = {"duration": [600, 3600], "signals": [("ppg", 20), ("ppg", 100), ("ecg", 250)]}
+QUICK_MATRIX: dict = {"duration": [300], "signals": [("ppg", 20), ("ecg", 250)]}
+METRICS = ["BPM", "RMSSD", "SDNN", "HF"]
+
+
+def compare_metrics(result: pd.DataFrame, reference: pd.DataFrame) -> dict:
+    """Differences of `METRICS` over windows that are valid in both results."""
+    valid = ~result["Outlier"] & ~reference["Outlier"]
+    comparison: dict = {
+        "valid_windows": int(valid.sum()),
+        "outlier_agreement": float(np.mean(result["Outlier"] == reference["Outlier"])),
+    }
+    for metric in METRICS:
+        differences = np.abs(result.loc[valid, metric] - reference.loc[valid, metric])
+        comparison[f"{metric}_median_abs_diff"] = (
+            float(np.median(differences)) if valid.any() else None
+        )
+        comparison[f"{metric}_max_abs_diff"] = float(np.max(differences)) if valid.any() else None
+    return comparison
+
+
+def run_case(kind: Literal["ppg", "ecg"], sample_rate: int, duration: int, repeats: int) -> list:
+    signal = synthetic_signal(kind, duration=duration, sample_rate=sample_rate)
+    amplitude_threshold = 30 if kind == "ppg" else 50
+    reference = rhv.analyze(
+        rhv.preprocess(signal), amplitude_threshold=amplitude_threshold, window_output="none"
+    )
+
+    results = []
+    for method in RESAMPLING_METHODS:
+        result = {
+            "method": method,
+            "kind": kind,
+            "sample_rate": sample_rate,
+            "duration": duration,
+            **measure(lambda: rhv.preprocess(signal, resampling=method), repeats),
+        }
+        analyzed = rhv.analyze(
+            rhv.preprocess(signal, resampling=method),
+            amplitude_threshold=amplitude_threshold,
+            window_output="none",
+        )
+        result.update(compare_metrics(analyzed, reference))
+        results.append(result)
+        print(
+            f"{method:12} {kind} {sample_rate:>4}Hz {duration:>5}s: {result['seconds']:7.3f}s "
+            f"{result['peak_memory_mb']:7.1f}MB "
+            f"median |dBPM| {result['BPM_median_abs_diff']:.2e} "
+            f"|dRMSSD| {result['RMSSD_median_abs_diff']:.2e}ms"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="resampling_results.json", help="JSON results file")
+    parser.add_argument("--quick", action="store_true", help="Run a reduced matrix")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per benchmark (best kept)")
+    args = parser.parse_args()
+
+    matrix = QUICK_MATRIX if args.quick else MATRIX
+    results = []
+    for duration in matrix["duration"]:
+        for kind, sample_rate in matrix["signals"]:
+            results.extend(run_case(kind, sample_rate, duration, args.repeats))
+
+    with open(args.output, "w") as f:
+        json.dump({"metadata": metadata(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
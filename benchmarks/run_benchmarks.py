@@ -0,0 +1,197 @@
+"""Benchmarks of the RapidHRV pipeline on synthetic signals.
+
+Times `preprocess`, `analyze` (with and without ECG P/R/T clustering, per engine and in parallel),
+`frequency_domain` and `outlier_detection` separately,
+over a matrix of recording durations, sample rates and window settings,
+and saves throughput (input samples per second) and peak memory as JSON.
+
+Usage::
+
+    python benchmarks/run_benchmarks.py --output results.json [--quick] [--compare baseline.json]
+"""
+
+import argparse
+import datetime
+import gc
+import itertools
+import json
+import os
+import platform
+import time
+import tracemalloc
+from typing import Callable, Literal
+
+import numpy as np
+import scipy
+import sklearn
+
+import rapidhrv as rhv
+from rapidhrv.synthetic import synthetic_signal
+
+MATRIX = {
+    "duration": [300, 3600],
+    "sample_rate": {"ppg": [20, 100], "ecg": [250, 1000]},
+    "window": [(10, 0), (10, 5), (30, 0)],
+}
+QUICK_MATRIX = {
+    "duration": [120],
+    "sample_rate": {"ppg": [20], "ecg": [250]},
+    "window": [(10, 0), (10, 9)],
+}
+CASE_KEYS = ("kind", "duration", "sample_rate", "window_width", "window_overlap")
+
+
+def measure(function: Callable, repeats: int) -> dict:
+    """Best wall time of `function` over `repeats` runs, and its peak traced memory."""
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(times), "peak_memory_mb": peak / 2**20}
+
+
+def window_inputs(analyzed, sample_rate: int) -> list:
+    """Per-window arguments of `frequency_domain` and `outlier_detection` from `analyze` output."""
+    inputs = []
+    for _, row in analyzed.loc[~analyzed["BPM"].isna()].iterrows():
+        _, peaks, properties = row["Window"]
+        ibi = np.diff(peaks) * 1000 / sample_rate
+        inputs.append((peaks, properties, ibi, row["BPM"], row["RMSSD"]))
+    return inputs
+
+
+def run_case(
+    kind: Literal["ppg", "ecg"], duration: int, sample_rate: int, window: tuple, repeats: int
+) -> list:
+    width, overlap = window
+    signal = synthetic_signal(kind, duration=duration, sample_rate=sample_rate)
+    preprocessed = rhv.preprocess(signal)
+    n_samples = len(signal.data)
+    case = {  # Keys as in `CASE_KEYS`
+        "kind": kind,
+        "duration": duration,
+        "sample_rate": sample_rate,
+        "window_width": width,
+        "window_overlap": overlap,
+    }
+
+    benchmarks: dict[str, Callable] = {"preprocess": lambda: rhv.preprocess(signal)}
+    variants: dict[str, dict] = {
+        "loop": {},
+        "vectorized": {"engine": "vectorized"},
+        "sliding": {"engine": "sliding"},
+        "threads": {"n_workers": os.cpu_count() or 1},
+        "processes": {"n_workers": os.cpu_count() or 1, "executor": "process"},
+    }
+    if kind == "ecg":
+        variants["clustering"] = {"ecg_prt_clustering": True}
+        variants["clustering-recording"] = {
+            "ecg_prt_clustering": True,
+            "clustering_settings": "recording",
+        }
+    for name, kwargs in variants.items():
+        benchmarks[f"analyze[{name}]"] = lambda kwargs=kwargs: rhv.analyze(
+            preprocessed, window_width=width, window_overlap=overlap, **kwargs
+        )
+
+    settings = rhv.OutlierDetectionSettings.from_method("moderate")
+    inputs = window_inputs(
+        rhv.analyze(preprocessed, window_width=width, window_overlap=overlap),
+        preprocessed.sample_rate,
+    )
+    benchmarks["frequency_domain"] = lambda: [
+        rhv.analysis.frequency_domain(ibi, preprocessed.sample_rate) for *_, ibi, _, _ in inputs
+    ]
+    benchmarks["outlier_detection"] = lambda: [
+        rhv.analysis.outlier_detection(
+            peaks, properties, ibi, preprocessed.sample_rate, width, bpm, rmssd, settings
+        )
+        for peaks, properties, ibi, bpm, rmssd in inputs
+    ]
+
+    stream_stats = {}
+
+    def stream():
+        analyzer = rhv.StreamingAnalyzer(sample_rate, window_width=width, window_overlap=overlap)
+        for start in range(0, n_samples, sample_rate):  # One second chunks
+            analyzer.update(signal.data[start : start + sample_rate])
+        stream_stats.update(analyzer.stats)
+
+    benchmarks["streaming"] = stream
+
+    results = []
+    for name, function in benchmarks.items():
+        result = {"benchmark": name, **case, **measure(function, repeats)}
+        result["samples_per_second"] = n_samples / result["seconds"]
+        if name == "streaming":
+            result["latency_per_chunk"] = stream_stats["seconds"] / stream_stats["updates"]
+        results.append(result)
+        print(
+            f"{name:24} {kind} {duration:>6}s {sample_rate:>4}Hz window {width}/{overlap}: "
+            f"{result['seconds']:8.3f}s {result['samples_per_second']:12.0f} samples/s "
+            f"{result['peak_memory_mb']:8.1f}MB"
+        )
+    return results
+
+
+def metadata() -> dict:
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "scikit-learn": sklearn.__version__,
+    }
+
+
+def compare(results: list, baseline: list) -> None:
+    """Prints the speedup of every benchmark over the matching baseline benchmark."""
+
+    def key(result):
+        return tuple(result[k] for k in ("benchmark", *CASE_KEYS))
+
+    baseline_results = {key(result): result for result in baseline}
+    for result in results:
+        previous = baseline_results.get(key(result))
+        if previous is not None:
+            speedup = previous["seconds"] / result["seconds"]
+            print(f"{' '.join(map(str, key(result))):60} {speedup:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--quick", action="store_true", help="Run a reduced matrix")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per benchmark (best kept)")
+    parser.add_argument("--kind", choices=["ppg", "ecg"], nargs="+", default=["ppg", "ecg"])
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    matrix = QUICK_MATRIX if args.quick else MATRIX
+    results = []
+    for kind in args.kind:
+        for duration, sample_rate, window in itertools.product(
+            matrix["duration"], matrix["sample_rate"][kind], matrix["window"]
+        ):
+            results.extend(run_case(kind, duration, sample_rate, window, args.repeats))
+
+    with open(args.output, "w") as f:
+        json.dump({"metadata": metadata(), "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,53 @@
 from .analysis import analyze
-from .data import OutlierDetectionSettings, Signal, get_example_data
-from .preprocessing import preprocess
-from .visualization import visualize
+from .batch import analyze_many, load_batch_results, preprocess_many, run_batch
+from .caching import ResultCache
+from .data import (
+    ClusteringSettings,
+    LazySignal,
+    OutlierDetectionSettings,
+    Signal,
+    convert_to_hdf5,
+    get_example_data,
+    read_channels,
+)
+from .preprocessing import Preprocessor, preprocess, preprocess_blocks, preprocess_into
+from .profiling import Profiler
+from .results import load_results, save_results
+from .streaming import StreamingAnalyzer
+from .sweep import sweep
 
 __all__ = (
     "analyze",
+    "analyze_many",
+    "ClusteringSettings",
+    "LazySignal",
     "OutlierDetectionSettings",
+    "Preprocessor",
+    "Profiler",
+    "ResultCache",
     "Signal",
+    "StreamingAnalyzer",
+    "convert_to_hdf5",
     "get_example_data",
+    "load_batch_results",
+    "load_results",
     "preprocess",
+    "preprocess_blocks",
+    "preprocess_into",
+    "preprocess_many",
+    "read_channels",
+    "run_batch",
+    "save_results",
+    "sweep",
     "visualize",
 )
+
+
+def __getattr__(name: str):
+    # Dash and Plotly are optional, and slow to import, so are only imported when used
+    if name in ("visualize", "visualization"):
+        import importlib
+
+        visualization = importlib.import_module(".visualization", __name__)
+        return visualization if name == "visualization" else visualization.visualize
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
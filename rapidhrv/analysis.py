@@ -1,17 +1,27 @@
-from typing import Union
+import concurrent.futures
+import dataclasses
+import functools
+from collections.abc import Sequence
+from multiprocessing import shared_memory
+from typing import Any, Callable, Literal, Optional, Union
 
 import numpy as np
 import pandas as pd
+import scipy.fft
 import scipy.interpolate
+import scipy.linalg
 import scipy.signal
-import scipy.stats
-import sklearn.cluster
-import sklearn.preprocessing
 
-from .data import OutlierDetectionSettings, Signal
+from . import caching, clustering, profiling, windowing
+from .data import ClusteringSettings, OutlierDetectionSettings, Signal
 
 DATA_COLUMNS = ["BPM", "RMSSD", "SDNN", "SDSD", "pNN20", "pNN50", "HF"]
-DATAFRAME_COLUMNS = ["Time", *DATA_COLUMNS, "Outlier", "Window"]
+FREQUENCY_BANDS = {"VLF": (0.0033, 0.04), "LF": (0.04, 0.15), "HF": (0.15, 0.4)}
+EXTENDED_FREQUENCY_COLUMNS = ["VLF", "LF", "LF/HF"]
+OUTLIER_CRITERIA = ["n_peaks", "bpm", "rmssd", "peak_span", "prominence", "height", "ibi"]
+DATAFRAME_COLUMNS = ["Time", *DATA_COLUMNS, "Outlier", "Outlier Criterion", "Window"]
+# Resampled samples of interval series whose spectra are estimated at once
+SPECTRAL_BLOCK_SIZE = 2**21
 
 
 def analyze(
@@ -23,6 +33,14 @@ def analyze(
     distance_threshold: int = 250,
     n_required_peaks: int = 3,
     outlier_detection_settings: Union[str, OutlierDetectionSettings] = "moderate",
+    engine: Literal["loop", "vectorized", "sliding"] = "loop",
+    window_output: Literal["full", "lazy", "none"] = "full",
+    extended_frequency_domain: bool = False,
+    clustering_settings: Union[str, ClusteringSettings] = "window",
+    peak_refinement: Literal["none", "parabolic"] = "none",
+    n_workers: int = 1,
+    executor: Literal["thread", "process"] = "thread",
+    cache: Optional[caching.ResultCache] = None,
 ) -> pd.DataFrame:
     """Analyzes cardiac data.
 
@@ -32,6 +50,10 @@ def analyze(
     ----------
     signal : Signal
         Cardiac signal to be analyzed.
+        Every channel of a multi-channel signal is analyzed with the same parameters,
+        all at once by the "vectorized" engine, and one at a time by the other engines.
+        Most of the cost of analysis is per resampled sample of interval series,
+        so that analyzing channels together is about as fast as analyzing each in turn.
     window_width : int, default: 10
         Width of the sliding window in seconds.
     window_overlap: int, default: 0
@@ -53,10 +75,83 @@ def analyze(
         Settings for the Outlier detection algorithm.
         Accepts either an `OutlierDetectionSettings` object, or a string specifying a method.
         Refer to :class:`OutlierDetectionSettings` for details.
+    engine: {"loop", "vectorized", "sliding"}, default: "loop"
+        "loop" normalizes and detects peaks separately within every window.
+        "vectorized" detects peaks once over the whole signal
+        and assigns them to windows by index arithmetic,
+        which is considerably faster for long recordings and large overlaps.
+        Windows whose peaks lie away from the window edges yield the same peaks
+        and metrics equal to the "loop" engine within floating point error (relative 1e-9).
+        Peaks within `distance_threshold` of a window edge may differ,
+        as the minimum peak distance is enforced over the whole signal.
+        "sliding" detects the same peaks in every window as "vectorized",
+        but computes time-domain metrics from running sums of interbeat intervals
+        and their successive differences over the peaks accepted by any window,
+        corrected locally for windows whose prominence criterion rejects some of them,
+        at a cost per window independent of its width.
+        Its peaks, time-domain metrics and outliers equal those of "vectorized"
+        within floating point error. Interbeat intervals of windows not missing peaks
+        are interpolated once for the frequency domain, see :func:`frequency_domain_sliding`,
+        so that their "HF" (and extended frequency domain) differs from that of "vectorized"
+        by 0.7-1.9% (median) for 10 second windows, less for longer windows.
+        Only the time-domain metrics are step-proportional: assigning peaks to windows,
+        their heights and prominences, outlier detection and the periodogram of every window
+        still cost in proportion to its width, and periodograms take most of the time,
+        so that "sliding" is at most slightly faster than "vectorized".
+        The "vectorized" and "sliding" engines do not support `ecg_prt_clustering`.
+        Their "Window" column only holds peak heights and prominences as peak properties.
+    window_output: {"full", "lazy", "none"}, default: "full"
+        Contents of the "Window" column, used by :func:`rapidhrv.visualize`.
+        "full" holds a tuple of the normalized window, its peaks and their properties,
+        see :func:`peak_detection`.
+        As this retains a normalized copy of every window, "lazy" instead holds a
+        :class:`LazyWindow`, which references the signal and normalizes the window on demand.
+        "none" omits the column.
+    extended_frequency_domain: bool, default: False
+        Additionally report VLF and LF power and the LF/HF ratio,
+        in the columns `EXTENDED_FREQUENCY_COLUMNS` following "HF".
+        These require windows spanning several periods of the lowest frequency of the band
+        (0.04Hz for LF and 0.0033Hz for VLF), so are NaN or unreliable for short windows.
+    clustering_settings: str or ClusteringSettings, default: "window"
+        Settings for `ecg_prt_clustering`.
+        Accepts either a `ClusteringSettings` object, or a string specifying a method.
+        "recording" fits clusters once to the start of the recording,
+        which is considerably faster than fitting them for every window ("window").
+        Refer to :class:`ClusteringSettings` for details.
+    peak_refinement: {"none", "parabolic"}, default: "none"
+        "parabolic" locates peaks between samples for interbeat intervals,
+        see :func:`refine_peaks`.
+        This allows analyzing signals at their recorded rate,
+        preprocessed with `resample_rate=None`, instead of upsampled to 1000Hz,
+        at a fraction of the time and memory and with comparable interbeat interval accuracy
+        (see `benchmarks/peak_refinement.py`).
+        Note that the default smoothing window of :func:`preprocess` is too short
+        for rates below 50Hz, at which `sg_settings` must be disabled or widened.
+    n_workers: int, default: 1
+        Number of workers analyzing contiguous shards of windows in parallel,
+        for long recordings of which :func:`analyze_many` would only use a single process.
+        Results are identical to those of a single worker.
+        Supported by the "loop" engine, and by `ecg_prt_clustering` in "window" mode only,
+        as "recording" mode labels peaks depending on all previous windows.
+    executor: {"thread", "process"}, default: "thread"
+        Whether workers are threads, which share the signal,
+        or processes, which receive it through shared memory.
+        Threads only run in parallel while SciPy releases the global interpreter lock,
+        whereas processes incur the cost of starting workers and returning results.
+    cache: ResultCache, optional
+        Cache of detected peaks and metrics, reused by analyses of the same signal
+        with the same parameters, which only differ in outlier detection settings,
+        window output or `extended_frequency_domain`.
+        Results without window output are cached in their entirety.
+        See :class:`ResultCache`.
 
     Returns
     -------
     Dataframe containing Extracted heart data.
+    The "Outlier Criterion" column holds the first of `OUTLIER_CRITERIA`
+    that marked a window as an outlier, see :func:`outlier_criterion`, or None.
+    Results of multi-channel signals are concatenated, with the name of each channel
+    (or its position, if `signal.channel_names` are unknown) in a leading "Channel" column.
     """
     # Validate arguments
     outlier_detection_settings = (
@@ -65,9 +160,63 @@ def analyze(
         else outlier_detection_settings
     )
 
+    clustering_settings = (
+        ClusteringSettings.from_method(clustering_settings)
+        if isinstance(clustering_settings, str)
+        else clustering_settings
+    )
+
     if n_required_peaks < 3:
         raise ValueError("Parameter 'n_required_peaks' must be greater than three.")
 
+    if engine not in ("loop", "vectorized", "sliding"):
+        raise ValueError(f"Invalid analysis engine: {engine}.")
+
+    if window_output not in ("full", "lazy", "none"):
+        raise ValueError(f"Invalid window output: {window_output}.")
+
+    if peak_refinement not in ("none", "parabolic"):
+        raise ValueError(f"Invalid peak refinement: {peak_refinement}.")
+
+    if engine != "loop" and ecg_prt_clustering:
+        raise ValueError(f"The {engine} engine does not support 'ecg_prt_clustering'.")
+
+    if n_workers < 1:
+        raise ValueError("Parameter 'n_workers' must be at least one.")
+
+    if executor not in ("thread", "process"):
+        raise ValueError(f"Invalid executor: {executor}.")
+
+    if n_workers > 1 and engine != "loop":
+        raise ValueError(f"The {engine} engine does not support multiple workers.")
+
+    if n_workers > 1 and ecg_prt_clustering and clustering_settings.mode == "recording":
+        raise ValueError("Recording mode clustering does not support multiple workers.")
+
+    if signal.data.ndim > 1 and engine != "vectorized":
+        analyze_channel = functools.partial(
+            analyze,
+            window_width=window_width,
+            window_overlap=window_overlap,
+            ecg_prt_clustering=ecg_prt_clustering,
+            amplitude_threshold=amplitude_threshold,
+            distance_threshold=distance_threshold,
+            n_required_peaks=n_required_peaks,
+            outlier_detection_settings=outlier_detection_settings,
+            engine=engine,
+            window_output=window_output,
+            extended_frequency_domain=extended_frequency_domain,
+            clustering_settings=clustering_settings,
+            peak_refinement=peak_refinement,
+            n_workers=n_workers,
+            executor=executor,
+            cache=cache,
+        )
+        results = {key: analyze_channel(channel) for key, channel in signal.channels().items()}
+        return (
+            pd.concat(results, names=["Channel", None]).reset_index(level=0).reset_index(drop=True)
+        )
+
     # Peak detection settings
     if ecg_prt_clustering:
         distance = 1
@@ -76,84 +225,923 @@ def analyze(
         distance = int((distance_threshold / 1000) * signal.sample_rate)
         prominence = amplitude_threshold
 
-    # Windowing function
-    results = []
-    for sample_start in range(
-        0, len(signal.data), (window_width - window_overlap) * signal.sample_rate
-    ):
-        timestamp = sample_start / signal.sample_rate
+    detect: Callable[[], Any]
+    build: Callable[[Any], pd.DataFrame]
+    if engine != "loop":
+        detect = functools.partial(
+            _detect_vectorized if engine == "vectorized" else _detect_sliding,
+            signal,
+            window_width,
+            window_overlap,
+            distance,
+            prominence,
+            n_required_peaks,
+            peak_refinement,
+        )
+        build = functools.partial(
+            _vectorized_frame,
+            signal,
+            window_width,
+            n_required_peaks,
+            outlier_detection_settings,
+            window_output,
+            extended_frequency_domain,
+        )
+    else:
+        detect = functools.partial(
+            _detect_loop,
+            signal,
+            window_width,
+            window_overlap,
+            distance,
+            prominence,
+            n_required_peaks,
+            peak_refinement,
+            clustering_settings if ecg_prt_clustering else None,
+            n_workers,
+            executor,
+            # Cached windows are normalized again on demand
+            window_output == "full" and cache is None,
+        )
+        build = functools.partial(
+            _loop_frame,
+            signal,
+            window_width,
+            window_overlap,
+            n_required_peaks,
+            outlier_detection_settings,
+            window_output,
+            extended_frequency_domain,
+        )
 
-        segment = signal.data[sample_start : sample_start + (window_width * signal.sample_rate)]
-        normalized = sklearn.preprocessing.minmax_scale(segment, (0, 100))
-        peaks, properties = peak_detection(normalized, distance, prominence, ecg_prt_clustering)
-        window_data = (normalized, peaks, properties)
+    with profiling.stage("analyze", len(signal.data)):
+        if cache is None:
+            return build(detect())
 
-        ibi = np.diff(peaks) * 1000 / signal.sample_rate
-        sd = np.diff(ibi)
+        # Peaks and metrics do not depend on outlier detection settings
+        peaks_key = (
+            caching.signal_fingerprint(signal),
+            engine,
+            window_width,
+            window_overlap,
+            distance,
+            prominence,
+            n_required_peaks,
+            peak_refinement,
+            clustering_settings if ecg_prt_clustering else None,
+        )
 
-        if len(peaks) <= n_required_peaks:
-            results.append([timestamp, *[np.nan] * len(DATA_COLUMNS), True, window_data])
-        else:
-            # Time-domain metrics
-            bpm = ((len(peaks) - 1) / ((peaks[-1] - peaks[0]) / signal.sample_rate)) * 60
-            rmssd = np.sqrt(np.mean(np.square(sd)))
-            sdnn = np.std(ibi)
-            sdsd = np.std(sd)  # Standard deviation of successive differences
-            p_nn20 = np.sum(sd > 20) / len(sd)  # Proportion of successive differences > 20ms
-            p_nn50 = np.sum(sd > 50) / len(sd)  # Proportion of successive differences > 50ms
-
-            # Frequency-domain metrics
-            hf = frequency_domain(x=ibi, sfreq=signal.sample_rate)
-
-            is_outlier = outlier_detection(
-                peaks,
-                properties,
-                ibi,
-                signal.sample_rate,
+        def analyze_cached() -> pd.DataFrame:
+            return build(cache.get_or_compute("peaks", peaks_key, detect))
+
+        if window_output != "none":  # Windows hold or reference the signal
+            return analyze_cached()
+        return cache.get_or_compute(
+            "results",
+            (peaks_key, outlier_detection_settings, extended_frequency_domain),
+            analyze_cached,
+        )
+
+
+def _detect_loop(
+    signal: Signal,
+    window_width: int,
+    window_overlap: int,
+    distance: int,
+    prominence: int,
+    n_required_peaks: int,
+    peak_refinement: str,
+    clustering_settings: Optional[ClusteringSettings],
+    n_workers: int,
+    executor: str,
+    keep_normalized: bool,
+) -> list[tuple]:
+    """Peaks and metrics of every window for the "loop" engine, see :func:`_analyze_windows`."""
+    classifier = None
+    if clustering_settings is not None:
+        classifier = clustering.WaveClassifier(clustering_settings)
+        if clustering_settings.mode == "recording":
+            _fit_classifier(
+                classifier,
+                signal,
                 window_width,
-                bpm,
-                rmssd,
-                outlier_detection_settings,
+                window_overlap,
+                clustering_settings.calibration_duration,
             )
 
-            results.append(
-                [timestamp, bpm, rmssd, sdnn, sdsd, p_nn20, p_nn50, hf, is_outlier, window_data]
+    starts = _window_starts(signal, window_width, window_overlap)
+    settings = (
+        signal.sample_rate,
+        window_width,
+        distance,
+        prominence,
+        clustering_settings is not None,
+        n_required_peaks,
+        peak_refinement,
+        keep_normalized,
+    )
+    if n_workers == 1:
+        return _analyze_windows(signal.data, starts, settings, classifier)
+    return _analyze_sharded(
+        signal.data, starts, settings, clustering_settings, n_workers, executor
+    )
+
+
+def _loop_frame(
+    signal: Signal,
+    window_width: int,
+    window_overlap: int,
+    n_required_peaks: int,
+    outlier_detection_settings: OutlierDetectionSettings,
+    window_output: str,
+    extended_frequency_domain: bool,
+    windows: list[tuple],
+) -> pd.DataFrame:
+    """Detects outliers among `windows` from :func:`_detect_loop` and returns the results."""
+    results: list = []
+    extended: list = []
+    for sample_start, (metrics, powers, normalized, peaks, properties, ibi) in zip(
+        _window_starts(signal, window_width, window_overlap), windows
+    ):
+        timestamp = sample_start / signal.sample_rate
+        criterion = _window_criterion(
+            metrics,
+            peaks,
+            properties,
+            ibi,
+            signal.sample_rate,
+            window_width,
+            n_required_peaks,
+            outlier_detection_settings,
+        )
+
+        window_data: Union[tuple, LazyWindow, None]
+        sample_end = min(sample_start + window_width * signal.sample_rate, len(signal.data))
+        if window_output == "full":
+            if normalized is None:
+                normalized = windowing.minmax_scale(signal.data[sample_start:sample_end])
+            window_data = (normalized, peaks, properties)
+        elif window_output == "lazy":
+            window_data = LazyWindow(signal.data, sample_start, sample_end, peaks, properties)
+        else:
+            window_data = None
+
+        results.append([timestamp, *metrics, criterion is not None, criterion, window_data])
+        extended.append([powers[column] for column in EXTENDED_FREQUENCY_COLUMNS])
+
+    return _results_frame(results, window_output, extended if extended_frequency_domain else None)
+
+
+def _window_starts(signal: Signal, window_width: int, window_overlap: int) -> range:
+    return range(0, len(signal.data), (window_width - window_overlap) * signal.sample_rate)
+
+
+def _analyze_windows(
+    data, starts: Sequence[int], settings: tuple, classifier: Optional[clustering.WaveClassifier]
+) -> list[tuple]:
+    """Analyzes the windows of `data` starting at `starts`.
+
+    Returns
+    -------
+    list of (metrics, powers, normalized, peaks, properties, ibi)
+        Output of :func:`_window_metrics` for every window,
+        where `normalized` is None unless the last of `settings` is set.
+    """
+    (
+        sample_rate,
+        window_width,
+        distance,
+        prominence,
+        use_clustering,
+        n_required_peaks,
+        peak_refinement,
+        keep_normalized,
+    ) = settings
+
+    windows = []
+    for start in starts:
+        metrics, powers, (normalized, peaks, properties), ibi = _window_metrics(
+            data[start : start + window_width * sample_rate],
+            sample_rate,
+            distance,
+            prominence,
+            use_clustering,
+            n_required_peaks,
+            classifier,
+            peak_refinement,
+        )
+        windows.append(
+            (metrics, powers, normalized if keep_normalized else None, peaks, properties, ibi)
+        )
+    return windows
+
+
+def _analyze_sharded(
+    data,
+    starts: Sequence[int],
+    settings: tuple,
+    clustering_settings: Optional[ClusteringSettings],
+    n_workers: int,
+    executor: str,
+) -> list[tuple]:
+    """Runs :func:`_analyze_windows` over contiguous shards of `starts` in parallel."""
+    # Several shards per worker balance their load
+    n_shards = min(len(starts), 4 * n_workers)
+    bounds = np.linspace(0, len(starts), n_shards + 1).astype(int)
+    shards = [starts[first:last] for first, last in zip(bounds[:-1], bounds[1:])]
+
+    if executor == "thread":
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(
+                    _analyze_windows,
+                    data,
+                    shard,
+                    settings,
+                    (
+                        None
+                        if clustering_settings is None
+                        else clustering.WaveClassifier(clustering_settings)
+                    ),
+                )
+                for shard in shards
+            ]
+            return [window for future in futures for window in future.result()]
+
+    data = np.asarray(data)
+    memory = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    try:
+        np.ndarray(data.shape, data.dtype, buffer=memory.buf)[:] = data
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(
+                    _analyze_shared_windows,
+                    memory.name,
+                    data.shape,
+                    data.dtype,
+                    shard,
+                    settings,
+                    clustering_settings,
+                )
+                for shard in shards
+            ]
+            return [window for future in futures for window in future.result()]
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def _analyze_shared_windows(
+    name: str,
+    shape: tuple,
+    dtype: np.dtype,
+    starts: Sequence[int],
+    settings: tuple,
+    clustering_settings: Optional[ClusteringSettings],
+) -> list[tuple]:
+    """Runs :func:`_analyze_windows` in a worker process, on data in shared memory `name`."""
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        classifier = (
+            None if clustering_settings is None else clustering.WaveClassifier(clustering_settings)
+        )
+        return _analyze_windows(
+            np.ndarray(shape, dtype, buffer=memory.buf), starts, settings, classifier
+        )
+    finally:
+        memory.close()
+
+
+def _analyze_window(
+    segment: np.ndarray,
+    sample_rate: int,
+    window_width: int,
+    distance: int,
+    prominence: int,
+    use_clustering: bool,
+    n_required_peaks: int,
+    outlier_detection_settings: OutlierDetectionSettings,
+    classifier: Optional[clustering.WaveClassifier] = None,
+    peak_refinement: str = "none",
+) -> tuple[list, Optional[str], dict, tuple[np.ndarray, np.ndarray, dict]]:
+    """Analyzes a single window of a signal.
+
+    Returns
+    -------
+    (metrics, criterion, powers, (normalized, peaks, properties))
+        Values of `DATA_COLUMNS`, the outlier criterion (None for valid windows),
+        the output of `frequency_domain_powers`,
+        and the normalized window with its detected peaks and their properties.
+    """
+    metrics, powers, window_data, ibi = _window_metrics(
+        segment,
+        sample_rate,
+        distance,
+        prominence,
+        use_clustering,
+        n_required_peaks,
+        classifier,
+        peak_refinement,
+    )
+    criterion = _window_criterion(
+        metrics,
+        window_data[1],
+        window_data[2],
+        ibi,
+        sample_rate,
+        window_width,
+        n_required_peaks,
+        outlier_detection_settings,
+    )
+    return metrics, criterion, powers, window_data
+
+
+def _window_metrics(
+    segment: np.ndarray,
+    sample_rate: int,
+    distance: int,
+    prominence: int,
+    use_clustering: bool,
+    n_required_peaks: int,
+    classifier: Optional[clustering.WaveClassifier],
+    peak_refinement: str,
+) -> tuple[list, dict, tuple[np.ndarray, np.ndarray, dict], np.ndarray]:
+    """Detects the peaks of a single window and computes its metrics, as :func:`_analyze_window`.
+
+    Returns
+    -------
+    (metrics, powers, (normalized, peaks, properties), ibi)
+        As :func:`_analyze_window`, without the outlier criterion, and the interbeat intervals.
+    """
+    normalized = windowing.minmax_scale(segment)
+    with profiling.stage("peak_detection", len(segment)):
+        peaks, properties = peak_detection(
+            normalized, distance, prominence, use_clustering, classifier
+        )
+    metrics, powers, ibi = _peak_metrics(
+        normalized, peaks, sample_rate, n_required_peaks, peak_refinement
+    )
+    return metrics, powers, (normalized, peaks, properties), ibi
+
+
+def _peak_metrics(
+    normalized: np.ndarray,
+    peaks: np.ndarray,
+    sample_rate: int,
+    n_required_peaks: int,
+    peak_refinement: str,
+) -> tuple[list, dict, np.ndarray]:
+    """Metrics of a window with `peaks`, as :func:`_window_metrics`.
+
+    Returns
+    -------
+    (metrics, powers, ibi)
+        Values of `DATA_COLUMNS`, the output of `frequency_domain_powers`
+        and the interbeat intervals.
+    """
+    positions = refine_peaks(normalized, peaks) if peak_refinement == "parabolic" else peaks
+    ibi = np.diff(positions) * 1000 / sample_rate
+    sd = np.diff(ibi)
+
+    if len(peaks) <= n_required_peaks:
+        nan_powers = {band: np.nan for band in [*FREQUENCY_BANDS, "LF/HF"]}
+        return [np.nan] * len(DATA_COLUMNS), nan_powers, ibi
+
+    # Time-domain metrics
+    bpm = ((len(peaks) - 1) / ((positions[-1] - positions[0]) / sample_rate)) * 60
+    rmssd = np.sqrt(np.mean(np.square(sd)))
+    sdnn = np.std(ibi)
+    sdsd = np.std(sd)  # Standard deviation of successive differences
+    p_nn20 = np.sum(sd > 20) / len(sd)  # Proportion of successive differences > 20ms
+    p_nn50 = np.sum(sd > 50) / len(sd)  # Proportion of successive differences > 50ms
+
+    # Frequency-domain metrics
+    with profiling.stage("frequency_domain", len(ibi)):
+        powers = frequency_domain_powers(x=ibi, sfreq=sample_rate)
+
+    metrics = [bpm, rmssd, sdnn, sdsd, p_nn20, p_nn50, powers["HF"]]
+    return metrics, powers, ibi
+
+
+def _window_criterion(
+    metrics: list,
+    peaks: np.ndarray,
+    properties: dict,
+    ibi: np.ndarray,
+    sample_rate: int,
+    window_width: int,
+    n_required_peaks: int,
+    outlier_detection_settings: OutlierDetectionSettings,
+) -> Optional[str]:
+    """Outlier criterion of a window analyzed by :func:`_window_metrics`."""
+    if len(peaks) <= n_required_peaks:
+        return "n_peaks"
+    bpm, rmssd = metrics[:2]
+    with profiling.stage("outlier_detection", len(peaks)):
+        return outlier_criterion(
+            peaks,
+            properties,
+            ibi,
+            sample_rate,
+            window_width,
+            bpm,
+            rmssd,
+            outlier_detection_settings,
+        )
+
+
+def _fit_classifier(
+    classifier: clustering.WaveClassifier,
+    signal: Signal,
+    window_width: int,
+    window_overlap: int,
+    calibration_duration: Optional[float],
+) -> None:
+    """Fits P, R and T wave clusters to the peaks of windows within `calibration_duration`."""
+    starts, ends = windowing.window_bounds(
+        len(signal.data), signal.sample_rate, window_width, window_overlap
+    )
+    if calibration_duration is not None:
+        n_windows = max(1, np.count_nonzero(ends <= calibration_duration * signal.sample_rate))
+        starts, ends = starts[:n_windows], ends[:n_windows]
+
+    features = []
+    for start, end in zip(starts, ends):
+        normalized = windowing.minmax_scale(signal.data[start:end])
+        _, properties = scipy.signal.find_peaks(
+            normalized, distance=1, prominence=5, height=0, width=0
+        )
+        features.append(clustering.peak_features(properties))
+
+    features = np.concatenate(features)
+    if len(features) >= clustering.N_WAVES:
+        classifier.fit(features)
+
+
+def _results_frame(results: list, window_output: str, extended=None) -> pd.DataFrame:
+    frame = pd.DataFrame(results, columns=DATAFRAME_COLUMNS)
+    if extended is not None:
+        position = frame.columns.get_loc("HF") + 1
+        for i, column in enumerate(EXTENDED_FREQUENCY_COLUMNS):
+            frame.insert(position + i, column, np.asarray(extended, dtype=float)[:, i])
+    return frame.drop(columns="Window") if window_output == "none" else frame
+
+
+@dataclasses.dataclass
+class LazyWindow:
+    """Analysis window which normalizes its segment of the signal on demand.
+
+    Unpacks like the tuple held by the "Window" column in "full" output mode:
+
+    >>> normalized, peaks, properties = window
+
+    Attributes
+    ----------
+    data:
+        Data of the entire analyzed signal.
+    start:
+        First sample of the window.
+    end:
+        End sample (exclusive) of the window.
+    peaks:
+        Indexes of peaks, relative to `start`.
+    properties:
+        Peak properties, as returned by `peak_detection`.
+    """
+
+    data: np.ndarray = dataclasses.field(repr=False)
+    start: int
+    end: int
+    peaks: np.ndarray
+    properties: dict
+
+    def normalized(self) -> np.ndarray:
+        """Window segment scaled to the range 0-100."""
+        return windowing.minmax_scale(self.data[self.start : self.end])
+
+    def __iter__(self):
+        return iter((self.normalized(), self.peaks, self.properties))
+
+
+def _detect_vectorized(
+    signal: Signal,
+    window_width: int,
+    window_overlap: int,
+    distance: int,
+    prominence: int,
+    n_required_peaks: int,
+    peak_refinement: str,
+) -> dict[str, Any]:
+    """Batched counterpart of :func:`_detect_loop`, see the `engine` parameter of `analyze`.
+
+    Returns
+    -------
+    dict
+        Window bounds and normalization, and peaks, peak properties, interbeat intervals
+        and metrics of all windows in the ragged layout of :mod:`rapidhrv.windowing`.
+    """
+    # Channels are analyzed together, as a single signal of consecutive channels
+    # whose windows do not cross from one channel into the next
+    channels = np.atleast_2d(np.asarray(signal.data))
+    data = channels.reshape(-1)
+    starts, ends = windowing.window_bounds(
+        signal.n_samples, signal.sample_rate, window_width, window_overlap
+    )
+    channel_starts = np.arange(len(channels))[:, None] * signal.n_samples
+    starts, ends = (channel_starts + starts).ravel(), (channel_starts + ends).ravel()
+    n_windows = len(starts)
+    minima, maxima = windowing.window_extrema(data, starts, ends)
+    ranges = maxima - minima
+    scales = 100 / np.where(
+        ranges == 0, 1, ranges
+    )  # As `windowing.minmax_scale` for constant windows
+
+    # Candidate peaks over every channel, then the per-window (normalized) prominence criterion
+    with profiling.stage("peak_detection", len(data)):
+        detected = []
+        for channel_start, channel in zip(channel_starts.ravel(), channels):
+            channel_candidates, _ = scipy.signal.find_peaks(channel, distance=distance)
+            channel_prominences, channel_left, channel_right = scipy.signal.peak_prominences(
+                channel, channel_candidates, wlen=2 * window_width * signal.sample_rate + 1
+            )
+            detected.append(
+                (
+                    channel_candidates + channel_start,
+                    channel_prominences,
+                    channel_left + channel_start,
+                    channel_right + channel_start,
+                )
             )
+        candidates, candidate_prominences, left_bases, right_bases = (
+            np.concatenate(arrays) for arrays in zip(*detected)
+        )
+        indexes, window_ids, prominences = _window_peaks(
+            data,
+            candidates,
+            candidate_prominences,
+            left_bases,
+            right_bases,
+            starts,
+            ends,
+            scales,
+            prominence,
+        )
 
-    return pd.DataFrame(
-        results,
-        columns=DATAFRAME_COLUMNS,
+    peaks = candidates[indexes]
+    heights = (data[peaks] - minima[window_ids]) * scales[window_ids]
+    offsets = windowing.ragged_offsets(window_ids, n_windows)
+    counts = np.diff(offsets)
+
+    # Time-domain metrics for all windows at once
+    # Parabolic refinement is invariant to the normalization of windows, so applies to `data`
+    positions = refine_peaks(data, peaks) if peak_refinement == "parabolic" else peaks
+    ibi, ibi_ids, time_domain = _ragged_time_domain(
+        positions, window_ids, n_windows, signal.sample_rate
     )
 
+    # Frequency-domain metrics
+    ibi_offsets = windowing.ragged_offsets(ibi_ids, n_windows)
+    with profiling.stage("frequency_domain", len(ibi)):
+        powers = frequency_domain_batch(ibi, ibi_offsets, signal.sample_rate)
+    powers[counts <= n_required_peaks] = np.nan
 
-def peak_detection(
-    segment: np.ndarray, distance: int, prominence: int, use_clustering: bool
-) -> tuple[np.ndarray, dict]:
-    """Returns the indexes of detected peaks and associated properties."""
-    peaks, properties = scipy.signal.find_peaks(
-        segment, distance=distance, prominence=prominence, height=0, width=0
+    _approximate_ragged_edge_prominences(heights, prominences, offsets)
+    return {
+        "starts": starts,
+        "ends": ends,
+        "minima": minima,
+        "scales": scales,
+        "peaks": peaks,
+        "heights": heights,
+        "prominences": prominences,
+        "offsets": offsets,
+        "ibi": ibi,
+        "metrics": np.column_stack((*time_domain, powers["HF"].to_numpy())),
+        "powers": powers,
+    }
+
+
+def _window_peaks(
+    data: np.ndarray,
+    candidates: np.ndarray,
+    candidate_prominences: np.ndarray,
+    left_bases: np.ndarray,
+    right_bases: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    scales: np.ndarray,
+    prominence: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Assigns candidate peaks to windows, keeping those of sufficient prominence in each.
+
+    Prominences are restricted to every window and normalized by its `scales`,
+    as :func:`peak_detection` evaluates them on the normalized window.
+
+    Returns
+    -------
+    (indexes, window_ids, prominences)
+        Index into `candidates`, window and normalized prominence of every peak of every window.
+    """
+    indexes, window_ids = windowing.assign_to_windows(candidates, starts, ends)
+    prominences = windowing.clip_prominences(
+        data,
+        candidates[indexes],
+        candidate_prominences[indexes],
+        left_bases[indexes],
+        right_bases[indexes],
+        starts[window_ids],
+        ends[window_ids],
     )
+    prominences *= scales[window_ids]
+    is_peak = prominences >= prominence
+    return indexes[is_peak], window_ids[is_peak], prominences[is_peak]
 
-    # Attempt to determine correct peaks by distinguishing the R wave from P and T waves
-    if len(peaks) >= 3 and use_clustering:
-        k_means = sklearn.cluster.KMeans(n_clusters=3).fit(
-            np.column_stack(
-                (properties["widths"], properties["peak_heights"], properties["prominences"])
+
+def _ragged_time_domain(
+    positions: np.ndarray, window_ids: np.ndarray, n_windows: int, sample_rate: int
+) -> tuple[np.ndarray, np.ndarray, list]:
+    """Interbeat intervals and time-domain metrics of peaks at `positions` of every window.
+
+    Returns
+    -------
+    (ibi, ibi_ids, metrics)
+        Interbeat intervals of all windows and their window,
+        and every metric of `DATA_COLUMNS` but "HF" for every window.
+    """
+    ibi, ibi_ids = windowing.ragged_diff(positions * 1000 / sample_rate, window_ids)
+    sd, sd_ids = windowing.ragged_diff(ibi, ibi_ids)
+    bpm = 60000 / windowing.ragged_mean(ibi, ibi_ids, n_windows)
+    rmssd = np.sqrt(windowing.ragged_mean(np.square(sd), sd_ids, n_windows))
+    sdnn = windowing.ragged_std(ibi, ibi_ids, n_windows)
+    sdsd = windowing.ragged_std(sd, sd_ids, n_windows)
+    p_nn20 = windowing.ragged_mean((sd > 20).astype(float), sd_ids, n_windows)
+    p_nn50 = windowing.ragged_mean((sd > 50).astype(float), sd_ids, n_windows)
+    return ibi, ibi_ids, [bpm, rmssd, sdnn, sdsd, p_nn20, p_nn50]
+
+
+def _approximate_ragged_edge_prominences(
+    heights: np.ndarray, prominences: np.ndarray, offsets: np.ndarray
+) -> None:
+    """Approximates the prominences of the first and last peak of every window in place,
+    as :func:`_approximate_edge_prominences` for a single window.
+    """
+    edged = np.flatnonzero(np.diff(offsets) > 3)
+    first, last = offsets[edged], offsets[edged + 1] - 1
+    base_heights = heights - prominences
+    prominences[first] = heights[first] - base_heights[first + 1]
+    prominences[last] = heights[last] - base_heights[last - 1]
+
+
+def _detect_sliding(
+    signal: Signal,
+    window_width: int,
+    window_overlap: int,
+    distance: int,
+    prominence: int,
+    n_required_peaks: int,
+    peak_refinement: str,
+) -> dict[str, Any]:
+    """Counterpart of :func:`_detect_vectorized` computing metrics from running sums,
+    see the `engine` parameter of `analyze`.
+    """
+    data = np.asarray(signal.data)
+    starts, ends = windowing.window_bounds(
+        len(data), signal.sample_rate, window_width, window_overlap
+    )
+    n_windows = len(starts)
+    width = window_width * signal.sample_rate
+
+    # The same peaks as the vectorized engine, with window extrema in linear time
+    with profiling.stage("peak_detection", len(data)):
+        lowest, highest = windowing.sliding_extrema(data, width)
+        minima, maxima = lowest[starts], highest[starts]
+        ranges = maxima - minima
+        scales = 100 / np.where(ranges == 0, 1, ranges)
+
+        candidates, _ = scipy.signal.find_peaks(data, distance=distance)
+        candidate_prominences, left_bases, right_bases = scipy.signal.peak_prominences(
+            data, candidates, wlen=2 * width + 1
+        )
+        indexes, window_ids, prominences = _window_peaks(
+            data,
+            candidates,
+            candidate_prominences,
+            left_bases,
+            right_bases,
+            starts,
+            ends,
+            scales,
+            prominence,
+        )
+
+    peaks = candidates[indexes]
+    heights = (data[peaks] - minima[window_ids]) * scales[window_ids]
+    offsets = windowing.ragged_offsets(window_ids, n_windows)
+    counts = np.diff(offsets)
+
+    # Peaks accepted by any window, of which window `i` holds those of the run `first[i]:last[i]`
+    # but for any its prominence criterion rejects, such as close to its edges
+    accepted, runs = np.unique(indexes, return_inverse=True)
+    first, last = np.zeros(n_windows, dtype=np.int64), np.zeros(n_windows, dtype=np.int64)
+    nonempty = np.flatnonzero(counts)
+    first[nonempty] = runs[offsets[nonempty]]
+    last[nonempty] = runs[offsets[nonempty + 1] - 1] + 1
+    irregular = np.flatnonzero(last - first > counts)
+
+    # Windows missing peaks hold the intervals of their run, but for a region from two peaks
+    # before their first missing peak to two after their last, `local_start:local_end`
+    gaps = np.flatnonzero((np.diff(runs) > 1) & (window_ids[1:] == window_ids[:-1]))
+    _, first_gaps = np.unique(window_ids[gaps], return_index=True)
+    _, last_gaps = np.unique(window_ids[gaps[::-1]], return_index=True)
+    local_start, local_end = last.copy(), last.copy()
+    local_start[irregular] = np.maximum(first[irregular], runs[gaps[first_gaps]] - 1)
+    local_end[irregular] = np.minimum(last[irregular], runs[gaps[::-1][last_gaps] + 1] + 2)
+
+    # Time-domain metrics from running sums over the intervals of all accepted peaks,
+    # where window `i` holds intervals `first[i]:last[i] - 1` and differences to `last[i] - 2`,
+    # corrected by the intervals of its peaks within its region
+    candidate_positions = candidates[accepted]
+    if peak_refinement == "parabolic":
+        candidate_positions = refine_peaks(data, candidate_positions)
+    all_ibi = np.diff(candidate_positions * 1000 / signal.sample_rate)
+    all_sd = np.diff(all_ibi)
+    local_pairs, local_ids = windowing.ragged_ranges(
+        offsets[irregular] + local_start[irregular] - first[irregular],
+        offsets[irregular + 1] - last[irregular] + local_end[irregular],
+    )
+    local_ibi, local_ibi_ids = windowing.ragged_diff(
+        candidate_positions[runs[local_pairs]] * 1000 / signal.sample_rate, local_ids
+    )
+    local_sd, local_sd_ids = windowing.ragged_diff(local_ibi, local_ibi_ids)
+    n_ibi, n_sd = np.maximum(counts - 1, 0), np.maximum(counts - 2, 0)
+
+    def mean(values, local_values, local_ids, trim, n):
+        values, local_values = values.astype(float), local_values.astype(float)
+        sums = windowing.range_sums(values, first, np.minimum(local_start, last - trim))
+        sums += windowing.range_sums(values, local_end - trim, last - trim)
+        sums[irregular] += np.bincount(local_ids, local_values, minlength=len(irregular))
+        return sums / n
+
+    def std(values, local_values, local_ids, trim, n):
+        # Centered by the overall mean, as running sums of squares lose precision otherwise
+        center = values.mean() if len(values) else 0
+        values, local_values = values - center, local_values - center
+        variance = mean(np.square(values), np.square(local_values), local_ids, trim, n)
+        variance -= np.square(mean(values, local_values, local_ids, trim, n))
+        return np.sqrt(np.maximum(variance, 0))
+
+    ibi_values, sd_values = (all_ibi, local_ibi, local_ibi_ids), (all_sd, local_sd, local_sd_ids)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        time_domain = np.column_stack(
+            (
+                60000 / mean(*ibi_values, 1, n_ibi),
+                np.sqrt(mean(all_sd**2, local_sd**2, local_sd_ids, 2, n_sd)),
+                std(*ibi_values, 1, n_ibi),
+                std(*sd_values, 2, n_sd),
+                mean(all_sd > 20, local_sd > 20, local_sd_ids, 2, n_sd),
+                mean(all_sd > 50, local_sd > 50, local_sd_ids, 2, n_sd),
             )
         )
 
-        # Use width centroids to determine correct wave (least width, most prominence)
-        # If the two lowest values are too close (< 5), use prominence to distinguish them
-        width_cen = k_means.cluster_centers_[:, 0]
-        labels_sort_width = np.argsort(width_cen)
-        if width_cen[labels_sort_width[1]] - width_cen[labels_sort_width[0]] < 5:
-            # Label of maximum prominence for lowest two widths
-            prom_cen = k_means.cluster_centers_[:, 2]
-            wave_label = np.argsort(prom_cen[labels_sort_width[:2]])[1]
+    # Windows missing peaks are interpolated separately, below
+    ibi_end = np.where(last - first > counts, first, first + n_ibi)
+    with profiling.stage("frequency_domain", len(all_ibi)):
+        powers = frequency_domain_sliding(all_ibi, first, ibi_end, signal.sample_rate)
+
+    # Intervals of every window, for outlier detection and the spectra of windows missing peaks
+    ibi, ibi_ids = windowing.ragged_diff(
+        candidate_positions[runs] * 1000 / signal.sample_rate, window_ids
+    )
+    if len(irregular):
+        irregular_ids = np.full(n_windows, -1)
+        irregular_ids[irregular] = np.arange(len(irregular))
+        is_irregular = irregular_ids[ibi_ids] >= 0
+        irregular_offsets = windowing.ragged_offsets(
+            irregular_ids[ibi_ids[is_irregular]], len(irregular)
+        )
+        with profiling.stage("frequency_domain", int(is_irregular.sum())):
+            irregular_powers = frequency_domain_batch(
+                ibi[is_irregular], irregular_offsets, signal.sample_rate
+            )
+        powers.iloc[irregular] = irregular_powers.to_numpy()
+    powers[counts <= n_required_peaks] = np.nan
+
+    _approximate_ragged_edge_prominences(heights, prominences, offsets)
+    return {
+        "starts": starts,
+        "ends": ends,
+        "minima": minima,
+        "scales": scales,
+        "peaks": peaks,
+        "heights": heights,
+        "prominences": prominences,
+        "offsets": offsets,
+        "ibi": ibi,
+        "metrics": np.column_stack((time_domain, powers["HF"].to_numpy())),
+        "powers": powers,
+    }
+
+
+def _vectorized_frame(
+    signal: Signal,
+    window_width: int,
+    n_required_peaks: int,
+    outlier_detection_settings: OutlierDetectionSettings,
+    window_output: str,
+    extended_frequency_domain: bool,
+    detections: dict[str, Any],
+) -> pd.DataFrame:
+    """Detects outliers among `detections` from :func:`_detect_vectorized`
+    or :func:`_detect_sliding` and returns results.
+    """
+    data = np.asarray(signal.data).reshape(-1)  # Consecutive channels, see `_detect_vectorized`
+    starts, ends, minima, scales = (detections[k] for k in ("starts", "ends", "minima", "scales"))
+    peaks, heights, prominences = (detections[k] for k in ("peaks", "heights", "prominences"))
+    offsets, metrics, powers = detections["offsets"], detections["metrics"], detections["powers"]
+    counts = np.diff(offsets)
+
+    with profiling.stage("outlier_detection", len(peaks)):
+        is_outlier, criteria = outlier_detection_batch(
+            peaks,
+            {"peak_heights": heights, "prominences": prominences},
+            detections["ibi"],
+            offsets,
+            signal.sample_rate,
+            window_width,
+            metrics[:, 0],
+            metrics[:, 1],
+            outlier_detection_settings,
+        )
+    criteria[counts <= n_required_peaks] = "n_peaks"
+    is_outlier[counts <= n_required_peaks] = True
+
+    results = []
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        window_peaks = peaks[offsets[i] : offsets[i + 1]]
+        properties = {
+            "peak_heights": heights[offsets[i] : offsets[i + 1]],
+            "prominences": prominences[offsets[i] : offsets[i + 1]],
+        }
+
+        window_data: Union[tuple, LazyWindow, None]
+        if window_output == "full":
+            normalized = (data[start:end] - minima[i]) * scales[i]
+            window_data = (normalized, window_peaks - start, properties)
+        elif window_output == "lazy":
+            window_data = LazyWindow(data, start, end, window_peaks - start, properties)
         else:
-            wave_label = labels_sort_width[0]
+            window_data = None
+        timestamp = start % signal.n_samples / signal.sample_rate
+
+        if counts[i] <= n_required_peaks:
+            results.append(
+                [timestamp, *[np.nan] * len(DATA_COLUMNS), True, "n_peaks", window_data]
+            )
+            continue
+
+        results.append([timestamp, *metrics[i], is_outlier[i], criteria[i], window_data])
+
+    extended = powers[EXTENDED_FREQUENCY_COLUMNS] if extended_frequency_domain else None
+    frame = _results_frame(results, window_output, extended)
+    if signal.data.ndim > 1:
+        keys = signal.channel_names or range(signal.n_channels)
+        n_windows = len(frame) // len(keys)
+        frame.insert(0, "Channel", [key for key in keys for _ in range(n_windows)])
+    return frame
+
 
-        is_wave_peak = k_means.labels_ == wave_label
+def peak_detection(
+    segment: np.ndarray,
+    distance: int,
+    prominence: int,
+    use_clustering: bool,
+    classifier: Optional[clustering.WaveClassifier] = None,
+    widths: bool = False,
+) -> tuple[np.ndarray, dict]:
+    """Returns the indexes of detected peaks and associated properties.
+
+    With `use_clustering`, R wave peaks are selected by `classifier`,
+    by default fitting clusters to the peaks of `segment`.
+
+    Properties always hold "peak_heights" and "prominences", with the bases of the latter.
+    The widths of peaks ("widths", "width_heights", "left_ips" and "right_ips"),
+    which take `find_peaks` a large part of its time to compute,
+    are only computed with `widths` or `use_clustering`, whose features include them.
+    """
+    peaks, properties = scipy.signal.find_peaks(
+        segment,
+        distance=distance,
+        prominence=prominence,
+        height=0,
+        width=0 if widths or use_clustering else None,
+    )
+
+    # Attempt to determine correct peaks by distinguishing the R wave from P and T waves
+    if len(peaks) > 0 and use_clustering:
+        if classifier is None:
+            classifier = clustering.WaveClassifier(ClusteringSettings())
+        with profiling.stage("clustering", len(peaks)):
+            is_wave_peak = classifier.select(properties)
 
         wave_peaks = peaks[is_wave_peak]
         wave_props = {k: v[is_wave_peak] for k, v in properties.items()}
@@ -161,21 +1149,42 @@ def peak_detection(
         wave_peaks = peaks
         wave_props = properties
 
+    _approximate_edge_prominences(segment, wave_peaks, wave_props)
+    return wave_peaks, wave_props
+
+
+def _approximate_edge_prominences(segment: np.ndarray, peaks: np.ndarray, properties: dict):
+    """Replaces the prominences of the first and last peak of a window in `properties`,
+    which the window truncates, by their heights above the bases of their neighbours.
+    """
     # @PeterKirk does this need to be > 3 or >= 3?
     # Also, should this potentially be done before clustering?
-    if len(wave_peaks) > 3:
-        # Approximate prominences at edges of window
-        base_height = segment[wave_peaks] - wave_props["prominences"]
-        wave_props["prominences"][0] = wave_props["peak_heights"][0] - base_height[1]
-        wave_props["prominences"][-1] = wave_props["peak_heights"][-1] - base_height[-2]
+    if len(peaks) > 3:
+        base_height = segment[peaks] - properties["prominences"]
+        properties["prominences"][0] = properties["peak_heights"][0] - base_height[1]
+        properties["prominences"][-1] = properties["peak_heights"][-1] - base_height[-2]
 
-    return wave_peaks, wave_props
+
+def refine_peaks(data: np.ndarray, peaks: np.ndarray) -> np.ndarray:
+    """Locates peaks between samples by parabolic interpolation.
+
+    Fits a parabola through every peak and its neighbouring samples,
+    returning the (fractional) sample positions of their vertices.
+    Peaks at either end of `data` and without curvature are returned unchanged.
+    """
+    positions = peaks.astype(float)
+    inner = np.flatnonzero((peaks > 0) & (peaks < len(data) - 1))
+    left, center, right = data[peaks[inner] - 1], data[peaks[inner]], data[peaks[inner] + 1]
+    curvature = left - 2 * center + right
+    curved = curvature < 0
+    positions[inner[curved]] += 0.5 * (left - right)[curved] / curvature[curved]
+    return positions
 
 
 def frequency_domain(x, sfreq: int = 5):
     """This function and docstring was modified from Systole
     (https://github.com/embodied-computation-group/systole)
-    Extracts the frequency domain features of heart rate variability.
+    Extracts the high frequency power of heart rate variability.
     Parameters
     ----------
     x : np.ndarray or list
@@ -184,59 +1193,367 @@ def frequency_domain(x, sfreq: int = 5):
         The sampling frequency (Hz).
     Returns
     -------
-    stats : :py:class:`pandas.DataFrame`
-        Frequency domain summary statistics.
-        * ``'power_hf_per'`` : High frequency power (%).
-    Notes
-    -----
-    The dataframe containing the summary statistics is returned in the long
-    format to facilitate the creation of group summary data frame that can
-    easily be transferred to other plotting or statistics library. You can
-    easily convert it into a wide format for a subject-level inline report
-    using the py:pandas.pivot_table() function:
-    >>> pd.pivot_table(stats, values='Values', columns='Metric')
+    hf : float
+        High frequency power (ms**2), see :func:`frequency_domain_powers`.
+    """
+    return frequency_domain_powers(x, sfreq)["HF"]
+
+
+def frequency_domain_powers(x, sfreq: int = 5) -> dict[str, float]:
+    """Extracts the power of every band in `FREQUENCY_BANDS`, and the LF/HF ratio.
+
+    The interval series is interpolated with a cubic spline at `sfreq`,
+    and its power spectral density estimated with Welch's method,
+    using a single Hann window unless the series is longer than 256 seconds.
+    Band powers are NaN if the series holds less than four intervals,
+    or if no frequency of the estimate falls within the band.
+
+    Parameters
+    ----------
+    x : np.ndarray or list
+        Interval time-series (R-R, beat-to-beat...), in miliseconds.
+    sfreq : int
+        The sampling frequency (Hz).
+
+    Returns
+    -------
+    dict
+        Band power (ms**2) by band name, and the ratio of LF to HF power under "LF/HF".
     """
+    x = np.asarray(x, dtype=float)
     if len(x) < 4:  # RapidHRV edit: Can't run with less than 4 IBIs
-        return np.nan
+        return _band_ratios({band: np.nan for band in FREQUENCY_BANDS})
+
+    freq, psd = _power_spectral_density(_resample_intervals(x, sfreq), sfreq)
+    return _band_ratios(_band_powers(freq, psd))
+
+
+def frequency_domain_batch(x: np.ndarray, offsets: np.ndarray, sfreq: int = 5) -> pd.DataFrame:
+    """Batched form of :func:`frequency_domain_powers` for many interval series.
+
+    The interpolating splines of all series are fitted as a single tridiagonal system
+    and evaluated together, see :func:`_resample_intervals_batch`,
+    and their spectra estimated together, see :func:`_ragged_band_powers`.
+    Powers equal those of :func:`frequency_domain_powers` to within about 1e-12 (relative).
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Interval time-series of all windows (in miliseconds), concatenated.
+    offsets : np.ndarray
+        Ragged offsets, such that ``x[offsets[i]:offsets[i + 1]]`` is the series of window `i`.
+    sfreq : int
+        The sampling frequency (Hz).
+
+    Returns
+    -------
+    pd.DataFrame
+        Band powers and LF/HF ratio by window, in the columns of :func:`frequency_domain_powers`.
+    """
+    n_windows = len(offsets) - 1
+    powers = {band: np.full(n_windows, np.nan) for band in FREQUENCY_BANDS}
+    valid = np.flatnonzero(np.diff(offsets) >= 4)  # RapidHRV edit: at least 4 IBIs
+
+    # Windows are resampled in blocks of about `SPECTRAL_BLOCK_SIZE` samples, to bound memory
+    time = np.concatenate(([0], np.cumsum(x)))
+    n_samples = (time[offsets[valid + 1]] - time[offsets[valid]]) * sfreq / 1000
+    blocks = np.cumsum(n_samples) // SPECTRAL_BLOCK_SIZE
+    for block in np.split(valid, np.flatnonzero(np.diff(blocks)) + 1):
+        if len(block) == 0:
+            continue
+        indexes, _ = windowing.ragged_ranges(offsets[block], offsets[block + 1])
+        block_offsets = np.concatenate(([0], np.cumsum(offsets[block + 1] - offsets[block])))
+        resampled, sample_offsets = _resample_intervals_batch(x[indexes], block_offsets, sfreq)
+        for band, power in _ragged_band_powers(resampled, sample_offsets, sfreq).items():
+            powers[band][block] = power
+
+    return pd.DataFrame(_band_ratios(powers))
+
+
+def frequency_domain_sliding(
+    x: np.ndarray, first: np.ndarray, last: np.ndarray, sfreq: int = 5
+) -> pd.DataFrame:
+    """Form of :func:`frequency_domain_batch` for windows over a single interval series.
+
+    The series of window `i` is ``x[first[i]:last[i]]``.
+    Rather than interpolating the series of every window, `x` is interpolated once,
+    and the resampled series of every window is the part of it spanned by its intervals,
+    starting at the nearest sample.
+    Powers therefore differ from those of :func:`frequency_domain_batch`
+    close to the ends of windows, where its spline is fitted to the window alone.
+
+    Returns
+    -------
+    pd.DataFrame
+        Band powers and LF/HF ratio by window, in the columns of :func:`frequency_domain_powers`.
+    """
+    powers = {band: np.full(len(first), np.nan) for band in FREQUENCY_BANDS}
+    valid = np.flatnonzero(last - first >= 4)
+    if len(valid) == 0:
+        return pd.DataFrame(_band_ratios(powers))
+
+    time = np.cumsum(x)
+    step = 1000 / sfreq
+    # One sample beyond the last interval, reached by series starting at a later, nearest sample
+    n_samples = int(np.ceil((time[-1] - time[0]) / step)) + 1
+    b_spline = scipy.interpolate.make_interp_spline(time, x, k=3)
+    resampled = b_spline(time[0] + _resampling_grid(n_samples, step))
+    starts = np.round((time[first[valid]] - time[0]) / step).astype(np.int64)
+    lengths = np.ceil((time[last[valid] - 1] - time[first[valid]]) / step).astype(np.int64)
+
+    # Spectra of blocks of about `SPECTRAL_BLOCK_SIZE` samples are estimated together
+    blocks = np.cumsum(lengths) // SPECTRAL_BLOCK_SIZE
+    for block in np.split(np.arange(len(valid)), np.flatnonzero(np.diff(blocks)) + 1):
+        indexes, _ = windowing.ragged_ranges(starts[block], starts[block] + lengths[block])
+        sample_offsets = np.concatenate(([0], np.cumsum(lengths[block])))
+        for band, power in _ragged_band_powers(resampled[indexes], sample_offsets, sfreq).items():
+            powers[band][valid[block]] = power
+
+    return pd.DataFrame(_band_ratios(powers))
+
+
+def _resample_intervals_batch(
+    x: np.ndarray, offsets: np.ndarray, sfreq: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Batched form of :func:`_resample_intervals` for series of at least four intervals.
+
+    The not-a-knot cubic splines through every series, equal to those of
+    `scipy.interpolate.make_interp_spline`, are fitted together,
+    as their interpolation conditions form a block diagonal tridiagonal system
+    (see `scipy.interpolate.CubicSpline`), and evaluated at all samples at once.
+
+    Returns
+    -------
+    (resampled, sample_offsets)
+        Resampled series, concatenated, and their ragged offsets.
+    """
+    counts = np.diff(offsets)
+    series_ids = np.repeat(np.arange(len(counts)), counts)
+    positions = np.arange(len(x)) - offsets[series_ids]
+    # Cumulative sums along the rows of a padded array add in the order of `np.cumsum`
+    # of every series, so that the resampling grids equal those of `_resample_intervals`
+    padded = np.zeros((len(counts), counts.max()))
+    padded[series_ids, positions] = x
+    time = np.cumsum(padded, axis=1)[series_ids, positions]
+    coefficients = _not_a_knot_coefficients(time, x, offsets)
+
+    step = 1000 / sfreq
+    first, last = offsets[:-1], offsets[1:] - 1
+    lengths = np.ceil((time[last] - time[first]) / step).astype(np.int64)
+    sample_offsets = np.concatenate(([0], np.cumsum(lengths)))
+    series_starts = np.repeat(sample_offsets[:-1], lengths)
+    samples = (
+        np.repeat(time[first], lengths) + (np.arange(len(series_starts)) - series_starts) * step
+    )
+
+    # Every interval between knots spans from the first sample at or after its left knot
+    inner = np.flatnonzero((positions > 0) & (positions < counts[series_ids] - 1))
+    inner_ids = series_ids[inner]
+    start_time = time[first][inner_ids]
+    first_sample = np.ceil((time[inner] - start_time) / step).astype(np.int64)
+    first_sample -= (first_sample > 0) & (start_time + (first_sample - 1) * step >= time[inner])
+    first_sample += start_time + first_sample * step < time[inner]
+    boundaries = np.empty(len(x), dtype=np.int64)
+    boundaries[first], boundaries[last] = sample_offsets[:-1], sample_offsets[1:]
+    boundaries[inner] = sample_offsets[inner_ids] + np.minimum(first_sample, lengths[inner_ids])
+    n_interval_samples = np.diff(boundaries)
+
+    # Horner's scheme in the distance to the left knot of every interval
+    distance = samples - np.repeat(time[:-1], n_interval_samples)
+    resampled = np.repeat(coefficients[0], n_interval_samples)
+    for power in range(1, 4):
+        resampled *= distance
+        resampled += np.repeat(coefficients[power], n_interval_samples)
+    return resampled, sample_offsets
+
+
+def _not_a_knot_coefficients(time: np.ndarray, x: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Polynomial coefficients of not-a-knot cubic splines interpolating `x` at `time`,
+    for every series ``offsets[i]:offsets[i + 1]`` of at least four knots.
+
+    Returns
+    -------
+    np.ndarray
+        Coefficients of the cubic from knot `j` to the next, highest power first,
+        in column `j` (meaningless for the last knot of every series).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):  # Between consecutive series
+        dx = np.diff(time)
+        slope = np.diff(x) / dx
+
+    # Slopes at the knots, as solved by `scipy.interpolate.CubicSpline`
+    first, last = offsets[:-1], offsets[1:] - 1
+    inner = np.ones(len(time), dtype=bool)
+    inner[first] = inner[last] = False
+    inner = np.flatnonzero(inner)
+    diagonal, upper, lower, b = (np.zeros(len(time)) for _ in range(4))
+    diagonal[inner] = 2 * (dx[inner - 1] + dx[inner])
+    upper[inner] = dx[inner - 1]
+    lower[inner] = dx[inner]
+    b[inner] = 3 * (dx[inner] * slope[inner - 1] + dx[inner - 1] * slope[inner])
+
+    d = time[first + 2] - time[first]
+    diagonal[first] = dx[first + 1]
+    upper[first] = d
+    b[first] = (
+        (dx[first] + 2 * d) * dx[first + 1] * slope[first] + dx[first] ** 2 * slope[first + 1]
+    ) / d
+    d = time[last] - time[last - 2]
+    diagonal[last] = dx[last - 2]
+    lower[last] = d
+    b[last] = dx[last - 1] ** 2 * slope[last - 2]
+    b[last] += (2 * d + dx[last - 1]) * dx[last - 2] * slope[last - 1]
+    b[last] /= d
+
+    banded = np.zeros((3, len(time)))
+    banded[0, 1:], banded[1], banded[2, :-1] = upper[:-1], diagonal, lower[1:]
+    slopes = scipy.linalg.solve_banded(
+        (1, 1), banded, b, overwrite_ab=True, overwrite_b=True, check_finite=False
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (slopes[:-1] + slopes[1:] - 2 * slope) / dx
+        return np.stack((t / dx, (slope - slopes[:-1]) / dx - t, slopes[:-1], x[:-1]))
+
+
+def _ragged_band_powers(
+    resampled: np.ndarray, sample_offsets: np.ndarray, sfreq: int
+) -> dict[str, np.ndarray]:
+    """Powers of every band in `FREQUENCY_BANDS` of many resampled series,
+    as :func:`_power_spectral_density` and :func:`_band_powers` of each.
+
+    Bands only span the lowest frequencies of every periodogram,
+    at multiples of ``sfreq / n_samples`` below the highest band limit.
+    Where these are fewer than the logarithm of `n_samples`,
+    they are summed directly over all series at once, which is cheaper than an FFT.
+    Otherwise, series of the same length are transformed together.
+    """
+    lengths = np.diff(sample_offsets)
+    powers = {band: np.full(len(lengths), np.nan) for band in FREQUENCY_BANDS}
+    resolution = 1.0 / (lengths * (1 / sfreq))  # As `scipy.fft.rfftfreq`
+    highest = max(high for _, high in FREQUENCY_BANDS.values())
+    n_bins = np.minimum(np.ceil(highest / resolution).astype(np.int64) + 1, lengths // 2 + 1)
+    direct = (n_bins < np.log2(np.maximum(lengths, 2))) & (lengths <= 256 * sfreq)
+
+    transformed = np.flatnonzero(~direct)
+    for length in np.unique(lengths[transformed]):
+        group = transformed[lengths[transformed] == length]
+        series = resampled[sample_offsets[group, None] + np.arange(length)]
+        freq, psd = _power_spectral_density(series, sfreq)
+        for band, power in _band_powers(freq, psd).items():
+            powers[band][group] = power
+
+    direct = np.flatnonzero(direct)
+    if len(direct) == 0:
+        return powers
+
+    # Periodograms of Hann windowed, mean-centred series, as in `_power_spectral_density`,
+    # from the spectra of the series themselves, as the window only mixes neighbouring bins
+    n_samples = lengths[direct]
+    if len(direct) == len(lengths):
+        values, series_offsets = resampled, sample_offsets
+    else:
+        indexes, _ = windowing.ragged_ranges(sample_offsets[direct], sample_offsets[direct + 1])
+        values = resampled[indexes]
+        series_offsets = np.concatenate(([0], np.cumsum(n_samples)))
+    ids = np.repeat(np.arange(len(direct)), n_samples)
+    angle = (np.arange(len(values)) - series_offsets[ids]) * (2 * np.pi / n_samples)[ids]
+    rotation = np.cos(angle) - 1j * np.sin(angle)
+    # Bins 0 to n_bins (the mean, which is removed, is the only power in multiples of n_samples)
+    unwindowed = np.zeros((len(direct), n_bins[direct].max() + 1), dtype=complex)
+    term = values * rotation
+    for k in range(1, unwindowed.shape[1]):
+        unwindowed[:, k] = np.add.reduceat(term, series_offsets[:-1])
+        term *= rotation
+    unwindowed[np.arange(unwindowed.shape[1]) % n_samples[:, None] == 0] = 0
+    below = np.concatenate((np.conj(unwindowed[:, 1:2]), unwindowed[:, :-2]), axis=1)
+    spectrum = unwindowed[:, :-1] / 2 - (below + unwindowed[:, 1:]) / 4
+
+    bins = np.arange(spectrum.shape[1])
+    freq = bins * resolution[direct, None]
+    # The squared Hann window sums to `3 * n_samples / 8` (series here have over four samples)
+    scale = 2 / (sfreq * 3 * n_samples / 8)
+    scale = np.where(
+        (bins == 0) | (2 * bins == n_samples[:, None]), scale[:, None] / 2, scale[:, None]
+    )
+    psd = np.square(np.abs(spectrum)) * scale / 1000000
+    in_spectrum = bins <= n_samples[:, None] // 2
+    for band, (low, high) in FREQUENCY_BANDS.items():
+        # Trapezoidal rule over the bins within the band, in ms**2
+        in_band = in_spectrum & (freq >= low) & (freq < high)
+        pairs = in_band[:, 1:] & in_band[:, :-1]
+        areas = np.diff(freq, axis=1) * (psd[:, 1:] + psd[:, :-1]) / 2
+        band_powers = np.sum(np.where(pairs, areas, 0), axis=1) * 1000000
+        band_powers[~in_band.any(axis=1)] = np.nan  # RapidHRV edit: if no power
+        powers[band][direct] = band_powers
+
+    return powers
+
 
-    # Interpolate R-R interval
+def _resample_intervals(x: np.ndarray, sfreq: int) -> np.ndarray:
+    """Interpolates an interval series with a cubic spline at `sfreq`."""
     time = np.cumsum(x)
-    f = scipy.interpolate.interp1d(time, x, kind="cubic")
-    new_time = np.arange(time[0], time[-1], 1000 / sfreq)  # sfreq = 5 Hz
-    x = f(new_time)
+    step = 1000 / sfreq
+    n_samples = int(np.ceil((time[-1] - time[0]) / step))
+    b_spline = scipy.interpolate.make_interp_spline(time, x, k=3)
+    return b_spline(time[0] + _resampling_grid(n_samples, step))
 
-    # Define window length
-    nperseg = 256 * sfreq
-    if nperseg > len(x):
-        nperseg = len(x)
 
-    # Compute Power Spectral Density
-    freq, psd = scipy.signal.welch(x=x, fs=sfreq, nperseg=nperseg, nfft=nperseg)
-    psd = psd / 1000000
-    fbands = {"hf": ("High frequency", (0.15, 0.4), "r")}
+@functools.lru_cache(maxsize=256)
+def _resampling_grid(n_samples: int, step: float) -> np.ndarray:
+    grid = np.arange(n_samples) * step
+    grid.setflags(write=False)
+    return grid
 
-    # Extract HRV parameters
-    ########################
-    stats = pd.DataFrame(columns=["Values", "Metric"])
-    band = "hf"
 
-    this_psd = psd[(freq >= fbands[band][1][0]) & (freq < fbands[band][1][1])]
-    this_freq = freq[(freq >= fbands[band][1][0]) & (freq < fbands[band][1][1])]
+def _power_spectral_density(x: np.ndarray, sfreq: int) -> tuple[np.ndarray, np.ndarray]:
+    """Welch's power spectral density estimate along the last axis of `x`, in s**2/Hz."""
+    n_samples = x.shape[-1]
+    if n_samples > 256 * sfreq:
+        freq, psd = scipy.signal.welch(x=x, fs=sfreq, nperseg=256 * sfreq, nfft=256 * sfreq)
+        return freq, psd / 1000000
 
-    if (len(this_psd) == 0) | (len(this_psd) == 0):  # RapidHRV edit: if no power
-        return np.nan
+    # Equivalent to `scipy.signal.welch` with a single segment spanning the whole series
+    freq, window, scale = _periodogram_design(n_samples, sfreq)
+    spectrum = scipy.fft.rfft((x - x.mean(axis=-1, keepdims=True)) * window, axis=-1)
+    return freq, np.square(np.abs(spectrum)) * scale / 1000000
 
-    # Peaks (Hz)
-    peak = round(this_freq[np.argmax(this_psd)], 4)
-    stats.loc[len(stats) + 1, :] = [peak, band + "_peak"]
 
-    # Power (ms**2)
-    power = np.trapz(x=this_freq, y=this_psd) * 1000000
-    stats.loc[len(stats) + 1, :] = [power, band + "_power"]
+@functools.lru_cache(maxsize=256)
+def _periodogram_design(n_samples: int, sfreq: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Frequencies, Hann window and one-sided density scaling of an `n_samples` periodogram."""
+    freq = scipy.fft.rfftfreq(n_samples, 1 / sfreq)
+    window = scipy.signal.get_window("hann", n_samples)
+    scale = np.full(len(freq), 2 / (sfreq * np.sum(np.square(window))))
+    scale[0] /= 2
+    if n_samples % 2 == 0:
+        scale[-1] /= 2
 
-    hf = stats.Values[stats.Metric == "hf_power"].values[0]
+    for array in (freq, window, scale):
+        array.setflags(write=False)
+    return freq, window, scale
 
-    return hf
+
+def _band_powers(freq: np.ndarray, psd: np.ndarray) -> dict:
+    """Integrates `psd` (along its last axis) over every band in `FREQUENCY_BANDS`."""
+    powers = {}
+    for band, (low, high) in FREQUENCY_BANDS.items():
+        start, stop = np.searchsorted(freq, (low, high))
+        if start == stop:  # RapidHRV edit: if no power
+            powers[band] = np.full(psd.shape[:-1], np.nan) if psd.ndim > 1 else np.nan
+            continue
+
+        # Trapezoidal rule, in ms**2
+        band_psd = psd[..., start:stop]
+        areas = np.diff(freq[start:stop]) * (band_psd[..., 1:] + band_psd[..., :-1]) / 2
+        powers[band] = np.sum(areas, axis=-1) * 1000000
+
+    return powers
+
+
+def _band_ratios(powers: dict) -> dict:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {**powers, "LF/HF": np.divide(powers["LF"], powers["HF"])}
 
 
 def outlier_detection(
@@ -249,34 +1566,125 @@ def outlier_detection(
     rmssd: float,
     settings: OutlierDetectionSettings,
 ) -> bool:
-    bpm_in_range = settings.bpm_range[0] < bpm < settings.bpm_range[1]
-    rmssd_in_range = settings.rmssd_range[0] < rmssd < settings.rmssd_range[1]
-    if not (bpm_in_range and rmssd_in_range):
-        return True
+    return (
+        outlier_criterion(
+            peaks, peak_properties, ibi, sample_rate, window_width, bpm, rmssd, settings
+        )
+        is not None
+    )
+
+
+def outlier_criterion(
+    peaks: np.ndarray,
+    peak_properties: dict,
+    ibi: np.ndarray,
+    sample_rate: int,
+    window_width: int,
+    bpm: float,
+    rmssd: float,
+    settings: OutlierDetectionSettings,
+) -> Optional[str]:
+    """Returns the first of `OUTLIER_CRITERIA` marking a window as an outlier, or None.
+
+    Criteria are checked in order:
+    "bpm" and "rmssd" out of range,
+    "peak_span" for a first to last peak distance below `settings.min_total_peak_distance`
+    of the window width, and "prominence", "height" and "ibi" for any peak prominence,
+    peak height or interbeat interval beyond the MAD threshold.
+    """
+    if not settings.bpm_range[0] < bpm < settings.bpm_range[1]:
+        return "bpm"
+    if not settings.rmssd_range[0] < rmssd < settings.rmssd_range[1]:
+        return "rmssd"
 
     max_peak_distance = (peaks[-1] - peaks[0]) / sample_rate
     if max_peak_distance < (window_width * settings.min_total_peak_distance):
-        return True
+        return "peak_span"
 
-    def mad_outlier_detection(x: np.ndarray, threshold: float) -> np.ndarray:
-        x = x - np.median(x)
-        mad = scipy.stats.median_abs_deviation(x) * threshold
-        return (x > mad) | (x < -mad)
+    if np.any(_mad_outliers(peak_properties["prominences"], settings.mad_threshold)):
+        return "prominence"
+    if np.any(_mad_outliers(peak_properties["peak_heights"], settings.mad_threshold)):
+        return "height"
+    if np.any(_mad_outliers(ibi, settings.ibi_mad_threshold)):
+        return "ibi"
 
-    prominence_outliers = mad_outlier_detection(
-        peak_properties["prominences"], settings.mad_threshold
-    )
-    if np.any(prominence_outliers):
-        return True
+    return None
 
-    height_outliers = mad_outlier_detection(
-        peak_properties["peak_heights"], settings.mad_threshold
-    )
-    if np.any(height_outliers):
-        return True
 
-    ibi_outliers = mad_outlier_detection(ibi, settings.ibi_mad_threshold)
-    if np.any(ibi_outliers):
-        return True
+def outlier_detection_batch(
+    peaks: np.ndarray,
+    peak_properties: dict,
+    ibi: np.ndarray,
+    offsets: np.ndarray,
+    sample_rate: int,
+    window_width: int,
+    bpm: np.ndarray,
+    rmssd: np.ndarray,
+    settings: OutlierDetectionSettings,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Outlier detection of many windows at once, as :func:`outlier_criterion` per window.
+
+    Parameters
+    ----------
+    peaks, peak_properties : np.ndarray, dict
+        Peaks of all windows and their "prominences" and "peak_heights",
+        in the ragged layout given by `offsets`.
+    ibi : np.ndarray
+        Interbeat intervals of all windows, one fewer than peaks for every (non-empty) window.
+    offsets : np.ndarray
+        The peaks of window `i` are ``peaks[offsets[i]:offsets[i + 1]]``.
+    bpm, rmssd : np.ndarray
+        Metrics of every window.
+    sample_rate, window_width, settings
+        As in :func:`outlier_criterion`.
+
+    Returns
+    -------
+    (is_outlier, criteria)
+        Outlier flag and criterion (None for valid windows) of every window.
+    """
+    n_windows = len(offsets) - 1
+    counts = np.diff(offsets)
+    window_ids = np.repeat(np.arange(n_windows), counts)
+    ibi_ids = np.repeat(np.arange(n_windows), np.maximum(counts - 1, 0))
+
+    first = np.minimum(offsets[:-1], len(peaks) - 1)
+    last = np.maximum(offsets[1:] - 1, 0)
+    peak_span = (peaks[last] - peaks[first]) / sample_rate if len(peaks) else np.zeros(n_windows)
+
+    def any_outlier(values, ids, threshold):
+        return np.bincount(
+            ids[_ragged_mad_outliers(values, ids, n_windows, threshold)], minlength=n_windows
+        ).astype(bool)
+
+    with np.errstate(invalid="ignore"):
+        fired = [
+            ~((settings.bpm_range[0] < bpm) & (bpm < settings.bpm_range[1])),
+            ~((settings.rmssd_range[0] < rmssd) & (rmssd < settings.rmssd_range[1])),
+            (counts == 0) | (peak_span < window_width * settings.min_total_peak_distance),
+            any_outlier(peak_properties["prominences"], window_ids, settings.mad_threshold),
+            any_outlier(peak_properties["peak_heights"], window_ids, settings.mad_threshold),
+            any_outlier(ibi, ibi_ids, settings.ibi_mad_threshold),
+        ]
+
+    criteria = np.full(n_windows, None, dtype=object)
+    for is_fired, criterion in reversed(list(zip(fired, OUTLIER_CRITERIA[1:]))):
+        criteria[is_fired] = criterion  # Earlier criteria take precedence
+    return np.logical_or.reduce(fired), criteria
+
+
+def _mad_outliers(x: np.ndarray, threshold: float) -> np.ndarray:
+    """Values further than `threshold` median absolute deviations from the median."""
+    x = x - np.median(x)
+    mad = np.median(np.abs(x - np.median(x))) * threshold
+    return (x > mad) | (x < -mad)
+
 
-    return False
+def _ragged_mad_outliers(
+    values: np.ndarray, window_ids: np.ndarray, n_windows: int, threshold: float
+) -> np.ndarray:
+    """As `_mad_outliers` within every window of the ragged `values`."""
+    x = values - windowing.ragged_median(values, window_ids, n_windows)[window_ids]
+    deviations = np.abs(x - windowing.ragged_median(x, window_ids, n_windows)[window_ids])
+    mad = windowing.ragged_median(deviations, window_ids, n_windows) * threshold
+    return (x > mad[window_ids]) | (x < -mad[window_ids])
@@ -0,0 +1,414 @@
+import collections
+import concurrent.futures
+import json
+import os
+import time
+import traceback
+import urllib.parse
+import warnings
+from collections.abc import Callable, Hashable, Mapping, Sequence
+from typing import Any, Literal, Optional, Union
+
+import h5py
+import pandas as pd
+
+from .analysis import analyze
+from .data import Signal
+from .preprocessing import preprocess
+from .results import load_results, save_results
+
+Source = Union[Signal, str, os.PathLike]
+
+
+def load_source(source: Source, sample_rate: Optional[int] = None) -> Signal:
+    """Loads a `Signal` from a file path, passing `Signal` objects through unchanged.
+
+    Files are loaded according to their extension: ".csv" and ".txt" via
+    :meth:`Signal.from_csv` and :meth:`Signal.from_txt`, which require `sample_rate`,
+    anything else via :meth:`Signal.load`.
+    """
+    if isinstance(source, Signal):
+        return source
+
+    extension = os.path.splitext(source)[1].lower()
+    if extension in (".csv", ".txt"):
+        if sample_rate is None:
+            raise ValueError(f"Parameter 'sample_rate' is required to load {source}.")
+        loader = Signal.from_csv if extension == ".csv" else Signal.from_txt
+        return loader(os.fspath(source), sample_rate=sample_rate)
+
+    return Signal.load(os.fspath(source))
+
+
+def preprocess_many(
+    sources: Union[Sequence[Source], Mapping[Hashable, Source]],
+    sample_rate: Optional[int] = None,
+    n_workers: Optional[int] = None,
+    chunksize: int = 1,
+    errors: Literal["raise", "warn"] = "warn",
+    **preprocess_kwargs,
+) -> dict[Hashable, Signal]:
+    """Preprocesses many recordings in parallel.
+
+    Parameters
+    ----------
+    sources : sequence or mapping of Signal or path
+        Recordings to be processed, see :func:`load_source`.
+        If a mapping is given, its keys identify the subjects,
+        otherwise file paths identify subjects loaded from files
+        and list positions identify `Signal` objects.
+    sample_rate : int, optional
+        Sample rate of recordings loaded from CSV or text files.
+    n_workers : int, optional
+        Number of worker processes, defaults to the number of processors.
+        With a single worker, recordings are processed in the calling process.
+    chunksize : int, default: 1
+        Number of recordings sent to a worker at once.
+        Larger values reduce scheduling overhead for many short recordings.
+    errors : {"raise", "warn"}, default: "warn"
+        Whether a failing recording raises an exception once all recordings are processed,
+        or only issues a warning and is omitted from the result.
+    **preprocess_kwargs
+        Passed on to :func:`preprocess`.
+
+    Returns
+    -------
+    dict
+        Preprocessed signals by subject.
+    """
+    return _run_many(
+        _preprocess_one, sources, (sample_rate, preprocess_kwargs), n_workers, chunksize, errors
+    )
+
+
+def analyze_many(
+    sources: Union[Sequence[Source], Mapping[Hashable, Source]],
+    sample_rate: Optional[int] = None,
+    preprocessed: bool = False,
+    preprocess_settings: Optional[dict[str, Any]] = None,
+    window_output: Literal["full", "lazy", "none"] = "none",
+    concat: bool = False,
+    n_workers: Optional[int] = None,
+    chunksize: int = 1,
+    errors: Literal["raise", "warn"] = "warn",
+    **analyze_kwargs,
+) -> Union[dict[Hashable, pd.DataFrame], pd.DataFrame]:
+    """Preprocesses and analyzes many recordings in parallel.
+
+    Parameters
+    ----------
+    sources : sequence or mapping of Signal or path
+        Recordings to be analyzed, see :func:`preprocess_many`.
+    sample_rate : int, optional
+        Sample rate of recordings loaded from CSV or text files.
+    preprocessed : bool, default: False
+        Whether recordings are already preprocessed, in which case :func:`preprocess` is skipped.
+    preprocess_settings : dict, optional
+        Passed on to :func:`preprocess` as keyword arguments.
+    window_output : {"full", "lazy", "none"}, default: "none"
+        Contents of the "Window" column, see :func:`analyze`.
+        Omitted by default, as "full" output is expensive to send between processes
+        and "lazy" output sends the entire preprocessed signal along with each result.
+    concat : bool, default: False
+        Whether to concatenate all results into a single dataframe,
+        with the subject in an additional leading "Subject" column.
+    n_workers, chunksize, errors
+        As in :func:`preprocess_many`.
+    **analyze_kwargs
+        Passed on to :func:`analyze`.
+
+    Returns
+    -------
+    dict or pd.DataFrame
+        Analysis results by subject, or concatenated if `concat` is set.
+    """
+    results = _run_many(
+        _analyze_one,
+        sources,
+        (sample_rate, preprocessed, preprocess_settings or {}, window_output, analyze_kwargs),
+        n_workers,
+        chunksize,
+        errors,
+    )
+    if not concat:
+        return results
+
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results, names=["Subject", None]).reset_index(level=0).reset_index(drop=True)
+
+
+def run_batch(
+    sources: Union[Sequence[Union[str, os.PathLike]], Mapping[str, Union[str, os.PathLike]]],
+    output: Union[str, os.PathLike],
+    sample_rate: Optional[int] = None,
+    preprocessed: bool = False,
+    preprocess_settings: Optional[dict[str, Any]] = None,
+    window_output: Literal["full", "lazy", "none"] = "none",
+    n_workers: int = 1,
+    prefetch: int = 2,
+    resume: bool = True,
+    errors: Literal["raise", "warn"] = "warn",
+    report: Optional[Callable[[dict], Any]] = None,
+    **analyze_kwargs,
+) -> pd.DataFrame:
+    """Preprocesses and analyzes recordings from files into an HDF5 store, resumably.
+
+    Recordings are loaded by a background thread up to `prefetch` recordings ahead,
+    so that reading files overlaps with their analysis.
+    With several workers, every worker instead loads the recordings it analyzes,
+    rather than receiving a copy of each signal, with `prefetch` recordings queued ahead.
+    The results of every recording are saved by :func:`save_results` as soon as it completes,
+    to the group "results/<subject>" of `output` (with the subject URL-quoted),
+    see :func:`load_batch_results`.
+    Completed subjects are appended to the checkpoint file "<output>.checkpoint",
+    and skipped when the batch is run again, so that interrupted batches resume
+    where they stopped. Failed recordings are not checkpointed, and retried.
+    Recordings fail if they cannot be loaded, analyzed or written.
+
+    Parameters
+    ----------
+    sources : sequence or mapping of path
+        Recording files, see :func:`load_source`.
+        If a mapping is given, its keys identify the subjects, otherwise file paths do.
+    output : path
+        HDF5 file of the results, created if it does not exist.
+    sample_rate, preprocessed, preprocess_settings, window_output, errors
+        As in :func:`analyze_many`.
+    n_workers : int, default: 1
+        Number of worker processes. With a single worker,
+        recordings are analyzed in the calling process.
+    prefetch : int, default: 2
+        Number of recordings loaded ahead of those being analyzed.
+    resume : bool, default: True
+        Whether to skip subjects in the checkpoint file, rather than starting over.
+    report : callable, optional
+        Called with the throughput record of every recording as it completes, see Returns.
+    **analyze_kwargs
+        Passed on to :func:`analyze`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Throughput of every recording processed by this run, indexed by subject in order:
+        its number of "samples", the "load_seconds", "compute_seconds" and "write_seconds"
+        it took, "samples_per_second" over all three, and the "error" if it failed.
+    """
+    if errors not in ("raise", "warn"):
+        raise ValueError(f"Invalid error handling: {errors}.")
+    if n_workers < 1 or prefetch < 0:
+        raise ValueError("Parameter 'n_workers' must be positive and 'prefetch' non-negative.")
+
+    output = os.fspath(output)
+    checkpoint = f"{output}.checkpoint"
+    if isinstance(sources, Mapping):
+        items = [(str(key), source) for key, source in sources.items()]
+    else:
+        items = [(os.fspath(source), source) for source in sources]
+
+    completed = set()
+    if resume and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            completed = {json.loads(line) for line in f if line.strip()}
+    elif os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    pending = collections.deque((k, s) for k, s in items if k not in completed)
+
+    settings = (preprocessed, preprocess_settings or {}, window_output, analyze_kwargs)
+    records: list[dict] = []
+    failures = []
+
+    def finish(key: str, n_samples: int, load_seconds: float, outcome: tuple) -> None:
+        result, compute_seconds, error = outcome
+        started = time.perf_counter()
+        if error is None:
+            # A recording whose results cannot be written fails like one that cannot be analyzed
+            try:
+                results, result_rate = result
+                save_results(results, output, result_rate, group=_batch_group(key))
+                with open(checkpoint, "a") as f:
+                    f.write(json.dumps(key) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as exception:
+                error = (exception, traceback.format_exc())
+        if error is not None:
+            failures.append(error[0])
+            if errors == "warn":
+                warnings.warn(f"Processing {key!r} failed:\n{error[1]}", RuntimeWarning)
+        write_seconds = time.perf_counter() - started
+
+        seconds = load_seconds + compute_seconds + write_seconds
+        record = {
+            "subject": key,
+            "samples": n_samples,
+            "load_seconds": load_seconds,
+            "compute_seconds": compute_seconds,
+            "write_seconds": write_seconds,
+            "samples_per_second": n_samples / seconds if seconds > 0 else float("nan"),
+            "error": None if error is None else repr(error[0]),
+        }
+        records.append(record)
+        if report is not None:
+            report(record)
+
+    if n_workers > 1:
+        # Workers load their own recordings, so that signals are not sent between processes,
+        # and `prefetch` more recordings are queued for them
+        pool = concurrent.futures.ProcessPoolExecutor(n_workers)
+        running: dict[concurrent.futures.Future, str] = {}
+        try:
+            while pending or running:
+                while pending and len(running) < prefetch + n_workers:
+                    key, source = pending.popleft()
+                    running[pool.submit(_process_timed, source, sample_rate, settings)] = key
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    finish(running.pop(future), *future.result())
+        finally:
+            pool.shutdown(cancel_futures=True)
+    else:
+        loader = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="rapidhrv-prefetch")
+        loading: collections.deque = collections.deque()
+        try:
+            while pending or loading:
+                # Recordings are loaded up to `prefetch` ahead of the one being analyzed
+                while pending and len(loading) < prefetch + 1:
+                    key, source = pending.popleft()
+                    loading.append((key, loader.submit(_load_timed, source, sample_rate)))
+
+                key, future = loading.popleft()
+                signal, load_seconds, error = future.result()
+                if error is not None:
+                    finish(key, 0, load_seconds, (None, 0.0, error))
+                else:
+                    finish(key, signal.data.size, load_seconds, _analyze_timed(signal, settings))
+        finally:
+            loader.shutdown(cancel_futures=True)
+
+    if failures and errors == "raise":
+        raise RuntimeError(f"Processing failed for {len(failures)} recording(s).") from failures[0]
+
+    # Workers finish in any order
+    order = {key: i for i, (key, _) in enumerate(items)}
+    records.sort(key=lambda record: order[record["subject"]])
+    columns = ["samples", "load_seconds", "compute_seconds", "write_seconds"]
+    return pd.DataFrame(
+        records, columns=["subject", *columns, "samples_per_second", "error"]
+    ).set_index("subject")
+
+
+def load_batch_results(
+    filename: Union[str, os.PathLike], subjects: Optional[Sequence[str]] = None
+) -> dict[str, pd.DataFrame]:
+    """Loads the results saved by :func:`run_batch` by subject, by default of all subjects."""
+    with h5py.File(filename, "r") as f:
+        names = list(f["results"]) if "results" in f else []
+    stored = {urllib.parse.unquote(name): name for name in names}
+    if subjects is None:
+        subjects = list(stored)
+    return {
+        subject: load_results(os.fspath(filename), f"results/{stored[subject]}")
+        for subject in subjects
+    }
+
+
+def _batch_group(key: str) -> str:
+    return f"results/{urllib.parse.quote(key, safe='')}"
+
+
+def _load_timed(source: Source, sample_rate: Optional[int]) -> tuple:
+    started = time.perf_counter()
+    try:
+        signal = load_source(source, sample_rate)
+        return signal, time.perf_counter() - started, None
+    except Exception as exception:
+        return None, time.perf_counter() - started, (exception, traceback.format_exc())
+
+
+def _process_timed(source: Source, sample_rate: Optional[int], settings: tuple) -> tuple:
+    """Loads, preprocesses and analyzes `source`, returning its size, load time and outcome."""
+    signal, load_seconds, error = _load_timed(source, sample_rate)
+    if error is not None:
+        return 0, load_seconds, (None, 0.0, error)
+    return signal.data.size, load_seconds, _analyze_timed(signal, settings)
+
+
+def _analyze_timed(signal: Signal, settings: tuple) -> tuple:
+    """Preprocesses and analyzes `signal`, returning any exception instead of raising it."""
+    preprocessed, preprocess_settings, window_output, analyze_kwargs = settings
+    started = time.perf_counter()
+    try:
+        if not preprocessed:
+            signal = preprocess(signal, **preprocess_settings)
+        results = analyze(signal, window_output=window_output, **analyze_kwargs)
+        return (results, signal.sample_rate), time.perf_counter() - started, None
+    except Exception as exception:
+        return None, time.perf_counter() - started, (exception, traceback.format_exc())
+
+
+def _preprocess_one(source: Source, settings: tuple) -> Signal:
+    sample_rate, preprocess_kwargs = settings
+    return preprocess(load_source(source, sample_rate), **preprocess_kwargs)
+
+
+def _analyze_one(source: Source, settings: tuple) -> pd.DataFrame:
+    sample_rate, preprocessed, preprocess_settings, window_output, analyze_kwargs = settings
+    signal = load_source(source, sample_rate)
+    if not preprocessed:
+        signal = preprocess(signal, **preprocess_settings)
+
+    return analyze(signal, window_output=window_output, **analyze_kwargs)
+
+
+def _run_task(task: tuple[Callable, Hashable, Source, tuple]):
+    """Runs a single task, returning any exception instead of raising it."""
+    function, key, source, settings = task
+    try:
+        return key, function(source, settings), None
+    except Exception as exception:
+        return key, None, (exception, traceback.format_exc())
+
+
+def _run_many(
+    function: Callable,
+    sources: Union[Sequence[Source], Mapping[Hashable, Source]],
+    settings: tuple,
+    n_workers: Optional[int],
+    chunksize: int,
+    errors: Literal["raise", "warn"],
+) -> dict:
+    if errors not in ("raise", "warn"):
+        raise ValueError(f"Invalid error handling: {errors}.")
+
+    if isinstance(sources, Mapping):
+        items = list(sources.items())
+    else:
+        items = [
+            (i if isinstance(source, Signal) else os.fspath(source), source)
+            for i, source in enumerate(sources)
+        ]
+    tasks = [(function, key, source, settings) for key, source in items]
+
+    if n_workers == 1:
+        outcomes = list(map(_run_task, tasks))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            outcomes = list(executor.map(_run_task, tasks, chunksize=chunksize))
+
+    results = {}
+    failures = []
+    for key, result, error in outcomes:
+        if error is None:
+            results[key] = result
+        else:
+            failures.append(error[0])
+            if errors == "warn":
+                warnings.warn(f"Processing {key!r} failed:\n{error[1]}", RuntimeWarning)
+
+    if failures and errors == "raise":
+        raise RuntimeError(f"Processing failed for {len(failures)} recording(s).") from failures[0]
+
+    return results
@@ -0,0 +1,190 @@
+"""Caching of intermediate results, for repeated analyses of the same recordings."""
+
+import collections
+import dataclasses
+import hashlib
+import os
+import pickle
+import tempfile
+from collections.abc import Callable, Hashable
+from typing import Any, Optional, Union
+
+import numpy as np
+
+from .data import Signal
+
+
+def signal_fingerprint(signal: Signal, block_size: int = 2**22) -> str:
+    """Hash of the data and sample rate of `signal`, read in blocks of `block_size` samples.
+
+    Multi-channel data is read in blocks of `block_size` samples of every channel.
+    """
+    data = signal.data
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((signal.sample_rate, np.dtype(data.dtype).str, data.shape)).encode())
+    for start in range(0, data.shape[-1], block_size):
+        digest.update(np.ascontiguousarray(data[..., start : start + block_size]).data)
+    return digest.hexdigest()
+
+
+@dataclasses.dataclass
+class CacheStats:
+    """Usage statistics of a :class:`ResultCache`.
+
+    Attributes
+    ----------
+    hits, misses:
+        Numbers of lookups by stage, such as "preprocess", "peaks" and "results".
+    disk_hits:
+        Number of hits served from the disk store rather than from memory.
+    evictions:
+        Number of entries evicted from memory or disk to respect their size limits.
+    """
+
+    hits: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    misses: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    disk_hits: int = 0
+    evictions: int = 0
+
+
+class ResultCache:
+    """Size-bounded least-recently-used cache of pipeline stages, optionally backed by disk.
+
+    Values are stored pickled, so every lookup returns an independent copy.
+    Pass the same cache to :func:`preprocess` and :func:`analyze` to reuse their results
+    for identical signals and parameters. Entries are keyed by a hash of the signal
+    (see :func:`signal_fingerprint`) and of the parameters affecting each stage:
+    "preprocess" holds preprocessed signals,
+    "peaks" the peaks and metrics of every window, independent of outlier detection settings,
+    and "results" the dataframes returned by `analyze` (without window output only).
+
+    Parameters
+    ----------
+    max_memory : int, default: 2**28
+        Maximum size in bytes of the pickled entries held in memory.
+    directory : path, optional
+        Directory of the disk store, which persists entries between sessions and processes.
+        Entries evicted from memory remain available from disk.
+    max_disk : int, default: 2**32
+        Maximum size in bytes of the disk store.
+
+    Attributes
+    ----------
+    stats : CacheStats
+        Hit, miss and eviction counts.
+    """
+
+    def __init__(
+        self,
+        max_memory: int = 2**28,
+        directory: Optional[Union[str, os.PathLike]] = None,
+        max_disk: int = 2**32,
+    ):
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.directory = None if directory is None else os.fspath(directory)
+        self.stats = CacheStats()
+        self._memory: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self._memory_size = 0
+        self._disk: collections.OrderedDict[str, int] = collections.OrderedDict()
+        self._disk_size = 0
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".pkl")]
+            for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+                self._disk[entry.name[: -len(".pkl")]] = entry.stat().st_size
+            self._disk_size = sum(self._disk.values())
+
+    @property
+    def memory_size(self) -> int:
+        """Size in bytes of the entries held in memory."""
+        return self._memory_size
+
+    @property
+    def disk_size(self) -> int:
+        """Size in bytes of the entries held on disk."""
+        return self._disk_size
+
+    def __len__(self) -> int:
+        return len(self._memory.keys() | self._disk.keys())
+
+    def get_or_compute(self, stage: str, parameters: Hashable, compute: Callable[[], Any]) -> Any:
+        """Returns the cached value of `stage` for `parameters`, or computes and stores it.
+
+        `parameters` must have a deterministic `repr`, such as tuples of strings, numbers
+        and dataclasses, from which the key is hashed.
+        """
+        key = hashlib.blake2b(repr((stage, parameters)).encode(), digest_size=16).hexdigest()
+        pickled = self._get(key)
+        if pickled is not None:
+            self.stats.hits[stage] += 1
+            return pickle.loads(pickled)
+
+        self.stats.misses[stage] += 1
+        value = compute()
+        self._put(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        return value
+
+    def clear(self) -> None:
+        """Removes all entries from memory and disk."""
+        self._memory.clear()
+        self._memory_size = 0
+        for key in list(self._disk):
+            self._remove_from_disk(key)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        if key not in self._disk:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                pickled = f.read()
+        except FileNotFoundError:  # Removed by another process
+            self._disk_size -= self._disk.pop(key)
+            return None
+        os.utime(path)
+        self._disk.move_to_end(key)
+        self.stats.disk_hits += 1
+        self._store_in_memory(key, pickled)
+        return pickled
+
+    def _put(self, key: str, pickled: bytes) -> None:
+        self._store_in_memory(key, pickled)
+        if self.directory is None or len(pickled) > self.max_disk:
+            return
+
+        # Write atomically, as other processes may read the store concurrently
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as f:
+            f.write(pickled)
+        os.replace(f.name, self._path(key))
+        self._disk_size += len(pickled) - self._disk.pop(key, 0)
+        self._disk[key] = len(pickled)
+        while self._disk_size > self.max_disk:
+            self._remove_from_disk(next(iter(self._disk)))
+            self.stats.evictions += 1
+
+    def _store_in_memory(self, key: str, pickled: bytes) -> None:
+        if len(pickled) > self.max_memory:
+            return
+        self._memory_size += len(pickled) - len(self._memory.pop(key, b""))
+        self._memory[key] = pickled
+        while self._memory_size > self.max_memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.stats.evictions += 1
+
+    def _remove_from_disk(self, key: str) -> None:
+        self._disk_size -= self._disk.pop(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key: str) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, f"{key}.pkl")
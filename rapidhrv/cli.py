@@ -0,0 +1,155 @@
+"""Command line batch runner, installed as the `rapidhrv` command.
+
+Usage::
+
+    rapidhrv "recordings/*.hdf5" --output results.hdf5 [--config settings.json] [--workers 4]
+
+The optional JSON configuration holds the parameters of :func:`rapidhrv.run_batch`::
+
+    {
+        "sample_rate": 250,
+        "preprocessed": false,
+        "preprocess": {"resample_rate": 1000, "sg_settings": [3, 100]},
+        "analyze": {"window_width": 10, "outlier_detection_settings": "moderate"}
+    }
+
+"outlier_detection_settings" and "clustering_settings" of "analyze" may be method names
+or objects of the fields of :class:`OutlierDetectionSettings` and :class:`ClusteringSettings`.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections.abc import Sequence
+from typing import Any, Optional
+
+from .batch import run_batch
+from .data import ClusteringSettings, OutlierDetectionSettings
+
+CONFIG_KEYS = {"sample_rate", "preprocessed", "preprocess", "analyze", "window_output"}
+
+
+def load_config(filename: str) -> dict[str, Any]:
+    """Reads a JSON configuration into keyword arguments of :func:`rapidhrv.run_batch`."""
+    with open(filename) as f:
+        config = json.load(f)
+
+    unknown = set(config) - CONFIG_KEYS
+    if unknown:
+        raise ValueError(f"Unknown configuration keys: {', '.join(sorted(unknown))}.")
+
+    kwargs = {
+        key: config[key]
+        for key in ("sample_rate", "preprocessed", "window_output")
+        if config.get(key) is not None
+    }
+    kwargs["preprocess_settings"] = _with_tuples(config.get("preprocess", {}))
+
+    analyze_settings = dict(config.get("analyze", {}))
+    for key, settings_class in (
+        ("outlier_detection_settings", OutlierDetectionSettings),
+        ("clustering_settings", ClusteringSettings),
+    ):
+        if isinstance(analyze_settings.get(key), dict):
+            analyze_settings[key] = settings_class(**_with_tuples(analyze_settings[key]))
+    return {**kwargs, **analyze_settings}
+
+
+def _with_tuples(settings: dict) -> dict[str, Any]:
+    """JSON arrays of `settings` as tuples, such as ranges and `sg_settings`."""
+    return {
+        key: tuple(value) if isinstance(value, list) else value for key, value in settings.items()
+    }
+
+
+def expand_sources(patterns: Sequence[str], manifest: Optional[str] = None) -> list[str]:
+    """Paths matching `patterns` and the lines of `manifest`, in order and without duplicates.
+
+    Patterns may contain shell-style wildcards, with "**" matching any subdirectories.
+    Lines of the manifest hold one path or pattern each, relative to the manifest,
+    and lines starting with "#" are ignored.
+    Patterns without wildcards are kept even if the file does not exist,
+    so that it is reported as failed.
+    """
+    patterns = list(patterns)
+    if manifest is not None:
+        directory = os.path.dirname(manifest)
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    patterns.append(os.path.join(directory, line))
+
+    paths: dict[str, None] = {}
+    for pattern in patterns:
+        if any(character in pattern for character in "*?["):
+            paths.update(dict.fromkeys(sorted(glob.glob(pattern, recursive=True))))
+        else:
+            paths[pattern] = None
+    return list(paths)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="rapidhrv",
+        description="Preprocesses and analyzes cardiac recordings into an HDF5 results file.",
+    )
+    parser.add_argument("sources", nargs="*", help="Recording files or glob patterns")
+    parser.add_argument("--manifest", help="File listing a recording or pattern per line")
+    parser.add_argument("--output", "-o", required=True, help="HDF5 results file")
+    parser.add_argument("--config", "-c", help="JSON configuration of the analysis")
+    parser.add_argument("--sample-rate", type=int, help="Sample rate of CSV and text files")
+    parser.add_argument("--workers", "-j", type=int, default=1, help="Worker processes")
+    parser.add_argument("--prefetch", type=int, default=2, help="Recordings loaded ahead")
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore the checkpoint of a previous run"
+    )
+    parser.add_argument("--quiet", "-q", action="store_true", help="Only report a summary")
+    args = parser.parse_args(argv)
+
+    sources = expand_sources(args.sources, args.manifest)
+    if not sources:
+        parser.error("No recordings given.")
+    kwargs = load_config(args.config) if args.config else {}
+    if args.sample_rate is not None:
+        kwargs["sample_rate"] = args.sample_rate
+
+    def report(record: dict) -> None:
+        if record["error"] is not None:
+            print(f"{record['subject']}: failed, {record['error']}", file=sys.stderr)
+        elif not args.quiet:
+            seconds = sum(record[f"{stage}_seconds"] for stage in ("load", "compute", "write"))
+            print(
+                f"{record['subject']}: {record['samples']} samples in {seconds:.2f}s "
+                f"({record['samples_per_second']:.0f} samples/s; "
+                f"load {record['load_seconds']:.2f}s, compute {record['compute_seconds']:.2f}s, "
+                f"write {record['write_seconds']:.2f}s)"
+            )
+
+    started = time.perf_counter()
+    throughput = run_batch(
+        sources,
+        args.output,
+        n_workers=args.workers,
+        prefetch=args.prefetch,
+        resume=not args.restart,
+        report=report,
+        **kwargs,
+    )
+    seconds = time.perf_counter() - started
+
+    n_failed = int(throughput["error"].notna().sum())
+    n_skipped = len(sources) - len(throughput)
+    print(
+        f"Processed {len(throughput) - n_failed} recording(s) in {seconds:.2f}s "
+        f"({throughput['samples'].sum() / seconds:.0f} samples/s), "
+        f"{n_failed} failed, {n_skipped} already completed."
+    )
+    return 1 if n_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
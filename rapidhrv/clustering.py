@@ -0,0 +1,178 @@
+"""Distinguishing ECG R waves from P and T waves by k-means clustering of peak properties."""
+
+from typing import Optional
+
+import numpy as np
+
+from .data import ClusteringSettings
+
+N_WAVES = 3  # P, R and T
+
+
+def peak_features(properties: dict) -> np.ndarray:
+    """Clustering features of peaks: widths, heights and prominences from `find_peaks`."""
+    return np.column_stack(
+        (properties["widths"], properties["peak_heights"], properties["prominences"])
+    )
+
+
+def kmeans(
+    features: np.ndarray,
+    n_clusters: int = N_WAVES,
+    init: Optional[np.ndarray] = None,
+    n_init: int = 3,
+    max_iter: int = 100,
+    seed: Optional[int] = 0,
+) -> tuple[np.ndarray, np.ndarray, float]:
+    """Lightweight k-means clustering (Lloyd's algorithm with k-means++ initialization).
+
+    Avoids the validation and threading overhead of `sklearn.cluster.KMeans`,
+    which dominates for the few dozen peaks of a window.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        Observations by features.
+    n_clusters : int, default: 3
+        Number of clusters.
+    init : np.ndarray, optional
+        Initial centroids, in which case a single run starts from them.
+    n_init : int, default: 3
+        Number of runs from k-means++ initializations, of which the lowest inertia is kept.
+    max_iter : int, default: 100
+        Maximum number of iterations per run.
+    seed : int, optional, default: 0
+        Seed of the k-means++ initializations, or None for nondeterministic initializations.
+
+    Returns
+    -------
+    (centers, labels, inertia)
+        Centroids, cluster of every observation and mean squared distance to its centroid.
+    """
+    features = np.asarray(features, dtype=float)
+    rng = np.random.default_rng(seed)
+    inits = [np.asarray(init, dtype=float)] if init is not None else [None] * n_init
+
+    best: Optional[tuple[np.ndarray, np.ndarray, float]] = None
+    for initial in inits:
+        centers = _kmeans_plusplus(features, n_clusters, rng) if initial is None else initial
+        for _ in range(max_iter):
+            labels, distances = nearest_centers(features, centers)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, labels, features)
+            counts = np.bincount(labels, minlength=n_clusters)[:, None]
+            # Empty clusters keep their centroid
+            updated = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+            if np.allclose(updated, centers):
+                break
+            centers = updated
+
+        labels, distances = nearest_centers(features, centers)
+        inertia = float(np.mean(distances))
+        if best is None or inertia < best[2]:
+            best = (centers, labels, inertia)
+
+    assert best is not None
+    return best
+
+
+def nearest_centers(features: np.ndarray, centers: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the nearest centroid of every observation and its squared distance to it."""
+    distances = np.square(features[:, None, :] - centers[None, :, :]).sum(axis=2)
+    labels = np.argmin(distances, axis=1)
+    return labels, distances[np.arange(len(features)), labels]
+
+
+def _kmeans_plusplus(features: np.ndarray, n_clusters: int, rng) -> np.ndarray:
+    centers = [features[rng.integers(len(features))]]
+    for _ in range(1, n_clusters):
+        _, distances = nearest_centers(features, np.array(centers))
+        total = distances.sum()
+        if total == 0:  # Fewer distinct observations than clusters
+            centers.append(centers[-1])
+        else:
+            centers.append(features[rng.choice(len(features), p=distances / total)])
+    return np.array(centers)
+
+
+def wave_label(centers: np.ndarray) -> int:
+    """Returns the cluster of R waves, given centroids of `peak_features`."""
+    # Use width centroids to determine correct wave (least width, most prominence)
+    # If the two lowest values are too close (< 5), use prominence to distinguish them
+    width_cen = centers[:, 0]
+    labels_sort_width = np.argsort(width_cen)
+    if width_cen[labels_sort_width[1]] - width_cen[labels_sort_width[0]] < 5:
+        # Label of maximum prominence for lowest two widths
+        prom_cen = centers[:, 2]
+        return int(np.argsort(prom_cen[labels_sort_width[:2]])[1])
+    else:
+        return int(labels_sort_width[0])
+
+
+class WaveClassifier:
+    """Selects R wave peaks from P, R and T wave peaks, as configured by `ClusteringSettings`.
+
+    In "window" mode, clusters are fitted to the peaks of every call to :meth:`select`.
+    In "recording" mode, centroids are fitted once by :meth:`fit`
+    and peaks are labelled by their nearest centroid,
+    refitting the centroids when a window's peaks lie too far from them.
+
+    Attributes
+    ----------
+    centers : np.ndarray or None
+        Fitted centroids of `peak_features`, None before fitting.
+    inertia : float or None
+        Mean squared distance of the fitted peaks to their centroids.
+    n_fits : int
+        Number of times clusters have been fitted, including refits.
+    """
+
+    def __init__(self, settings: ClusteringSettings):
+        if settings.mode not in ("window", "recording"):
+            raise ValueError(f"Invalid clustering mode: {settings.mode}.")
+        if settings.implementation not in ("sklearn", "numpy"):
+            raise ValueError(f"Invalid clustering implementation: {settings.implementation}.")
+
+        self.settings = settings
+        self.centers: Optional[np.ndarray] = None
+        self.inertia: Optional[float] = None
+        self.n_fits = 0
+
+    def fit(self, features: np.ndarray, init: Optional[np.ndarray] = None) -> np.ndarray:
+        """Fits centroids to `features`, returning the cluster of every peak."""
+        if self.settings.implementation == "sklearn":
+            import sklearn.cluster  # Deferred, as importing scikit-learn is slow
+
+            k_means = sklearn.cluster.KMeans(
+                n_clusters=N_WAVES,
+                init="k-means++" if init is None else init,
+                n_init=10 if init is None else 1,
+                random_state=self.settings.seed,
+            ).fit(features)
+            centers, labels = k_means.cluster_centers_, k_means.labels_
+            inertia = k_means.inertia_ / len(features)
+        else:
+            centers, labels, inertia = kmeans(
+                features, N_WAVES, init=init, seed=self.settings.seed
+            )
+
+        self.centers, self.inertia = centers, inertia
+        self.n_fits += 1
+        return labels
+
+    def select(self, properties: dict) -> np.ndarray:
+        """Returns a mask of the R wave peaks among peaks with `properties` from `find_peaks`."""
+        features = peak_features(properties)
+        if self.settings.mode == "window" or self.centers is None:
+            if len(features) < N_WAVES:
+                return np.ones(len(features), dtype=bool)
+            labels = self.fit(features)
+        else:
+            labels, distances = nearest_centers(features, self.centers)
+            assert self.inertia is not None
+            drifted = np.mean(distances) > self.settings.drift_threshold * max(self.inertia, 1)
+            if drifted and len(features) >= N_WAVES:
+                labels = self.fit(features, init=self.centers)
+
+        assert self.centers is not None
+        return labels == wave_label(self.centers)
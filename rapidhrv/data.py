@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import contextlib
 import dataclasses
+import datetime
+import io
+import itertools
+import os
+import urllib.request
+import warnings
+from collections.abc import Iterator, Mapping, Sequence
+from typing import Any, Optional, TextIO, Union
 
 import h5py
 import numpy as np
 import pandas as pd
 
+Column = Union[int, str]
+
 
 @dataclasses.dataclass
 class OutlierDetectionSettings:
@@ -56,6 +67,54 @@ class OutlierDetectionSettings:
             raise RuntimeError(f"Invalid outlier detection method: {method}.")
 
 
+@dataclasses.dataclass
+class ClusteringSettings:
+    """Settings for ECG P, R and T wave clustering.
+
+    Attributes
+    ----------
+    mode:
+        "window" fits k-means to the peaks of every window.
+        "recording" fits k-means once to the peaks of the windows within `calibration_duration`,
+        then labels the peaks of every window by their nearest centroid,
+        refitting the centroids to a window when its peaks drift away from them.
+    implementation:
+        "sklearn" uses `sklearn.cluster.KMeans`,
+        "numpy" a lightweight k-means implementation seeded with `seed`.
+    calibration_duration:
+        Duration in seconds at the start of the recording used to fit centroids
+        in "recording" mode, or None to use the entire recording.
+    drift_threshold:
+        Ratio between the mean squared distance of a window's peaks to their centroids
+        and that of the fitted peaks, above which centroids are refitted.
+    seed:
+        Random seed of k-means initializations, making clusters reproducible,
+        or None for nondeterministic initializations.
+    """
+
+    mode: str = "window"
+    implementation: str = "sklearn"
+    calibration_duration: Optional[float] = 300
+    drift_threshold: float = 4
+    seed: Optional[int] = 0
+
+    @classmethod
+    def from_method(cls, method: str) -> ClusteringSettings:
+        """Generate settings from method name.
+
+        Method names are: "window", "recording".
+        "window" fits clusters separately for every window,
+        "recording" fits clusters once per recording with the "numpy" implementation,
+        which is considerably faster.
+        """
+        if method == "window":
+            return ClusteringSettings()
+        elif method == "recording":
+            return ClusteringSettings(mode="recording", implementation="numpy")
+        else:
+            raise RuntimeError(f"Invalid clustering method: {method}.")
+
+
 @dataclasses.dataclass
 class Signal:
     """Raw signal with associated metadata.
@@ -63,41 +122,518 @@ class Signal:
     Attributes
     ----------
     data:
-        Raw signal data.
+        Raw signal data, either a single channel of samples,
+        or a 2-D array of channels by samples recorded simultaneously.
     sample_rate:
         Signal rate in Hertz of raw signal.
+    start_time:
+        Time of the first sample, if known.
+    units:
+        Units of the signal data, if known.
+    channel_names:
+        Names of the recorded channels, if known, one per row of 2-D data.
     """
 
     data: np.ndarray
     sample_rate: int
+    start_time: Optional[datetime.datetime] = None
+    units: Optional[str] = None
+    channel_names: Optional[list[str]] = None
 
     def __post_init__(self):
         self.data = self.data if isinstance(self.data, np.ndarray) else np.array(self.data)
+        if self.data.ndim > 2:
+            raise ValueError("Signal data must be one or two (channels by samples) dimensional.")
+        if self.channel_names is not None and len(self.channel_names) != self.n_channels:
+            raise ValueError(
+                f"Got {len(self.channel_names)} channel names for {self.n_channels} channels."
+            )
+
+    @property
+    def n_channels(self) -> int:
+        """Number of channels, the rows of 2-D data."""
+        return 1 if self.data.ndim == 1 else self.data.shape[0]
+
+    @property
+    def n_samples(self) -> int:
+        """Number of samples per channel."""
+        return self.data.shape[-1]
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds."""
+        return self.n_samples / self.sample_rate
+
+    def channel(self, channel: Column) -> Signal:
+        """Returns a single channel, by position or by name in `channel_names`."""
+        if isinstance(channel, str):
+            if self.channel_names is None or channel not in self.channel_names:
+                raise KeyError(f"No channel named {channel!r}.")
+            channel = self.channel_names.index(channel)
+
+        if self.data.ndim == 1:
+            if channel not in (0, -1):
+                raise IndexError(f"Channel {channel} out of range for a single channel.")
+            data = self.data
+        else:
+            data = self.data[channel]
+        return dataclasses.replace(
+            self,
+            data=data,
+            channel_names=None if self.channel_names is None else [self.channel_names[channel]],
+        )
+
+    def channels(self) -> dict[Column, Signal]:
+        """Returns every channel by name, or by position if `channel_names` are unknown."""
+        keys: Sequence[Column] = self.channel_names or range(self.n_channels)
+        return {key: self.channel(i) for i, key in enumerate(keys)}
+
+    @classmethod
+    def from_channels(cls, channels: Mapping[Column, Signal]) -> Signal:
+        """Combines single channel signals of equal sample rate and length, such as those
+        returned by :func:`read_channels`, into a multi-channel signal named by their keys.
+        """
+        signals = list(channels.values())
+        if not signals:
+            raise ValueError("At least one channel is required.")
+        first = signals[0]
+        if any(
+            signal.sample_rate != first.sample_rate or signal.n_samples != first.n_samples
+            for signal in signals
+        ):
+            raise ValueError("Channels must have the same sample rate and number of samples.")
+
+        return cls(
+            data=np.stack([np.asarray(signal.data).reshape(-1) for signal in signals]),
+            sample_rate=first.sample_rate,
+            start_time=first.start_time,
+            units=first.units,
+            channel_names=[str(key) for key in channels],
+        )
+
+    def time_slice(self, start: float = 0, end: Optional[float] = None) -> Signal:
+        """Returns the samples from `start` to `end` seconds as an in-memory `Signal`.
+
+        Only the requested samples are read, also from a :class:`LazySignal`.
+        """
+        first = max(int(round(start * self.sample_rate)), 0)
+        last = self.n_samples if end is None else int(round(end * self.sample_rate))
+        start_time = self.start_time
+        if start_time is not None:
+            start_time += datetime.timedelta(seconds=first / self.sample_rate)
+        return Signal(
+            data=np.asarray(self.data[..., first:last]),
+            sample_rate=self.sample_rate,
+            start_time=start_time,
+            units=self.units,
+            channel_names=self.channel_names,
+        )
+
+    def save(
+        self,
+        filename: str,
+        chunk_size: Optional[int] = 2**16,
+        compression: Optional[str] = None,
+        compression_opts=None,
+    ) -> None:
+        """Save as filename.hdf5
+
+        Parameters
+        ----------
+        filename : str
+            Path of the HDF5 file.
+        chunk_size : int, optional, default: 65536
+            Number of samples (of every channel) per HDF5 chunk, or None for contiguous storage.
+            Chunked storage allows reading parts of the signal efficiently,
+            see :class:`LazySignal`.
+        compression : str, optional
+            HDF5 compression filter of chunked storage, e.g. "gzip" or "lzf".
+        compression_opts
+            Options of the compression filter, e.g. the "gzip" level from 0 to 9.
+        """
+        n_samples = self.n_samples
+        chunks = None
+        if chunk_size is not None and n_samples > 0:
+            chunks = (*self.data.shape[:-1], min(chunk_size, n_samples))
 
-    def save(self, filename: str) -> None:
-        """Save as filename.hdf5"""
         with h5py.File(filename, "w") as f:
-            f["data"] = self.data
+            dataset = f.create_dataset(
+                "data",
+                shape=self.data.shape,
+                dtype=self.data.dtype,
+                chunks=chunks,
+                compression=compression,
+                compression_opts=compression_opts,
+            )
+            # Copy block by block, as `data` may itself be backed by a file
+            block_size = max(chunks[-1] if chunks else 0, 2**20)
+            for start in range(0, n_samples, block_size):
+                block = self.data[..., start : start + block_size]
+                dataset[..., start : start + block_size] = block
+
             f.attrs["sample_rate"] = self.sample_rate
+            if self.start_time is not None:
+                f.attrs["start_time"] = self.start_time.isoformat()
+            if self.units is not None:
+                f.attrs["units"] = self.units
+            if self.channel_names is not None:
+                f.attrs["channel_names"] = self.channel_names
 
     @classmethod
-    def load(cls, filename: str) -> Signal:
-        """Load from filename.hdf5"""
+    def load(cls, filename: str, lazy: bool = False) -> Signal:
+        """Load from filename.hdf5
+
+        If `lazy`, returns a :class:`LazySignal` reading samples from the file on access.
+        """
+        if lazy:
+            return LazySignal.open(filename)
+
         with h5py.File(filename, "r") as f:
-            return cls(
-                data=f["data"],
-                sample_rate=int(f.attrs["sample_rate"]),
-            )
+            return cls(data=f["data"], **_read_metadata(f))
 
     @classmethod
-    def from_csv(cls, filename: str, sample_rate: int):
-        data = pd.read_csv(filename).to_numpy()[0]
-        return cls(data=data, sample_rate=sample_rate)
+    def from_csv(
+        cls,
+        filename: str,
+        sample_rate: int,
+        row: int = 0,
+        column: Optional[Column] = None,
+        dtype=np.float64,
+        delimiter: str = ",",
+        header: bool = True,
+        engine: Optional[str] = None,
+    ) -> Signal:
+        """Load a single channel from a CSV file.
+
+        Parameters
+        ----------
+        filename : str
+            Path or URL of the file.
+        sample_rate : int
+            Sample rate of the signal in hertz.
+        row : int, default: 0
+            Index of the row holding the signal, not counting the header,
+            unless `column` is given.
+        column : int or str, optional
+            Position or header name of the column holding the signal.
+        dtype : default: np.float64
+            Data type of the signal, e.g. `np.float32` to halve memory use.
+        delimiter : str, default: ","
+            Field delimiter.
+        header : bool, default: True
+            Whether the first line holds column names.
+        engine : str, optional
+            Parser engine of `pd.read_csv` for columns, e.g. "pyarrow" if installed.
+            Rows are parsed by `np.fromstring`, without creating a dataframe column per sample.
+        """
+        if column is None:
+            data = _read_row(filename, row, dtype, delimiter, header)
+            return cls(data=data, sample_rate=sample_rate)
+
+        return read_channels(
+            filename, sample_rate, [column], dtype, delimiter, header, engine=engine
+        ).popitem()[1]
 
     @classmethod
-    def from_txt(cls, filename: str, sample_rate: int):
-        data = np.loadtxt(filename)
-        return cls(data=data, sample_rate=sample_rate)
+    def from_txt(
+        cls,
+        filename: str,
+        sample_rate: int,
+        row: Optional[int] = None,
+        column: Optional[Column] = None,
+        dtype=np.float64,
+        delimiter: Optional[str] = None,
+        comment: Optional[str] = "#",
+        engine: Optional[str] = None,
+    ) -> Signal:
+        """Load a single channel from a text file without header.
+
+        Values are separated by whitespace, unless `delimiter` is given,
+        and text following `comment` is ignored.
+        Reads column `column` or row `row`. Without either, the file must hold
+        a single row or a single column of samples, which is read as the signal.
+        Other parameters are as in :meth:`from_csv`.
+        """
+        if row is None and column is None:
+            n_rows, n_columns = _text_shape(filename, delimiter, comment)
+            if n_rows == 1:
+                row = 0
+            elif n_columns == 1:
+                column = 0
+            else:
+                raise ValueError(
+                    f"{filename} holds several rows and columns, select one by row or column."
+                )
+
+        if column is None:
+            assert row is not None
+            data = _read_row(filename, row, dtype, delimiter, header=False, comment=comment)
+            return cls(data=data, sample_rate=sample_rate)
+
+        return read_channels(
+            filename, sample_rate, [column], dtype, delimiter, False, comment, engine
+        ).popitem()[1]
+
+
+@dataclasses.dataclass
+class LazySignal(Signal):
+    """Signal whose data remains on disk until accessed.
+
+    `data` is an open `h5py.Dataset` or a `np.memmap`, which support `len` and slicing,
+    so that only the accessed samples are read.
+    Slicing returns in-memory arrays, see also :meth:`Signal.time_slice`.
+    Functions that process windows, such as :func:`rapidhrv.preprocess_blocks`
+    and the "loop" engine of :func:`rapidhrv.analyze`, therefore read one window at a time.
+
+    HDF5 backed signals keep their file open until :meth:`close` is called,
+    or the signal is used as a context manager.
+    """
+
+    def __post_init__(self):
+        pass
+
+    @classmethod
+    def open(cls, filename: str) -> LazySignal:
+        """Opens a file saved by :meth:`Signal.save`."""
+        f = h5py.File(filename, "r")
+        return cls(data=f["data"], **_read_metadata(f))
+
+    @classmethod
+    def from_memmap(
+        cls, filename: str, sample_rate: int, dtype=np.float64, offset: int = 0
+    ) -> LazySignal:
+        """Maps a raw binary file of samples with `dtype`, starting at byte `offset`."""
+        return cls(
+            data=np.memmap(filename, dtype=dtype, mode="r", offset=offset), sample_rate=sample_rate
+        )
+
+    def close(self) -> None:
+        """Closes the underlying HDF5 file, if any."""
+        if isinstance(self.data, h5py.Dataset) and self.data.id.valid:
+            self.data.file.close()
+
+    def __enter__(self) -> LazySignal:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _read_metadata(f: h5py.File) -> dict:
+    """Keyword arguments of `Signal` stored in the attributes of an HDF5 file."""
+    metadata: dict[str, Any] = {"sample_rate": int(f.attrs["sample_rate"])}
+    if "start_time" in f.attrs:
+        metadata["start_time"] = datetime.datetime.fromisoformat(f.attrs["start_time"])
+    if "units" in f.attrs:
+        metadata["units"] = str(f.attrs["units"])
+    if "channel_names" in f.attrs:
+        metadata["channel_names"] = [str(name) for name in f.attrs["channel_names"]]
+    return metadata
+
+
+def read_channels(
+    filename: str,
+    sample_rate: int,
+    columns: Optional[Sequence[Column]] = None,
+    dtype=np.float64,
+    delimiter: Optional[str] = ",",
+    header: bool = True,
+    comment: Optional[str] = None,
+    engine: Optional[str] = None,
+) -> dict[Column, Signal]:
+    """Loads several channels from the columns of a text file in a single pass.
+
+    Parameters
+    ----------
+    filename : str
+        Path or URL of the file.
+    sample_rate : int
+        Sample rate of all channels in hertz.
+    columns : sequence of int or str, optional
+        Positions or header names (in files with a header) of the columns to load,
+        by default all.
+    delimiter : str, optional, default: ","
+        Field delimiter, or None for whitespace.
+    comment : str, optional
+        Character starting comments to be ignored.
+    dtype, header, engine
+        As in :meth:`Signal.from_csv`.
+
+    Returns
+    -------
+    dict
+        Signals by header name, or by position if the file has no header.
+    """
+    frame = _read_columns(filename, columns, dtype, delimiter, header, comment, engine)
+    return {
+        name: Signal(
+            data=frame[name].to_numpy(), sample_rate=sample_rate, channel_names=[str(name)]
+        )
+        for name in frame.columns
+    }
+
+
+def convert_to_hdf5(
+    filename: str,
+    outputs: Mapping[Column, str],
+    sample_rate: int,
+    dtype=np.float64,
+    delimiter: Optional[str] = ",",
+    header: bool = True,
+    comment: Optional[str] = None,
+    chunk_size: int = 2**20,
+    compression: Optional[str] = None,
+) -> None:
+    """Converts columns of a text file to HDF5 files readable by :meth:`Signal.load`.
+
+    The text file is parsed in a single pass, `chunk_size` lines at a time,
+    so that neither it nor the signals are ever held in memory entirely.
+
+    Parameters
+    ----------
+    filename : str
+        Path or URL of the text file.
+    outputs : mapping of int or str to str
+        Path of the HDF5 file by position or header name of the column to be converted.
+    sample_rate : int
+        Sample rate of all channels in hertz.
+    chunk_size : int, default: 2**20
+        Number of lines parsed at once.
+    compression : str, optional
+        As in :meth:`Signal.save`.
+    dtype, delimiter, header, comment
+        As in :func:`read_channels`.
+    """
+    columns = list(outputs)
+    chunks = _read_columns(
+        filename, columns, dtype, delimiter, header, comment, chunk_size=chunk_size
+    )
+    with contextlib.ExitStack() as stack:
+        datasets = []
+        for column in columns:
+            f = stack.enter_context(h5py.File(outputs[column], "w"))
+            f.attrs["sample_rate"] = sample_rate
+            f.attrs["channel_names"] = [str(column)]
+            datasets.append(
+                f.create_dataset(
+                    "data",
+                    shape=(0,),
+                    maxshape=(None,),
+                    dtype=dtype,
+                    chunks=(min(chunk_size, 2**16),),
+                    compression=compression,
+                )
+            )
+
+        for chunk in chunks:
+            for dataset, values in zip(datasets, chunk.to_numpy().T):
+                n_samples = len(dataset)
+                dataset.resize((n_samples + len(values),))
+                dataset[n_samples:] = values
+
+
+def _open_text(filename: str) -> TextIO:
+    filename = os.fspath(filename)
+    if filename.startswith(("http://", "https://")):
+        return io.TextIOWrapper(urllib.request.urlopen(filename), encoding="utf-8")
+    return open(filename)
+
+
+def _data_lines(f: TextIO, comment: Optional[str]) -> Iterator[str]:
+    """Non-empty lines of `f` without comments, which `pd.read_csv` skips likewise."""
+    for line in f:
+        if comment is not None:
+            line = line.split(comment, 1)[0]
+        if line.strip():
+            yield line
+
+
+def _text_shape(filename: str, delimiter: Optional[str], comment: Optional[str]) -> tuple:
+    """Number of rows of a text file, counted up to two, and fields of its first row."""
+    with _open_text(filename) as f:
+        lines = list(itertools.islice(_data_lines(f, comment), 2))
+    if not lines:
+        raise ValueError(f"{filename} holds no data.")
+    return len(lines), len(lines[0].split(delimiter))
+
+
+def _read_row(
+    filename: str,
+    row: int,
+    dtype,
+    delimiter: Optional[str],
+    header: bool,
+    comment: Optional[str] = None,
+) -> np.ndarray:
+    """Parses a single row of a text file, without parsing any other."""
+    with _open_text(filename) as f:
+        line = next(itertools.islice(_data_lines(f, comment), row + header, None), None)
+    if line is None:
+        raise ValueError(f"{filename} has no row {row}.")
+
+    try:
+        with warnings.catch_warnings():
+            # Raised by `np.fromstring` for fields it cannot parse, such as empty ones
+            warnings.simplefilter("error", DeprecationWarning)
+            data = np.fromstring(line, dtype=dtype, sep=delimiter or " ")
+        if len(data) == len(line.split(delimiter)):
+            return data
+    except (ValueError, DeprecationWarning):
+        pass
+
+    frame = pd.read_csv(
+        io.StringIO(line), sep=delimiter or r"\s+", header=None, dtype=dtype, engine="c"
+    )
+    return frame.to_numpy()[0]
+
+
+def _read_columns(
+    filename: str,
+    columns: Optional[Sequence[Column]],
+    dtype,
+    delimiter: Optional[str],
+    header: bool,
+    comment: Optional[str] = None,
+    engine: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+):
+    """Parses `columns` of a text file, as a dataframe or an iterator of chunks of it.
+
+    The columns of the result are ordered as `columns`.
+    """
+    if columns is not None and any(isinstance(column, str) for column in columns):
+        if not header:
+            raise ValueError("Columns can only be selected by name in files with a header.")
+        if not all(isinstance(column, str) for column in columns):
+            # `usecols` takes either positions or names, so names are converted to positions
+            names = list(
+                pd.read_csv(filename, sep=delimiter or r"\s+", nrows=0, comment=comment).columns
+            )
+            for column in columns:
+                if isinstance(column, str) and column not in names:
+                    raise ValueError(f"{filename} has no column named {column!r}.")
+            columns = [names.index(c) if isinstance(c, str) else c for c in columns]
+
+    reader = pd.read_csv(
+        filename,
+        sep=delimiter or r"\s+",
+        header=0 if header else None,
+        usecols=columns,
+        dtype=dtype,
+        comment=comment,
+        engine=engine,
+        chunksize=chunk_size,
+    )
+    if columns is None:
+        return reader
+
+    def reorder(frame: pd.DataFrame) -> pd.DataFrame:
+        # Columns selected by position come in file order, which `np.argsort` recovers
+        if all(isinstance(column, (int, np.integer)) for column in columns):
+            return frame.iloc[:, np.argsort(np.argsort(columns))]
+        return frame[list(columns)]
+
+    return reorder(reader) if chunk_size is None else map(reorder, reader)
 
 
 def get_example_data() -> Signal:
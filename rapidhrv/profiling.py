@@ -0,0 +1,164 @@
+"""Opt-in instrumentation of the stages of `preprocess` and `analyze`."""
+
+import contextlib
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any, ContextManager, Optional
+
+import pandas as pd
+
+SUMMARY_COLUMNS = ["calls", "seconds", "mean_seconds", "max_seconds", "size", "memory", "peak"]
+
+_profilers: list["Profiler"] = []  # Active profilers, outermost first
+_lock = threading.Lock()
+_local = threading.local()  # Stacks of the stages entered by each thread
+_disabled = contextlib.nullcontext()
+
+
+def stage(name: str, size: int = 0) -> ContextManager:
+    """Context manager recording a stage with `name`, processing `size` samples or values.
+
+    Returns a shared no-op context manager unless a :class:`Profiler` is active.
+    """
+    if not _profilers:
+        return _disabled
+    return _Stage(name, size)
+
+
+class Profiler:
+    """Records wall time, calls, input sizes and optionally memory of pipeline stages.
+
+    Stages are recorded while the profiler is used as a context manager.
+    They are "preprocess", with "resample", "filter" and "smooth",
+    and "analyze", with "peak_detection" (including "clustering"),
+    "frequency_domain" and "outlier_detection",
+    once per window in the "loop" engine and once per analysis in the other engines.
+
+    Profilers may be nested, e.g. around a batch and around each of its recordings,
+    and all active profilers record every stage, including stages run by worker threads
+    of :func:`analyze`. Worker processes are not profiled.
+
+    Parameters
+    ----------
+    sink : callable, optional
+        Called with a dict of every stage, holding the `label` of the profiler,
+        the "stage", its "seconds", "size" and, if traced, "memory" and "peak".
+        For example, `logging.getLogger(...).info`, or a method of a metrics client.
+    trace_memory : bool, default: False
+        Trace memory allocations with `tracemalloc`, which slows down allocations.
+        "memory" is the net change in allocated bytes over a stage
+        and "peak" the peak of allocated bytes within it, above those at its start.
+        Memory is traced for the whole process, so overlaps between worker threads.
+    label : optional
+        Identifies the profiled work in records passed to `sink`, such as a recording.
+
+    Attributes
+    ----------
+    stats : dict
+        Calls, total, mean and maximum seconds, total size, total memory and maximum peak
+        by stage, see :meth:`summary`.
+    """
+
+    def __init__(
+        self,
+        sink: Optional[Callable[[dict], Any]] = None,
+        trace_memory: bool = False,
+        label: Any = None,
+    ):
+        self.sink = sink
+        self.trace_memory = trace_memory
+        self.label = label
+        self.stats: dict[str, dict[str, float]] = {}
+        self._started_tracing = False
+
+    def __enter__(self) -> "Profiler":
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        with _lock:
+            _profilers.append(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        with _lock:
+            _profilers.remove(self)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def record(self, name: str, seconds: float, size: int, memory=None, peak=None) -> None:
+        """Adds a stage to `stats` and passes it to `sink`."""
+        with _lock:
+            stats = self.stats.setdefault(
+                name, {column: 0.0 for column in SUMMARY_COLUMNS if column != "mean_seconds"}
+            )
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["size"] += size
+            if memory is not None:
+                stats["memory"] += memory
+                stats["peak"] = max(stats["peak"], peak)
+
+        if self.sink is not None:
+            record = {"label": self.label, "stage": name, "seconds": seconds, "size": size}
+            if memory is not None:
+                record.update(memory=memory, peak=peak)
+            self.sink(record)
+
+    def summary(self) -> pd.DataFrame:
+        """Statistics of every recorded stage, with columns `SUMMARY_COLUMNS`.
+
+        Use e.g. `summary().to_dict("index")` for a structured export.
+        """
+        summary = pd.DataFrame.from_dict(self.stats, orient="index")
+        if summary.empty:
+            return pd.DataFrame(columns=SUMMARY_COLUMNS)
+        summary["mean_seconds"] = summary["seconds"] / summary["calls"]
+        summary = summary[SUMMARY_COLUMNS].astype(
+            {"calls": int, "size": int, "memory": int, "peak": int}
+        )
+        summary.index.name = "stage"
+        return summary.sort_values("seconds", ascending=False)
+
+
+class _Stage:
+    __slots__ = ("name", "size", "started", "memory", "peak")
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.memory: Optional[int] = None  # Allocated bytes on entry, if traced
+        self.peak = 0
+
+    def __enter__(self) -> None:
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        if tracemalloc.is_tracing():
+            self.memory, peak = tracemalloc.get_traced_memory()
+            if stack:  # The enclosing stage's peak so far, before resetting it
+                stack[-1].peak = max(stack[-1].peak, peak)
+            self.peak = self.memory
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self.started
+        stack = _local.stack
+        stack.pop()
+
+        memory = peak = None
+        if tracemalloc.is_tracing() and self.memory is not None:
+            current, traced_peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, traced_peak)
+            memory, peak = current - self.memory, self.peak - self.memory
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            tracemalloc.reset_peak()
+
+        for profiler in list(_profilers):
+            profiler.record(self.name, seconds, self.size, memory, peak)
@@ -0,0 +1,177 @@
+"""Compact storage of analysis results in HDF5 files."""
+
+from typing import Optional, Union
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from .analysis import DATA_COLUMNS, EXTENDED_FREQUENCY_COLUMNS, OUTLIER_CRITERIA, LazyWindow
+from .data import Signal
+
+
+def save_results(
+    results: pd.DataFrame,
+    filename: str,
+    sample_rate: Optional[int] = None,
+    group: str = "results",
+    compression: Optional[str] = None,
+) -> None:
+    """Saves the output of :func:`rapidhrv.analyze` to an HDF5 file.
+
+    Metrics are stored as float32, outlier flags as bool and outlier criteria as int8 codes
+    of `OUTLIER_CRITERIA` (-1 for None).
+    The "Channel" column of multi-channel results is stored as integers or strings.
+    The peaks and peak properties of the "Window" column, if present,
+    are stored in flat arrays with offsets delimiting windows,
+    while normalized windows are omitted, as they are recomputed from the signal on loading.
+
+    Results are written to `group`, replacing any previous results in it,
+    so that they may share a file with the analyzed signal saved by :meth:`Signal.save`.
+    As that method overwrites files, save the signal first.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        Analysis results.
+    filename : str
+        Path of the HDF5 file, created if it does not exist.
+    sample_rate : int, optional
+        Sample rate of the analyzed signal, required to store windows
+        unless the file holds the signal.
+    group : str, default: "results"
+        HDF5 group of the results.
+    compression : str, optional
+        HDF5 compression filter, e.g. "gzip" or "lzf".
+    """
+    metric_columns = [
+        column for column in (*DATA_COLUMNS, *EXTENDED_FREQUENCY_COLUMNS) if column in results
+    ]
+    criterion_codes = {criterion: code for code, criterion in enumerate(OUTLIER_CRITERIA)}
+
+    with h5py.File(filename, "a") as f:
+        if group in f:
+            del f[group]
+        results_group = f.create_group(group)
+
+        def create(name, data, parent=results_group):
+            parent.create_dataset(name, data=data, compression=compression)
+
+        time = results["Time"].to_numpy()
+        create("time", time.astype(np.int64) if np.all(time == np.round(time)) else time)
+        create("metrics", results[metric_columns].to_numpy(dtype=np.float32))
+        results_group["metrics"].attrs["columns"] = metric_columns
+        if "Channel" in results:
+            channels = results["Channel"].to_numpy()
+            if not np.issubdtype(channels.dtype, np.integer):  # Channel names
+                channels = channels.astype(str).astype(h5py.string_dtype())
+            create("channel", channels)
+        create("outlier", results["Outlier"].to_numpy(dtype=bool))
+        create(
+            "outlier_criterion",
+            np.array(
+                [criterion_codes.get(c, -1) for c in results["Outlier Criterion"]], dtype=np.int8
+            ),
+        )
+
+        if "Window" not in results:
+            return
+
+        if sample_rate is None:
+            if "sample_rate" not in f.attrs:
+                raise ValueError("Parameter 'sample_rate' is required to save windows.")
+            sample_rate = int(f.attrs["sample_rate"])
+        results_group.attrs["sample_rate"] = sample_rate
+
+        starts = np.round(time * sample_rate).astype(np.int64)
+        ends = np.empty_like(starts)
+        all_peaks, all_properties = [], []
+        for i, window in enumerate(results["Window"]):
+            if isinstance(window, LazyWindow):
+                ends[i] = starts[i] + window.end - window.start
+                peaks, properties = window.peaks, window.properties
+            else:
+                normalized, peaks, properties = window
+                ends[i] = starts[i] + len(normalized)
+            all_peaks.append(peaks)
+            all_properties.append(properties)
+
+        create("window_bounds", np.column_stack((starts, ends)))
+        create("offsets", np.cumsum([0, *map(len, all_peaks)]))
+        create("peaks", np.concatenate(all_peaks) if all_peaks else np.empty(0, dtype=np.int64))
+        properties_group = results_group.create_group("properties")
+        for key in all_properties[0] if all_properties else []:
+            create(key, np.concatenate([p[key] for p in all_properties]), properties_group)
+
+
+def load_results(
+    filename: str, group: str = "results", signal: Union[Signal, bool, None] = None
+) -> pd.DataFrame:
+    """Loads analysis results saved by :func:`save_results`.
+
+    Metrics keep their stored float32 type.
+    Peaks and peak properties of windows are views of flat arrays, without a copy per window.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the HDF5 file.
+    group : str, default: "results"
+        HDF5 group of the results.
+    signal : Signal or bool, optional
+        The analyzed signal, from which "Window" entries normalize windows on demand,
+        as :class:`LazyWindow` entries of :func:`rapidhrv.analyze`.
+        By default the signal is loaded if the file holds one, see :meth:`Signal.save`.
+        Without signal, or if False, windows are tuples of None, peaks and properties,
+        sufficient to detect outliers again.
+
+    Returns
+    -------
+    pd.DataFrame
+        Analysis results, with a "Window" column if windows were saved.
+    """
+    with h5py.File(filename, "r") as f:
+        results_group = f[group]
+        metrics = results_group["metrics"]
+        codes = results_group["outlier_criterion"][()]
+        criteria = np.array([*OUTLIER_CRITERIA, None], dtype=object)[codes]
+
+        results = pd.DataFrame({"Time": results_group["time"][()]})
+        for i, column in enumerate(metrics.attrs["columns"]):
+            results[str(column)] = metrics[:, i]
+        if "channel" in results_group:
+            channels = results_group["channel"]
+            channels = channels.asstr()[()] if channels.dtype.kind == "O" else channels[()]
+            results.insert(0, "Channel", channels)
+        results["Outlier"] = results_group["outlier"][()]
+        results["Outlier Criterion"] = criteria
+
+        if "offsets" not in results_group:
+            return results
+
+        bounds = results_group["window_bounds"][()]
+        offsets = results_group["offsets"][()]
+        peaks = results_group["peaks"][()]
+        properties = {key: dataset[()] for key, dataset in results_group["properties"].items()}
+        if signal is None and "data" in f:
+            signal = Signal.load(filename)
+
+    window_data: list = [None] * len(bounds)
+    if isinstance(signal, Signal) and signal.data.ndim > 1:
+        # Window bounds of multi-channel results are positions within their own channel
+        channel_data = {key: signal.channel(key).data for key in results["Channel"].unique()}
+        window_data = [channel_data[key] for key in results["Channel"]]
+    elif isinstance(signal, Signal):
+        window_data = [signal.data] * len(bounds)
+
+    windows: list = []
+    for (start, end), first, last, data in zip(bounds, offsets[:-1], offsets[1:], window_data):
+        window_properties = {key: values[first:last] for key, values in properties.items()}
+        if data is not None:
+            windows.append(
+                LazyWindow(data, int(start), int(end), peaks[first:last], window_properties)
+            )
+        else:
+            windows.append((None, peaks[first:last], window_properties))
+    results["Window"] = windows
+    return results
@@ -0,0 +1,308 @@
+import collections
+import time
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import scipy.interpolate
+import scipy.signal
+
+from .analysis import DATA_COLUMNS, _analyze_window
+from .data import OutlierDetectionSettings
+from .preprocessing import _butterworth_design, _savgol_design
+
+STREAMING_COLUMNS = ["Time", *DATA_COLUMNS, "Outlier", "Outlier Criterion"]
+# Chunks are filtered by direct convolution below this many multiplications, by FFT above
+DIRECT_CONVOLUTION_LIMIT = 2**20
+
+
+class StreamingAnalyzer:
+    """Incremental analysis of a live cardiac signal.
+
+    Successive chunks of raw samples are passed to :meth:`update`,
+    which preprocesses them causally and returns a row of results for every window
+    completed by the chunk, with the columns `STREAMING_COLUMNS`.
+    Windows are analyzed exactly as by :func:`rapidhrv.analyze` (with the "loop" engine),
+    so each update costs time proportional to the chunk and the windows it completes,
+    independently of the length of the stream.
+    The FIR filter below costs time proportional to its length for every sample
+    of a short chunk, which it convolves directly, and switches to FFT convolution
+    for chunks longer than about `DIRECT_CONVOLUTION_LIMIT` divided by its length
+    (4101 taps at 1000 Hz with default settings, so about 250 samples).
+
+    Preprocessing approximates :func:`rapidhrv.preprocess` with the same settings:
+
+    - Cubic spline interpolation is evaluated over the most recent input samples,
+      lagging `spline_lag` input samples behind the stream.
+    - The Butterworth filters are replaced by a linear-phase FIR filter
+      with the magnitude response of their zero-phase application in `sosfiltfilt`,
+      lagging `filter_delay` seconds behind the stream.
+      If `filter_delay` is zero, they run forward only (`scipy.signal.sosfilt`) instead,
+      which distorts the waveform and so interbeat intervals.
+    - Savitzky-Golay smoothing is applied as the equivalent FIR filter,
+      lagging half its window behind the stream.
+
+    Filter delays are compensated for in timestamps,
+    but a window is only reported once the stream extends :attr:`delay` seconds beyond it.
+    With default settings, per-window metrics typically agree with offline analysis
+    to within a millisecond (RMSSD) and 0.01 BPM, away from the very start of the stream.
+    Processing time is accumulated in :attr:`stats` to measure throughput and latency.
+
+    Parameters
+    ----------
+    sample_rate : int
+        Sample rate in hertz of the raw stream.
+    resample_rate, highpass_cutoff, lowpass_cutoff, sg_settings
+        As in :func:`rapidhrv.preprocess`.
+    window_width, window_overlap, amplitude_threshold, distance_threshold, n_required_peaks,
+    ecg_prt_clustering, outlier_detection_settings
+        As in :func:`rapidhrv.analyze`.
+    filter_delay : float, default: 2
+        Half the duration in seconds of the FIR filter replacing the Butterworth filters,
+        trading latency for agreement with offline filtering.
+    spline_lag : int, default: 3
+        Number of input samples beyond which interpolation is deferred,
+        trading latency for agreement with offline interpolation.
+    max_peaks : int, default: 1000
+        Number of most recent peaks kept in :attr:`peaks`.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        resample_rate: Optional[int] = 1000,
+        highpass_cutoff: Optional[float] = 0.5,
+        lowpass_cutoff: Optional[float] = None,
+        sg_settings: Optional[tuple[int, int]] = (3, 100),
+        window_width: int = 10,
+        window_overlap: int = 0,
+        ecg_prt_clustering: bool = False,
+        amplitude_threshold: int = 50,
+        distance_threshold: int = 250,
+        n_required_peaks: int = 3,
+        outlier_detection_settings: Union[str, OutlierDetectionSettings] = "moderate",
+        filter_delay: float = 2,
+        spline_lag: int = 3,
+        max_peaks: int = 1000,
+    ):
+        if n_required_peaks < 3:
+            raise ValueError("Parameter 'n_required_peaks' must be greater than three.")
+        if window_overlap >= window_width:
+            raise ValueError("Parameter 'window_overlap' must be smaller than 'window_width'.")
+
+        self.input_rate = sample_rate
+        if resample_rate is not None and resample_rate > sample_rate:
+            if resample_rate % sample_rate != 0:
+                raise RuntimeError(
+                    f"Cannot resample from {sample_rate = }Hz to {resample_rate = }Hz: "
+                    f"{resample_rate % sample_rate = } must be zero."
+                )
+            self.sample_rate = resample_rate
+        else:
+            self.sample_rate = sample_rate
+        self._sample_ratio = self.sample_rate // sample_rate
+        self._spline_lag = spline_lag if self._sample_ratio > 1 else 0
+
+        # Filter designs, shared with `rapidhrv.preprocessing`
+        sos = [
+            _butterworth_design(self.sample_rate, cutoff, filter_type)
+            for cutoff, filter_type in ((highpass_cutoff, "highpass"), (lowpass_cutoff, "lowpass"))
+            if cutoff is not None
+        ]
+        fir = np.ones(1)
+        self._sos: Optional[np.ndarray] = None
+        self._sos_state: Optional[np.ndarray] = None
+        if sos and filter_delay > 0:
+            fir = _linear_phase_approximation(
+                np.vstack(sos), 2 * round(filter_delay * self.sample_rate) + 1, self.sample_rate
+            )
+        elif sos:
+            self._sos = np.vstack(sos)
+
+        if sg_settings:
+            *_, coeffs = _savgol_design(self.sample_rate, tuple(sg_settings))
+            fir = np.convolve(fir, coeffs)
+
+        self._fir = _StreamingFIR(fir)
+        self._fir_delay = len(fir) // 2
+        self._fir_discard = self._fir_delay  # Startup samples of the FIR filter to drop
+
+        # Analysis settings, matching `rapidhrv.analyze`
+        self.outlier_detection_settings = (
+            OutlierDetectionSettings.from_method(outlier_detection_settings)
+            if isinstance(outlier_detection_settings, str)
+            else outlier_detection_settings
+        )
+        self.window_width = window_width
+        self.ecg_prt_clustering = ecg_prt_clustering
+        self.n_required_peaks = n_required_peaks
+        if ecg_prt_clustering:
+            self._distance, self._prominence = 1, 5
+        else:
+            self._distance = int((distance_threshold / 1000) * self.sample_rate)
+            self._prominence = amplitude_threshold
+        self._window_size = window_width * self.sample_rate
+        self._step = (window_width - window_overlap) * self.sample_rate
+
+        # Stream state
+        self._input_tail = np.empty(0)  # Most recent raw samples, for interpolation
+        self._n_input = 0  # Raw samples received
+        self._n_interpolated = 0  # Samples interpolated (at `sample_rate`)
+        self._buffer = _RingBuffer(self._window_size + self._step)  # Preprocessed samples
+        self._next_window = 0  # First sample of the next window
+        self.peaks: collections.deque = collections.deque(maxlen=max_peaks)
+        """Sample indexes (at `sample_rate`) of peaks in the most recent windows."""
+        self.stats = {"samples": 0, "updates": 0, "windows": 0, "seconds": 0.0, "latency": 0.0}
+        """Number of raw samples, updates and windows processed, total processing time
+        and the processing time of the latest update in seconds."""
+
+    @property
+    def throughput(self) -> float:
+        """Raw samples processed per second of processing time."""
+        return self.stats["samples"] / self.stats["seconds"] if self.stats["seconds"] else np.nan
+
+    @property
+    def delay(self) -> float:
+        """Stream time in seconds by which reported windows lag behind the raw samples."""
+        return self._spline_lag / self.input_rate + self._fir_delay / self.sample_rate
+
+    def update(self, chunk) -> pd.DataFrame:
+        """Processes a chunk of raw samples.
+
+        Returns
+        -------
+        pd.DataFrame
+            Results of the windows completed by this chunk,
+            with the columns `STREAMING_COLUMNS` ("Time" being the start of the window).
+        """
+        started = time.perf_counter()
+        chunk = np.asarray(chunk, dtype=float)
+        if np.any(np.isnan(chunk)):
+            raise RuntimeError("Cannot analyze data containing NaN values.")
+
+        processed = self._filter(self._interpolate(chunk))
+        results = []
+        # Analyze windows as they complete, so that none is overwritten in the buffer
+        for position in range(0, len(processed), self._step):
+            self._buffer.extend(processed[position : position + self._step])
+            while self._buffer.end >= self._next_window + self._window_size:
+                results.append(self._analyze_next_window())
+
+        elapsed = time.perf_counter() - started
+        self.stats["samples"] += len(chunk)
+        self.stats["updates"] += 1
+        self.stats["windows"] += len(results)
+        self.stats["seconds"] += elapsed
+        self.stats["latency"] = elapsed
+        return pd.DataFrame(results, columns=STREAMING_COLUMNS)
+
+    def _interpolate(self, chunk: np.ndarray) -> np.ndarray:
+        if self._sample_ratio == 1:
+            return chunk
+
+        # Interpolate up to `spline_lag` samples before the end of the received data,
+        # with enough preceding samples for the spline to match offline interpolation.
+        context = np.concatenate((self._input_tail, chunk))
+        context_start = self._n_input - len(self._input_tail)
+        self._n_input += len(chunk)
+        self._input_tail = context[-(4 * self._spline_lag + 4) :]
+
+        end = (self._n_input - self._spline_lag) * self._sample_ratio
+        if len(context) < 4 or end <= self._n_interpolated:
+            return np.empty(0)
+
+        knots = np.arange(context_start, self._n_input) * self._sample_ratio
+        b_spline = scipy.interpolate.make_interp_spline(knots, context)
+        interpolated = b_spline(np.arange(self._n_interpolated, end))
+        self._n_interpolated = end
+        return interpolated
+
+    def _filter(self, data: np.ndarray) -> np.ndarray:
+        if len(data) == 0:
+            return data
+
+        if self._sos is not None:
+            if self._sos_state is None:
+                self._sos_state = scipy.signal.sosfilt_zi(self._sos) * data[0]
+            data, self._sos_state = scipy.signal.sosfilt(self._sos, data, zi=self._sos_state)
+
+        # Drop the FIR filter's startup, aligning its centered output with the input
+        data = self._fir(data)
+        discard = min(self._fir_discard, len(data))
+        data, self._fir_discard = data[discard:], self._fir_discard - discard
+        return data
+
+    def _analyze_next_window(self) -> list:
+        start = self._next_window
+        segment = self._buffer.read(start, start + self._window_size)
+        metrics, criterion, _, (_, peaks, _) = _analyze_window(
+            segment,
+            self.sample_rate,
+            self.window_width,
+            self._distance,
+            self._prominence,
+            self.ecg_prt_clustering,
+            self.n_required_peaks,
+            self.outlier_detection_settings,
+        )
+
+        last_peak = self.peaks[-1] if self.peaks else -1
+        self.peaks.extend(peak for peak in start + peaks if peak > last_peak)
+        self._next_window += self._step
+        return [start / self.sample_rate, *metrics, criterion is not None, criterion]
+
+
+class _RingBuffer:
+    """Fixed-capacity buffer of the most recent samples of a stream."""
+
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity)
+        self.end = 0  # Number of samples written since the start of the stream
+
+    def extend(self, values: np.ndarray) -> None:
+        capacity = len(self._data)
+        if len(values) > capacity:
+            self.end += len(values) - capacity
+            values = values[-capacity:]
+
+        position = self.end % capacity
+        head = min(len(values), capacity - position)
+        self._data[position : position + head] = values[:head]
+        self._data[: len(values) - head] = values[head:]
+        self.end += len(values)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Copies samples `start` to `stop` of the stream, which must still be buffered."""
+        if start < self.end - len(self._data) or stop > self.end:
+            raise IndexError(f"Samples {start} to {stop} are not buffered.")
+        indexes = np.arange(start, stop) % len(self._data)
+        return self._data[indexes]
+
+
+class _StreamingFIR:
+    """FIR filter applied to successive chunks of a stream."""
+
+    def __init__(self, taps: np.ndarray):
+        self.taps = taps
+        self._history: Optional[np.ndarray] = None
+
+    def __call__(self, data: np.ndarray) -> np.ndarray:
+        if len(self.taps) == 1:
+            return data * self.taps[0]
+
+        if self._history is None:
+            # Start in steady state, as if the stream had been constant
+            self._history = np.full(len(self.taps) - 1, data[0])
+        extended = np.concatenate((self._history, data))
+        self._history = extended[len(data) :]
+        if len(data) * len(self.taps) < DIRECT_CONVOLUTION_LIMIT:
+            # Avoids transforming the whole history for a few new samples
+            return np.convolve(extended, self.taps, mode="valid")
+        return scipy.signal.oaconvolve(extended, self.taps, mode="valid")
+
+
+def _linear_phase_approximation(sos: np.ndarray, n_taps: int, sample_rate: int) -> np.ndarray:
+    """Linear-phase FIR filter approximating the zero-phase response of `sosfiltfilt`."""
+    freq = np.linspace(0, sample_rate / 2, 2 ** int(np.ceil(np.log2(n_taps))) + 1)
+    _, response = scipy.signal.sosfreqz(sos, worN=freq, fs=sample_rate)
+    return scipy.signal.firwin2(n_taps, freq, np.square(np.abs(response)), fs=sample_rate)
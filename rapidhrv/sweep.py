@@ -0,0 +1,176 @@
+"""Analysis of a signal under many parameter configurations, sharing work between them."""
+
+import itertools
+from collections.abc import Mapping, Sequence
+from typing import Any, Union
+
+import numpy as np
+import pandas as pd
+import scipy.signal
+
+from . import profiling, windowing
+from .analysis import _approximate_edge_prominences, _loop_frame, _peak_metrics, _window_starts
+from .data import OutlierDetectionSettings, Signal
+
+SWEEP_PARAMETERS = [
+    "amplitude_threshold",
+    "distance_threshold",
+    "n_required_peaks",
+    "outlier_detection_settings",
+]
+DEFAULTS = {
+    "window_width": 10,
+    "window_overlap": 0,
+    "amplitude_threshold": 50,
+    "distance_threshold": 250,
+    "n_required_peaks": 3,
+    "outlier_detection_settings": "moderate",
+    "extended_frequency_domain": False,
+    "peak_refinement": "none",
+}
+
+
+def sweep(
+    signal: Signal,
+    grid: Union[Mapping[str, Sequence], Sequence[Mapping[str, Any]]],
+    **analyze_kwargs,
+) -> pd.DataFrame:
+    """Analyzes `signal` under every configuration of a parameter grid.
+
+    Results equal those of :func:`rapidhrv.analyze` (with `window_output="none"`)
+    for every configuration, at a fraction of the cost of calling it for each:
+    windows are normalized and their candidate peaks and prominences are found once,
+    peaks are then selected by `distance_threshold` and `amplitude_threshold`,
+    and metrics are computed once for every distinct set of peaks of a window,
+    leaving only outlier detection to run for every configuration.
+
+    Parameters
+    ----------
+    signal : Signal
+        Preprocessed cardiac signal. Every channel of a multi-channel signal
+        is swept separately, see :func:`rapidhrv.analyze`.
+    grid : mapping of sequences, or sequence of mappings
+        Values of `SWEEP_PARAMETERS` by name, of which every combination is analyzed,
+        or a sequence of configurations, each holding some of `SWEEP_PARAMETERS`.
+    **analyze_kwargs
+        Parameters of :func:`rapidhrv.analyze` shared by all configurations:
+        `window_width`, `window_overlap`, `extended_frequency_domain` and `peak_refinement`,
+        and defaults of `SWEEP_PARAMETERS` missing from configurations.
+
+    Returns
+    -------
+    pd.DataFrame
+        Results of all configurations, concatenated in order,
+        with the value of every parameter of `grid` in leading columns named after it.
+    """
+    unknown = set(analyze_kwargs) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unsupported parameters: {', '.join(sorted(unknown))}.")
+    if isinstance(grid, Mapping):
+        configurations = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    else:
+        configurations = [dict(configuration) for configuration in grid]
+    swept = list(dict.fromkeys(key for c in configurations for key in c))
+    unknown = set(swept) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Parameters that cannot be swept: {', '.join(sorted(unknown))}.")
+
+    if signal.data.ndim > 1:
+        results = {
+            key: sweep(channel, configurations, **analyze_kwargs)
+            for key, channel in signal.channels().items()
+        }
+        return (
+            pd.concat(results, names=["Channel", None]).reset_index(level=0).reset_index(drop=True)
+        )
+
+    settings = {**DEFAULTS, **analyze_kwargs}
+    labels = [[{**settings, **c}[parameter] for parameter in swept] for c in configurations]
+    configurations = [{**settings, **c} for c in configurations]
+    for configuration in configurations:
+        if configuration["n_required_peaks"] < 3:
+            raise ValueError("Parameter 'n_required_peaks' must be greater than three.")
+        if isinstance(configuration["outlier_detection_settings"], str):
+            configuration["outlier_detection_settings"] = OutlierDetectionSettings.from_method(
+                configuration["outlier_detection_settings"]
+            )
+
+    window_width = settings["window_width"]
+    window_overlap = settings["window_overlap"]
+    sample_rate = signal.sample_rate
+    n_required_peaks = min(c["n_required_peaks"] for c in configurations)
+    detections: dict[tuple, list] = {_detection_key(c, sample_rate): [] for c in configurations}
+    distances = sorted({distance for distance, _ in detections})
+
+    # Peaks and metrics by window and detection settings
+    for start in _window_starts(signal, window_width, window_overlap):
+        segment = signal.data[start : start + window_width * sample_rate]
+        normalized = windowing.minmax_scale(segment)
+        with profiling.stage("peak_detection", len(segment)):
+            candidates, _ = scipy.signal.find_peaks(normalized, height=0)
+            prominences, _, _ = scipy.signal.peak_prominences(normalized, candidates)
+            by_distance = {
+                distance: np.searchsorted(
+                    candidates, scipy.signal.find_peaks(normalized, height=0, distance=distance)[0]
+                )
+                for distance in distances
+            }
+
+        # Windows often have the same peaks under several settings
+        computed: dict[bytes, tuple] = {}
+        for (distance, prominence), windows in detections.items():
+            selected = by_distance[distance]
+            selected = selected[prominences[selected] >= prominence]
+            if selected.tobytes() not in computed:
+                peaks = candidates[selected]
+                properties = {
+                    "peak_heights": normalized[peaks],
+                    "prominences": prominences[selected],
+                }
+                _approximate_edge_prominences(normalized, peaks, properties)
+                metrics, powers, ibi = _peak_metrics(
+                    normalized, peaks, sample_rate, n_required_peaks, settings["peak_refinement"]
+                )
+                computed[selected.tobytes()] = (metrics, powers, None, peaks, properties, ibi)
+            windows.append(computed[selected.tobytes()])
+
+    frames = []
+    for configuration, label in zip(configurations, labels):
+        windows = detections[_detection_key(configuration, sample_rate)]
+        if configuration["n_required_peaks"] > n_required_peaks:
+            windows = [
+                (
+                    _without_metrics(window)
+                    if len(window[3]) <= configuration["n_required_peaks"]
+                    else window
+                )
+                for window in windows
+            ]
+        frame = _loop_frame(
+            signal,
+            window_width,
+            window_overlap,
+            configuration["n_required_peaks"],
+            configuration["outlier_detection_settings"],
+            "none",
+            settings["extended_frequency_domain"],
+            windows,
+        )
+        for i, (parameter, value) in enumerate(zip(swept, label)):
+            frame.insert(i, parameter, [value] * len(frame))
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def _detection_key(configuration: dict, sample_rate: int) -> tuple:
+    """Minimum peak distance in samples and prominence, as in :func:`rapidhrv.analyze`."""
+    distance = int((configuration["distance_threshold"] / 1000) * sample_rate)
+    return distance, configuration["amplitude_threshold"]
+
+
+def _without_metrics(window: tuple) -> tuple:
+    """`window` as analyzed with too few peaks, see :func:`_peak_metrics`."""
+    metrics, powers, normalized, peaks, properties, ibi = window
+    nan_powers = {band: np.nan for band in powers}
+    return [np.nan] * len(metrics), nan_powers, normalized, peaks, properties, ibi
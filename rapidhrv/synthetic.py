@@ -0,0 +1,158 @@
+"""Deterministic synthetic cardiac signals, for testing and benchmarking without example data."""
+
+from typing import Literal
+
+import numpy as np
+
+from .data import Signal
+
+# Waves of a single beat, as (onset relative to the beat in seconds, amplitude, width in seconds)
+ECG_WAVES = {
+    "P": (-0.2, 0.15, 0.025),
+    "Q": (-0.03, -0.1, 0.01),
+    "R": (0.0, 1.0, 0.02),
+    "S": (0.03, -0.15, 0.01),
+    "T": (0.25, 0.3, 0.05),
+}
+PPG_WAVES = {
+    "systolic": (0.15, 1.0, 0.1),
+    "dicrotic": (0.45, 0.4, 0.12),
+}
+
+
+def synthetic_beats(
+    duration: float,
+    heart_rate: float = 60,
+    hrv: float = 50,
+    ectopic_rate: float = 0,
+    respiratory_rate: float = 0.25,
+    seed: int = 0,
+) -> np.ndarray:
+    """Generates beat times in seconds.
+
+    Interbeat intervals vary with respiration (respiratory sinus arrhythmia)
+    and randomly, each contributing half of their variance.
+
+    Parameters
+    ----------
+    duration : float
+        Duration in seconds.
+    heart_rate : float, default: 60
+        Mean heart rate in beats per minute.
+    hrv : float, default: 50
+        Standard deviation of interbeat intervals in milliseconds (excluding ectopic beats).
+    ectopic_rate : float, default: 0
+        Proportion of beats replaced by premature (ectopic) beats,
+        occurring after 60% of the interval and followed by a compensatory pause.
+    respiratory_rate : float, default: 0.25
+        Frequency in hertz of respiratory sinus arrhythmia.
+    seed : int, default: 0
+        Seed of the random number generator.
+    """
+    rng = np.random.default_rng(seed)
+    mean_ibi = 60 / heart_rate
+    n_beats = int(duration / mean_ibi * 1.5) + 2
+
+    phase = 2 * np.pi * respiratory_rate * mean_ibi * np.arange(n_beats)
+    variation = np.sin(phase) + np.sqrt(0.5) * rng.standard_normal(n_beats)
+    ibi = np.maximum(mean_ibi + hrv / 1000 * variation, 0.2)
+
+    ectopic = np.flatnonzero(rng.random(n_beats - 1) < ectopic_rate)
+    ectopic = ectopic[np.diff(ectopic, prepend=-2) > 1]  # No consecutive ectopic beats
+    ibi[ectopic + 1] += ibi[ectopic] * 0.4
+    ibi[ectopic] *= 0.6
+
+    beats = np.cumsum(ibi)
+    return beats[beats < duration]
+
+
+def synthetic_signal(
+    kind: Literal["ppg", "ecg"] = "ppg",
+    duration: float = 300,
+    sample_rate: int = 20,
+    heart_rate: float = 60,
+    hrv: float = 50,
+    noise: float = 0.02,
+    baseline_wander: float = 0.1,
+    ectopic_rate: float = 0,
+    t_wave_amplitude: float = 0.3,
+    amplitude_variability: float = 0.1,
+    seed: int = 0,
+) -> Signal:
+    """Generates a synthetic ECG or PPG signal.
+
+    Every beat is a sum of Gaussian waves (see `ECG_WAVES` and `PPG_WAVES`)
+    at the times given by :func:`synthetic_beats`, called with the same arguments,
+    to which baseline wander and white noise are added.
+
+    Parameters
+    ----------
+    kind : {"ppg", "ecg"}, default: "ppg"
+        Waveform of the signal.
+    duration : float, default: 300
+        Duration in seconds.
+    sample_rate : int, default: 20
+        Sample rate in hertz.
+    heart_rate, hrv, ectopic_rate
+        As in :func:`synthetic_beats`.
+    noise : float, default: 0.02
+        Standard deviation of white noise, relative to the amplitude of the main wave.
+    baseline_wander : float, default: 0.1
+        Amplitude of a 0.1Hz baseline oscillation, relative to the amplitude of the main wave.
+    t_wave_amplitude : float, default: 0.3
+        Amplitude of the T wave of ECG signals relative to the R wave.
+        Values above 1 produce T wave dominant morphologies.
+    amplitude_variability : float, default: 0.1
+        Standard deviation of the amplitude of beats, relative to their mean amplitude.
+    seed : int, default: 0
+        Seed of the random number generator.
+    """
+    if kind not in ("ppg", "ecg"):
+        raise ValueError(f"Invalid signal kind: {kind}.")
+
+    beats = synthetic_beats(duration, heart_rate, hrv, ectopic_rate, seed=seed)
+    n_samples = int(duration * sample_rate)
+
+    if kind == "ecg":
+        t_onset, _, t_width = ECG_WAVES["T"]
+        waves = {**ECG_WAVES, "T": (t_onset, t_wave_amplitude, t_width)}
+    else:
+        waves = PPG_WAVES
+
+    rng = np.random.default_rng([seed, 1])
+    scales = 1 + amplitude_variability * rng.standard_normal(len(beats))
+
+    data = np.zeros(n_samples)
+    for onset, amplitude, width in waves.values():
+        data += _gaussian_train(beats + onset, amplitude * scales, width, n_samples, sample_rate)
+
+    time = np.arange(n_samples) / sample_rate
+    data += baseline_wander * np.sin(2 * np.pi * 0.1 * time)
+    data += noise * rng.standard_normal(n_samples)
+    return Signal(data=data, sample_rate=sample_rate)
+
+
+def _gaussian_train(
+    centers: np.ndarray, amplitudes: np.ndarray, width: float, n_samples: int, sample_rate: int
+) -> np.ndarray:
+    """Sum of Gaussians at `centers` (seconds), evaluated within four widths of each center."""
+    half_span = int(np.ceil(4 * width * sample_rate))
+    offsets = np.arange(-half_span, half_span + 1)
+    result = np.zeros(n_samples)
+
+    # Blocks of beats bound the memory of the (beats x kernel) index array
+    block_size = max(1, 2**20 // len(offsets))
+    for block in range(0, len(centers), block_size):
+        block_centers = centers[block : block + block_size]
+        indexes = np.round(block_centers * sample_rate).astype(int)[:, None] + offsets
+        values = amplitudes[block : block + block_size, None] * np.exp(
+            -0.5 * np.square((indexes / sample_rate - block_centers[:, None]) / width)
+        )
+        valid = (indexes >= 0) & (indexes < n_samples)
+        if not np.any(valid):
+            continue
+        first = indexes[valid].min()
+        local = np.bincount(indexes[valid] - first, weights=values[valid])
+        result[first : first + len(local)] += local
+
+    return result
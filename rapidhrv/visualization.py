@@ -1,41 +1,97 @@
-import dash
-import pandas as pd
-import plotly.graph_objects as go
-from dash import dcc, html
-from dash.dependencies import Input, Output
+from typing import Optional
 
-import rapidhrv as rhv
+import numpy as np
+import pandas as pd
 
+try:
+    import dash
+    import plotly.graph_objects as go
+    from dash import dcc, html
+    from dash.dependencies import Input, Output, State
+except ImportError as error:
+    raise ImportError(
+        "Visualization requires Dash, install it with 'pip install rapidhrv[visualization]'."
+    ) from error
 
-def results_graph(non_outliers, outliers, selected_column):
-    fig = go.Figure(
-        [
-            go.Scatter(
-                x=non_outliers["Time"],
-                y=non_outliers[selected_column],
-                name=selected_column,
-                mode="lines+markers",
-            ),
-            go.Scatter(
-                x=outliers["Time"],
-                y=outliers[selected_column],
-                name="Outliers",
-                mode="markers",
-            ),
-        ]
-    )
+import rapidhrv as rhv
 
-    fig.update_layout(template="plotly_white", clickmode="event+select")
+MAX_POINTS = 2000  # Per trace, as the width of a large screen in pixels
+WEBGL_THRESHOLD = 1000  # Points from which traces are rendered by WebGL
+
+
+def min_max_indexes(values: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Positions of the minimum and maximum of `values` in each of `n_buckets` equal buckets.
+
+    Level of detail downsampling which preserves the extremes that a line plot
+    of `values` shows at a resolution of `n_buckets` pixels.
+    Returns all positions if there are no more than two per bucket.
+    """
+    n_values = len(values)
+    if n_values <= 2 * n_buckets:
+        return np.arange(n_values)
+
+    buckets = np.arange(n_values) * n_buckets // n_values
+    order = np.lexsort((values, buckets))
+    bounds = np.flatnonzero(np.diff(buckets[order], prepend=-1, append=n_buckets))
+    return np.unique(np.concatenate((order[bounds[:-1]], order[bounds[1:] - 1])))
+
+
+def results_graph(
+    non_outliers,
+    outliers,
+    selected_column,
+    x_range: Optional[tuple[float, float]] = None,
+    max_points: int = MAX_POINTS,
+):
+    """Figure of `selected_column` over time, downsampled to `max_points` within `x_range`.
+
+    Points hold their row label in `non_outliers` or `outliers` as custom data.
+    """
+    traces = []
+    for results, name, mode in (
+        (non_outliers, selected_column, "lines+markers"),
+        (outliers, "Outliers", "markers"),
+    ):
+        time = results["Time"].to_numpy()
+        values = results[selected_column].to_numpy()
+        rows = np.flatnonzero(~np.isnan(values))
+        if x_range is not None:
+            # Include the neighbours of the range, so that lines continue beyond it
+            first, last = np.searchsorted(time[rows], x_range)
+            rows = rows[max(first - 1, 0) : last + 1]
+        rows = rows[min_max_indexes(values[rows], max_points // 2)]
+
+        scatter = go.Scattergl if len(rows) >= WEBGL_THRESHOLD else go.Scatter
+        traces.append(
+            scatter(
+                x=time[rows],
+                y=values[rows],
+                customdata=results.index[rows],
+                name=name,
+                mode=mode,
+            )
+        )
+
+    fig = go.Figure(traces)
+
+    # Keep the zoom when the figure is redrawn for another range
+    fig.update_layout(template="plotly_white", clickmode="event+select", uirevision=True)
     fig.update_traces(marker_size=10)
 
     return fig
 
 
-def window_graph(window_data):
+def window_graph(window_data, max_points: int = MAX_POINTS):
+    """Figure of a window and its peaks, downsampled to `max_points`.
+
+    `window_data` is an entry of the "Window" column of :func:`rapidhrv.analyze`,
+    which normalizes its segment of the signal on demand in "lazy" window output mode.
+    """
     signal, peaks, properties = window_data
+    samples = min_max_indexes(signal, max_points // 2)
     fig = go.Figure(
         [
-            go.Scatter(y=signal),
+            go.Scatter(x=samples, y=signal[samples]),
             go.Scatter(
                 x=peaks,
                 y=properties["peak_heights"],
@@ -49,20 +105,36 @@ def window_graph(window_data):
     return fig
 
 
-def visualize(analyzed: pd.DataFrame, debug=False):
+def visualize(analyzed: pd.DataFrame, debug=False, max_points: int = MAX_POINTS):
+    """Serves an interactive graph of analysis results.
+
+    Results are downsampled to `max_points` per trace within the visible time range,
+    and clicking a result shows its window.
+    For long recordings, analyze with `window_output="lazy"`,
+    so that windows are only normalized when shown.
+    """
+    if "Window" not in analyzed:
+        raise ValueError("Visualization requires results analyzed with window output enabled.")
+
     app = dash.Dash()
 
+    analyzed = analyzed.reset_index(drop=True)
     non_outlier_data = analyzed.loc[~analyzed["Outlier"]]
     outlier_data = analyzed.loc[analyzed["Outlier"]]
+    columns = [
+        column
+        for column in (*rhv.analysis.DATA_COLUMNS, *rhv.analysis.EXTENDED_FREQUENCY_COLUMNS)
+        if column in analyzed
+    ]
 
     selected_column = "BPM"
-    results = results_graph(non_outlier_data, outlier_data, selected_column)
+    results = results_graph(non_outlier_data, outlier_data, selected_column, None, max_points)
 
     app.layout = html.Div(
         [
             dcc.Dropdown(
                 id="column-dropdown",
-                options=[{"label": col, "value": col} for col in rhv.analysis.DATA_COLUMNS],
+                options=[{"label": col, "value": col} for col in columns],
                 value=selected_column,
                 clearable=False,
             ),
@@ -71,29 +143,44 @@ def visualize(analyzed: pd.DataFrame, debug=False):
         ]
     )
 
-    @app.callback(Output("results-graph", "figure"), Input("column-dropdown", "value"))
-    def update_results_graph(column):
-        return results_graph(non_outlier_data, outlier_data, column)
+    @app.callback(
+        Output("results-graph", "figure"),
+        Input("column-dropdown", "value"),
+        Input("results-graph", "relayoutData"),
+        State("results-graph", "figure"),
+    )
+    def update_results_graph(column, relayout_data, figure):
+        x_range = _relayout_range(relayout_data, figure)
+        return results_graph(non_outlier_data, outlier_data, column, x_range, max_points)
 
     @app.callback(Output("window-container", "children"), Input("results-graph", "clickData"))
     def update_window_graph(click_data):
         if click_data is None:
             return []
 
-        selected_point = click_data["points"][0]
+        row = click_data["points"][0]["customdata"]
+        return [dcc.Graph(figure=window_graph(analyzed.at[row, "Window"], max_points))]
 
-        if selected_point["curveNumber"] == 0:
-            window_data = non_outlier_data.iloc[selected_point["pointNumber"]]["Window"]
-        elif selected_point["curveNumber"] == 1:
-            window_data = outlier_data.iloc[selected_point["pointNumber"]]["Window"]
+    app.run_server(debug=debug, dev_tools_silence_routes_logging=True)
 
-        return [dcc.Graph(figure=window_graph(window_data))]
 
-    app.run_server(debug=debug, dev_tools_silence_routes_logging=True)
+def _relayout_range(relayout_data, figure) -> Optional[tuple[float, float]]:
+    """Time range shown after a relayout event, or None for the entire recording."""
+    if not relayout_data or relayout_data.get("xaxis.autorange"):
+        return None
+    if "xaxis.range[0]" in relayout_data:
+        return relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    if "xaxis.range" in relayout_data:
+        return tuple(relayout_data["xaxis.range"])
+    # Other events, such as changing the column, keep the current range
+    x_axis = (figure or {}).get("layout", {}).get("xaxis", {})
+    if x_axis.get("autorange", True) or "range" not in x_axis:
+        return None
+    return tuple(x_axis["range"])
 
 
 if __name__ == "__main__":
     signal = rhv.data.get_example_data()
     preprocessed = rhv.preprocess(signal)
-    analyzed = rhv.analyze(preprocessed)
+    analyzed = rhv.analyze(preprocessed, window_output="lazy")
     visualize(analyzed, debug=True)
@@ -0,0 +1,201 @@
+"""Index arithmetic for evaluating many (possibly overlapping) windows at once.
+
+Per-window quantities of varying length are kept in a ragged layout:
+a flat array of values together with an array of `offsets`,
+such that the values of window `i` are ``values[offsets[i]:offsets[i + 1]]``.
+"""
+
+import numpy as np
+import scipy.ndimage
+
+
+def window_bounds(
+    n_samples: int, sample_rate: int, window_width: int, window_overlap: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the start (inclusive) and end (exclusive) sample of every analysis window."""
+    step = (window_width - window_overlap) * sample_rate
+    if step <= 0:
+        raise ValueError("Parameter 'window_overlap' must be smaller than 'window_width'.")
+
+    starts = np.arange(0, n_samples, step)
+    ends = np.minimum(starts + window_width * sample_rate, n_samples)
+    return starts, ends
+
+
+def minmax_scale(window: np.ndarray) -> np.ndarray:
+    """Scales `window` to the range 0-100, constant windows to 0.
+
+    Equal to `sklearn.preprocessing.minmax_scale(window, (0, 100))`, including rounding,
+    without importing scikit-learn.
+    """
+    window = np.asarray(window)
+    if not np.issubdtype(window.dtype, np.floating):
+        window = window.astype(np.float64)
+    data_min = np.nanmin(window)
+    data_range = np.nanmax(window) - data_min
+    if data_range < 10 * np.finfo(window.dtype).eps:
+        data_range = window.dtype.type(1)
+    scale = window.dtype.type(100) / data_range
+    scaled = window * scale
+    scaled += 0 - data_min * scale
+    return scaled
+
+
+def window_extrema(
+    data: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the minimum and maximum of `data` within every window."""
+    # reduceat over interleaved (start, end) pairs reduces each [start, end) at the even indexes,
+    # regardless of whether windows overlap. `end == len(data)` is not a valid index,
+    # so such windows are reduced up to the last sample, which is then included separately.
+    at_end = ends >= len(data)
+    indexes = np.column_stack((starts, np.where(at_end, len(data) - 1, ends))).ravel()
+    minima = np.minimum.reduceat(data, indexes)[::2]
+    maxima = np.maximum.reduceat(data, indexes)[::2]
+    minima[at_end] = np.minimum(minima[at_end], data[-1])
+    maxima[at_end] = np.maximum(maxima[at_end], data[-1])
+    return minima, maxima
+
+
+def sliding_extrema(data: np.ndarray, width: int) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the minimum and maximum of ``data[i:i + width]`` for every sample `i`.
+
+    Runs in time linear in the length of `data` regardless of `width`,
+    unlike :func:`window_extrema`, which visits every sample of every window.
+    """
+    origin = -(width // 2)  # Aligns each filter window to start at its sample
+    minima = scipy.ndimage.minimum_filter1d(data, width, mode="nearest", origin=origin)
+    maxima = scipy.ndimage.maximum_filter1d(data, width, mode="nearest", origin=origin)
+    return minima, maxima
+
+
+def assign_to_windows(
+    positions: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Assigns sorted sample `positions` to every window strictly containing them.
+
+    Positions on the first or last sample of a window are excluded,
+    mirroring `scipy.signal.find_peaks`, which cannot detect peaks at the edges of its input.
+
+    Returns
+    -------
+    (indexes, window_ids)
+        Index into `positions` and the window it belongs to, for every (position, window) pair.
+        Positions in overlapping windows appear once per window.
+    """
+    return ragged_ranges(*window_ranges(positions, starts, ends))
+
+
+def window_ranges(
+    positions: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the range of sorted `positions` strictly within every window, see
+    :func:`assign_to_windows`, such that window `i` holds ``positions[first[i]:last[i]]``.
+
+    Returns
+    -------
+    (first, last)
+        Index of the first position in every window, and one past its last position.
+    """
+    first = np.searchsorted(positions, starts, side="right")
+    last = np.searchsorted(positions, ends - 1, side="left")
+    return first, np.maximum(last, first)
+
+
+def ragged_ranges(first: np.ndarray, last: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Concatenated indexes ``range(first[i], last[i])`` and their window `i`."""
+    counts = np.maximum(last - first, 0)
+    window_ids = np.repeat(np.arange(len(first)), counts)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    indexes = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - first, counts)
+    return indexes, window_ids
+
+
+def range_sums(values: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Sums of ``values[first[i]:last[i]]`` for every `i`, zero for empty ranges.
+
+    Differences of running sums, so that the cost per range is constant.
+    """
+    prefix = np.concatenate(([0], np.cumsum(values)))
+    first = np.minimum(first, len(values))
+    last = np.clip(last, first, len(values))
+    return prefix[last] - prefix[first]
+
+
+def ragged_offsets(window_ids: np.ndarray, n_windows: int) -> np.ndarray:
+    """Returns ragged offsets for values sorted by `window_ids`."""
+    return np.concatenate(([0], np.cumsum(np.bincount(window_ids, minlength=n_windows))))
+
+
+def ragged_diff(values: np.ndarray, window_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Successive differences of `values` within each window (as `np.diff` per window)."""
+    same_window = window_ids[1:] == window_ids[:-1]
+    return np.diff(values)[same_window], window_ids[1:][same_window]
+
+
+def ragged_mean(values: np.ndarray, window_ids: np.ndarray, n_windows: int) -> np.ndarray:
+    """Mean of `values` within each window, NaN for empty windows."""
+    counts = np.bincount(window_ids, minlength=n_windows)
+    sums = np.bincount(window_ids, weights=values, minlength=n_windows)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def ragged_std(values: np.ndarray, window_ids: np.ndarray, n_windows: int) -> np.ndarray:
+    """Population standard deviation of `values` within each window (as `np.std`)."""
+    means = ragged_mean(values, window_ids, n_windows)
+    deviations = values - means[window_ids]
+    return np.sqrt(ragged_mean(np.square(deviations), window_ids, n_windows))
+
+
+def ragged_median(values: np.ndarray, window_ids: np.ndarray, n_windows: int) -> np.ndarray:
+    """Median of `values` within each window (as `np.median`), NaN for empty windows."""
+    sorted_values = values[np.lexsort((values, window_ids))]
+    counts = np.bincount(window_ids, minlength=n_windows)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    medians = np.full(n_windows, np.nan)
+    valid = counts > 0
+    lower = sorted_values[starts[valid] + (counts[valid] - 1) // 2]
+    upper = sorted_values[starts[valid] + counts[valid] // 2]
+    medians[valid] = (lower + upper) / 2
+    return medians
+
+
+def clip_prominences(
+    data: np.ndarray,
+    peaks: np.ndarray,
+    prominences: np.ndarray,
+    left_bases: np.ndarray,
+    right_bases: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+) -> np.ndarray:
+    """Restricts peak prominences computed over `data` to the window containing each peak.
+
+    The result equals `scipy.signal.peak_prominences` evaluated on ``data[start:end]``,
+    provided the original search range of every peak covered its window.
+    Only peaks whose bases lie outside their window need their base recomputed.
+    """
+    prominences = prominences.copy()
+    left_clipped = np.flatnonzero(left_bases < starts)
+    right_clipped = np.flatnonzero(right_bases >= ends)
+    if len(left_clipped) == 0 and len(right_clipped) == 0:
+        return prominences
+
+    left_minima = data[left_bases]
+    right_minima = data[right_bases]
+    if len(left_clipped) > 0:
+        left_minima[left_clipped] = window_extrema(
+            data, starts[left_clipped], peaks[left_clipped] + 1
+        )[0]
+    if len(right_clipped) > 0:
+        right_minima[right_clipped] = window_extrema(
+            data, peaks[right_clipped], ends[right_clipped]
+        )[0]
+
+    clipped = np.union1d(left_clipped, right_clipped)
+    prominences[clipped] = data[peaks[clipped]] - np.maximum(
+        left_minima[clipped], right_minima[clipped]
+    )
+    return prominences
@@ -1,6 +1,17 @@
+import datetime
+import importlib.util
+import subprocess
+import sys
+
 import numpy as np
+import pandas as pd
+import pytest
+import scipy.interpolate
+import scipy.signal
 
 import rapidhrv as rhv
+from rapidhrv import cli
+from rapidhrv.synthetic import synthetic_beats, synthetic_signal
 
 
 def test_pipeline():
@@ -16,3 +27,589 @@ def test_pipeline():
     assert not np.all(np.isnan(result["BPM"]))
     assert 59 < bpm < 61
     assert 26 < rmssd < 28
+
+
+def test_pipeline_synthetic():
+    """Offline smoke test on synthetic data with known beats"""
+    signal = synthetic_signal("ppg", duration=300, sample_rate=20, heart_rate=70, hrv=50)
+    result = rhv.analyze(rhv.preprocess(signal), amplitude_threshold=30)
+    ibi = np.diff(synthetic_beats(300, heart_rate=70, hrv=50)) * 1000
+
+    assert np.nanmean(result["BPM"]) == pytest.approx(60000 / np.mean(ibi), rel=0.01)
+    assert np.nanmean(result["RMSSD"]) == pytest.approx(
+        np.sqrt(np.mean(np.square(np.diff(ibi)))), rel=0.1
+    )
+    assert not np.all(result["Outlier"])
+
+
+def test_synthetic_ecg_clustering():
+    """T wave dominant ECG requires P/R/T clustering"""
+    signal = synthetic_signal("ecg", duration=60, sample_rate=250, t_wave_amplitude=1.5)
+    result = rhv.analyze(rhv.preprocess(signal), ecg_prt_clustering=True)
+    assert np.nanmean(result["BPM"]) == pytest.approx(60, rel=0.02)
+
+
+def test_recording_clustering():
+    preprocessed = rhv.preprocess(
+        synthetic_signal("ecg", duration=120, sample_rate=250, t_wave_amplitude=1.5)
+    )
+    window = rhv.analyze(preprocessed, ecg_prt_clustering=True)
+    recording = rhv.analyze(preprocessed, ecg_prt_clustering=True, clustering_settings="recording")
+    pd.testing.assert_series_equal(window["BPM"], recording["BPM"])
+
+    features = np.random.default_rng(0).normal(size=(50, 3))
+    first, second = rhv.clustering.kmeans(features, seed=1), rhv.clustering.kmeans(
+        features, seed=1
+    )
+    np.testing.assert_array_equal(first[0], second[0])
+
+
+def test_peak_detection_widths():
+    preprocessed = rhv.preprocess(synthetic_signal("ecg", duration=10, sample_rate=250))
+    normalized = rhv.windowing.minmax_scale(preprocessed.data)
+    lean_peaks, lean = rhv.analysis.peak_detection(normalized, 250, 50, False)
+    peaks, properties = rhv.analysis.peak_detection(normalized, 250, 50, False, widths=True)
+    np.testing.assert_array_equal(lean_peaks, peaks)
+    assert "widths" not in lean and "widths" in properties
+    for key, values in lean.items():
+        np.testing.assert_array_equal(values, properties[key])
+
+    _, clustered = rhv.analysis.peak_detection(normalized, 250, 5, True)
+    assert "widths" in clustered
+
+
+def test_vectorized_engine():
+    preprocessed = rhv.preprocess(synthetic_signal(ectopic_rate=0.02, noise=0.1))
+    loop = rhv.analyze(preprocessed, window_overlap=7)
+    vectorized = rhv.analyze(preprocessed, window_overlap=7, engine="vectorized")
+
+    assert loop["Outlier Criterion"].nunique() > 2
+    assert (loop["Outlier Criterion"].isna() == ~loop["Outlier"]).all()
+    columns = ["Time", *rhv.analysis.DATA_COLUMNS, "Outlier", "Outlier Criterion"]
+    pd.testing.assert_frame_equal(loop[columns], vectorized[columns], rtol=1e-9)
+    for loop_window, vectorized_window in zip(loop["Window"], vectorized["Window"]):
+        np.testing.assert_array_equal(loop_window[1], vectorized_window[1])
+
+
+def test_sliding_engine():
+    signal = synthetic_signal(
+        duration=300, noise=0.2, ectopic_rate=0.05, amplitude_variability=0.3
+    )
+    preprocessed = rhv.preprocess(signal)
+    vectorized = rhv.analyze(preprocessed, window_overlap=9, engine="vectorized")
+    sliding = rhv.analyze(preprocessed, window_overlap=9, engine="sliding")
+
+    # The same peaks, time-domain metrics and outliers as the vectorized engine
+    columns = ["Time", "BPM", "RMSSD", "SDNN", "SDSD", "pNN20", "pNN50", "Outlier"]
+    pd.testing.assert_frame_equal(sliding[columns], vectorized[columns], rtol=1e-9)
+    pd.testing.assert_series_equal(sliding["Outlier Criterion"], vectorized["Outlier Criterion"])
+    for (_, peaks, properties), (_, expected_peaks, expected_properties) in zip(
+        sliding["Window"], vectorized["Window"]
+    ):
+        np.testing.assert_array_equal(peaks, expected_peaks)
+        np.testing.assert_allclose(properties["prominences"], expected_properties["prominences"])
+    # Interpolated once over all windows, rather than per window
+    relative = np.abs(sliding["HF"] - vectorized["HF"]) / vectorized["HF"]
+    assert np.nanmedian(relative) < 0.05
+
+    data = np.random.default_rng(0).normal(size=100)
+    minima, maxima = rhv.windowing.sliding_extrema(data, 8)
+    np.testing.assert_array_equal(minima, [data[i : i + 8].min() for i in range(100)])
+    np.testing.assert_array_equal(maxima, [data[i : i + 8].max() for i in range(100)])
+
+
+def test_sweep():
+    preprocessed = rhv.preprocess(synthetic_signal(ectopic_rate=0.02, noise=0.1))
+    grid = {
+        "amplitude_threshold": [30, 50],
+        "n_required_peaks": [3, 6],
+        "outlier_detection_settings": ["liberal", "conservative"],
+    }
+    result = rhv.sweep(preprocessed, grid, window_overlap=5)
+    assert list(result.columns[:3]) == list(grid)
+    for (amplitude, n_peaks, outliers), frame in result.groupby(list(grid), sort=False):
+        expected = rhv.analyze(
+            preprocessed,
+            window_overlap=5,
+            amplitude_threshold=amplitude,
+            n_required_peaks=n_peaks,
+            outlier_detection_settings=outliers,
+            window_output="none",
+        )
+        pd.testing.assert_frame_equal(frame.iloc[:, 3:].reset_index(drop=True), expected)
+
+    configurations = [{"distance_threshold": 200}, {"distance_threshold": 400}]
+    assert len(rhv.sweep(preprocessed, configurations)) == 2 * len(rhv.analyze(preprocessed))
+    with pytest.raises(ValueError):
+        rhv.sweep(preprocessed, {"window_width": [10, 20]})
+
+
+def test_preprocessor():
+    signal = synthetic_signal(duration=120)
+    resampled = rhv.preprocessing.cubic_spline_interpolation(signal, 1000)
+    np.testing.assert_allclose(
+        resampled.data,
+        scipy.interpolate.make_interp_spline(np.arange(0, 120000, 50), signal.data)(
+            np.arange(120000)
+        ),
+        atol=1e-12,
+    )
+
+    chained = rhv.preprocessing.butterworth_filter(resampled, 0.5, "highpass")
+    chained = rhv.preprocessing.butterworth_filter(chained, 8, "lowpass")
+    chained = rhv.preprocessing.sg_filter(chained, (3, 100))
+    fused = rhv.Preprocessor(lowpass_cutoff=8, block_size=1000)(signal)
+    assert fused.sample_rate == 1000
+    np.testing.assert_allclose(fused.data, chained.data, rtol=0, atol=1e-12)
+    combined = rhv.Preprocessor(lowpass_cutoff=8, block_size=1000, combine_filters=True)(signal)
+    # Padding the combined filter cascade only affects the filters' settling time at either end
+    np.testing.assert_allclose(combined.data[20000:-20000], chained.data[20000:-20000], atol=1e-6)
+
+    np.testing.assert_array_equal(
+        rhv.preprocess(resampled).data,
+        rhv.preprocessing.sg_filter(
+            rhv.preprocessing.butterworth_filter(resampled, 0.5, "highpass"), (3, 100)
+        ).data,
+    )
+
+
+@pytest.mark.parametrize("method", ["poly", "local_spline"])
+def test_resampling(method):
+    signal = synthetic_signal("ecg", duration=60, sample_rate=256)
+    with pytest.raises(RuntimeError):
+        rhv.preprocess(signal)
+
+    preprocessed = rhv.preprocess(signal, resampling=method)
+    assert (preprocessed.sample_rate, len(preprocessed.data)) == (1000, 60000)
+    blocks = rhv.preprocess_blocks(signal, chunk_duration=20, resampling=method)
+    np.testing.assert_allclose(
+        np.concatenate([block.data for block in blocks]), preprocessed.data, atol=1e-5
+    )
+
+    integer_rate = synthetic_signal("ecg", duration=60, sample_rate=250)
+    result = rhv.analyze(rhv.preprocess(integer_rate, resampling=method))
+    reference = rhv.analyze(rhv.preprocess(integer_rate))
+    np.testing.assert_allclose(result["BPM"], reference["BPM"], rtol=1e-3)
+
+
+def test_peak_refinement():
+    data = np.array([0.0, 1.0, 3.0, 2.0, 0.0, 2.0, 2.0, 0.0, 1.0])
+    np.testing.assert_allclose(
+        rhv.analysis.refine_peaks(data, np.array([2, 5, 8])), [2 + 1 / 6, 5.5, 8]
+    )
+
+    signal = synthetic_signal(duration=120, sample_rate=20)
+    reference = rhv.analyze(rhv.preprocess(signal), window_output="none")
+    native = rhv.preprocess(signal, resample_rate=None, sg_settings=None)
+    errors = {}
+    for engine in ("loop", "vectorized"):
+        for refinement in ("none", "parabolic"):
+            result = rhv.analyze(
+                native, engine=engine, peak_refinement=refinement, window_output="none"
+            )
+            valid = ~result["Outlier"] & ~reference["Outlier"]
+            errors[engine, refinement] = np.median(
+                np.abs(result["RMSSD"] - reference["RMSSD"])[valid]
+            )
+    assert errors["loop", "parabolic"] == pytest.approx(errors["vectorized", "parabolic"])
+    assert errors["loop", "parabolic"] < errors["loop", "none"] / 2
+
+    with pytest.raises(ValueError):
+        rhv.analyze(native, peak_refinement="spline")
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_parallel_windows(executor):
+    signal = rhv.preprocess(synthetic_signal("ecg", duration=120, sample_rate=250))
+    reference = rhv.analyze(signal, window_overlap=5, ecg_prt_clustering=True)
+    result = rhv.analyze(
+        signal, window_overlap=5, ecg_prt_clustering=True, n_workers=2, executor=executor
+    )
+    pd.testing.assert_frame_equal(result.drop(columns="Window"), reference.drop(columns="Window"))
+    for (normalized, peaks, _), (expected, expected_peaks, _) in zip(
+        result["Window"], reference["Window"]
+    ):
+        np.testing.assert_array_equal(normalized, expected)
+        np.testing.assert_array_equal(peaks, expected_peaks)
+
+    with pytest.raises(ValueError):
+        rhv.analyze(signal, ecg_prt_clustering=True, clustering_settings="recording", n_workers=2)
+
+
+def test_result_cache(tmp_path):
+    raw = synthetic_signal(duration=120)
+    cache = rhv.ResultCache(directory=tmp_path)
+    signal = rhv.preprocess(raw, cache=cache)
+    np.testing.assert_array_equal(rhv.preprocess(raw, cache=cache).data, signal.data)
+
+    for engine in ("loop", "vectorized"):
+        for preset in ("moderate", "liberal", "moderate"):
+            kwargs = dict(engine=engine, outlier_detection_settings=preset, window_output="none")
+            pd.testing.assert_frame_equal(
+                rhv.analyze(signal, cache=cache, **kwargs), rhv.analyze(signal, **kwargs)
+            )
+    # Changing outlier detection settings reuses peaks, repeating them reuses results
+    assert cache.stats.misses == {"preprocess": 1, "peaks": 2, "results": 4}
+    assert cache.stats.hits == {"preprocess": 1, "peaks": 2, "results": 2}
+
+    full = rhv.analyze(signal, cache=cache)
+    assert cache.stats.hits["peaks"] == 3
+    reference = rhv.analyze(signal)
+    for (normalized, peaks, _), (expected, expected_peaks, _) in zip(
+        full["Window"], reference["Window"]
+    ):
+        np.testing.assert_array_equal(normalized, expected)
+        np.testing.assert_array_equal(peaks, expected_peaks)
+
+    reopened = rhv.ResultCache(max_memory=cache.memory_size // 2, directory=tmp_path)
+    rhv.analyze(signal, window_output="none", cache=reopened)
+    assert reopened.stats.disk_hits == 1
+    assert reopened.memory_size <= cache.memory_size // 2
+
+    cache.clear()
+    assert len(cache) == cache.disk_size == 0
+
+
+def test_save_results(tmp_path):
+    signal = rhv.preprocess(synthetic_signal(duration=120))
+    results = rhv.analyze(signal, window_overlap=5, extended_frequency_domain=True)
+    filename = str(tmp_path / "recording.hdf5")
+    with pytest.raises(ValueError):
+        rhv.save_results(results, filename)
+
+    signal.save(filename)
+    rhv.save_results(results, filename)
+    loaded = rhv.load_results(filename)
+    assert loaded["BPM"].dtype == np.float32 and loaded["Time"].dtype == np.int64
+    pd.testing.assert_frame_equal(
+        loaded.drop(columns="Window"), results.drop(columns="Window"), check_dtype=False
+    )
+    for (normalized, peaks, properties), (expected, expected_peaks, expected_properties) in zip(
+        loaded["Window"], results["Window"]
+    ):
+        np.testing.assert_array_equal(normalized, expected)
+        np.testing.assert_array_equal(peaks, expected_peaks)
+        np.testing.assert_array_equal(
+            properties["prominences"], expected_properties["prominences"]
+        )
+
+    rhv.save_results(results.drop(columns="Window"), filename, group="metrics")
+    assert "Window" not in rhv.load_results(filename, group="metrics")
+    assert rhv.load_results(filename, signal=False)["Window"][0][0] is None
+
+
+def test_visualization_downsampling():
+    pytest.importorskip("dash")
+    values = np.random.default_rng(0).standard_normal(10001)
+    indexes = rhv.visualization.min_max_indexes(values, 100)
+    assert len(indexes) <= 200 and np.all(np.diff(indexes) > 0)
+    assert {values.argmin(), values.argmax()} <= set(indexes)
+
+    signal = rhv.preprocess(synthetic_signal(duration=3600), resample_rate=None, sg_settings=None)
+    results = rhv.analyze(signal, window_overlap=9, engine="vectorized", window_output="lazy")
+    non_outliers, outliers = results.loc[~results["Outlier"]], results.loc[results["Outlier"]]
+    figure = rhv.visualization.results_graph(non_outliers, outliers, "BPM", max_points=500)
+    assert all(len(trace.x) <= 500 for trace in figure.data)
+    zoomed = rhv.visualization.results_graph(non_outliers, outliers, "BPM", (600, 700))
+    trace = zoomed.data[0]
+    np.testing.assert_array_equal(results.loc[trace.customdata, "Time"], trace.x)
+    assert trace.x[1] >= 600 and trace.x[-2] <= 700
+
+
+def test_profiler():
+    raw = synthetic_signal("ecg", duration=60, sample_rate=250)
+    records: list = []
+    with rhv.Profiler(sink=records.append, trace_memory=True, label="ecg") as profiler:
+        signal = rhv.preprocess(raw)
+        rhv.analyze(signal, ecg_prt_clustering=True)
+    rhv.analyze(signal)  # Not recorded
+
+    summary = profiler.summary()
+    assert set(summary.index) == {
+        "preprocess",
+        "resample",
+        "filter",
+        "smooth",
+        "analyze",
+        "peak_detection",
+        "clustering",
+        "frequency_domain",
+        "outlier_detection",
+    }
+    assert summary.loc["peak_detection", "calls"] == 6
+    assert summary.loc["preprocess", "size"] == len(raw.data)
+    assert summary.loc["preprocess", "peak"] >= 8 * len(signal.data)
+    assert summary.loc["analyze", "seconds"] >= summary.loc["peak_detection", "seconds"]
+    assert len(records) == summary["calls"].sum()
+    assert records[0]["label"] == "ecg" and records[-1]["stage"] == "analyze"
+
+
+def test_preprocess_blocks(tmp_path):
+    signal = synthetic_signal(duration=300)
+    preprocessed = rhv.preprocess(signal)
+
+    blocks = list(rhv.preprocess_blocks(signal, chunk_duration=60))
+    assert len(blocks) == 5
+    np.testing.assert_allclose(
+        np.concatenate([b.data for b in blocks]), preprocessed.data, atol=1e-9
+    )
+
+    out = np.lib.format.open_memmap(
+        tmp_path / "preprocessed.npy", mode="w+", shape=preprocessed.data.shape
+    )
+    assert rhv.preprocess_into(signal, out, chunk_duration=45) == preprocessed.sample_rate
+    np.testing.assert_allclose(out, preprocessed.data, atol=1e-9)
+
+
+def test_lazy_signal(tmp_path):
+    signal = synthetic_signal(duration=120)
+    signal.start_time = datetime.datetime(2021, 6, 1, 22)
+    signal.units = "mV"
+    signal.save(tmp_path / "signal.hdf5", chunk_size=1000, compression="gzip")
+
+    with rhv.Signal.load(tmp_path / "signal.hdf5", lazy=True) as lazy:
+        assert lazy.units == "mV"
+        window = lazy.time_slice(10, 20)
+        np.testing.assert_array_equal(window.data, signal.data[200:400])
+        assert window.start_time == datetime.datetime(2021, 6, 1, 22, 0, 10)
+
+        preprocessed = rhv.preprocess(signal)
+        preprocessed.save(tmp_path / "preprocessed.hdf5")
+        with rhv.LazySignal.open(tmp_path / "preprocessed.hdf5") as lazy_preprocessed:
+            pd.testing.assert_frame_equal(
+                rhv.analyze(lazy_preprocessed, window_output="none"),
+                rhv.analyze(preprocessed, window_output="none"),
+            )
+
+
+def test_text_loaders(tmp_path):
+    data = np.random.default_rng(0).normal(size=(500, 3))
+    pd.DataFrame(data, columns=["ecg", "ppg", "resp"]).to_csv(tmp_path / "wide.csv", index=False)
+    pd.DataFrame(data.T).to_csv(tmp_path / "rows.csv", index=False)
+    np.savetxt(tmp_path / "signal.txt", data)
+
+    signal = rhv.Signal.from_csv(tmp_path / "rows.csv", sample_rate=100, row=1)
+    np.testing.assert_allclose(signal.data, data[:, 1])
+    signal = rhv.Signal.from_txt(
+        tmp_path / "signal.txt", sample_rate=100, column=0, dtype=np.float32
+    )
+    np.testing.assert_allclose(signal.data, data[:, 0], rtol=1e-6)
+    assert signal.data.dtype == np.float32
+    with pytest.raises(ValueError, match="several rows"):
+        rhv.Signal.from_txt(tmp_path / "signal.txt", sample_rate=100)
+
+    # Without `row` or `column`, a single row or column is the signal
+    (tmp_path / "row.txt").write_text("# Samples\n1.0 2.0 3.0 4.0 5.0\n")
+    np.testing.assert_array_equal(
+        rhv.Signal.from_txt(tmp_path / "row.txt", sample_rate=100).data, [1, 2, 3, 4, 5]
+    )
+    (tmp_path / "column.txt").write_text("1\n2\n")
+    np.testing.assert_array_equal(
+        rhv.Signal.from_txt(tmp_path / "column.txt", sample_rate=100).data, [1, 2]
+    )
+    (tmp_path / "missing.csv").write_text("a\n1,2,,4\n")
+    np.testing.assert_array_equal(
+        rhv.Signal.from_csv(tmp_path / "missing.csv", sample_rate=100).data, [1, 2, np.nan, 4]
+    )
+
+    channels = rhv.read_channels(tmp_path / "wide.csv", sample_rate=100, columns=[2, 0])
+    assert list(channels) == ["resp", "ecg"]
+    np.testing.assert_allclose(channels["resp"].data, data[:, 2])
+    mixed = rhv.read_channels(tmp_path / "wide.csv", sample_rate=100, columns=["resp", 0])
+    assert list(mixed) == ["resp", "ecg"]
+    with pytest.raises(ValueError, match="no column named"):
+        rhv.read_channels(tmp_path / "wide.csv", sample_rate=100, columns=["spo2", 0])
+
+    rhv.convert_to_hdf5(
+        tmp_path / "wide.csv", {"ppg": tmp_path / "ppg.hdf5"}, sample_rate=100, chunk_size=128
+    )
+    converted = rhv.Signal.load(tmp_path / "ppg.hdf5")
+    np.testing.assert_allclose(converted.data, data[:, 1])
+    assert converted.channel_names == ["ppg"]
+
+
+def test_multichannel_signal(tmp_path):
+    ecg = synthetic_signal("ecg", duration=60, sample_rate=250)
+    ppg = synthetic_signal("ppg", duration=60, sample_rate=250)
+    signal = rhv.Signal.from_channels({"ecg": ecg, "ppg": ppg})
+    assert (signal.n_channels, signal.n_samples) == (2, ecg.n_samples)
+    np.testing.assert_array_equal(signal.channel("ppg").data, ppg.data)
+
+    preprocessed = rhv.preprocess(signal)
+    for name, channel in preprocessed.channels().items():
+        expected = rhv.preprocess(signal.channel(name))
+        np.testing.assert_allclose(channel.data, expected.data, atol=1e-9)
+
+    result = rhv.analyze(preprocessed, window_output="none")
+    assert list(result.columns[:2]) == ["Channel", "Time"]
+    pd.testing.assert_frame_equal(
+        result[result["Channel"] == "ppg"].drop(columns="Channel").reset_index(drop=True),
+        rhv.analyze(preprocessed.channel("ppg"), window_output="none"),
+    )
+
+    # The vectorized engine analyzes all channels at once, as each of them separately
+    result = rhv.analyze(preprocessed, window_overlap=5, engine="vectorized", window_output="lazy")
+    for name, channel in preprocessed.channels().items():
+        expected = rhv.analyze(
+            channel, window_overlap=5, engine="vectorized", window_output="lazy"
+        )
+        rows = result[result["Channel"] == name].drop(columns="Channel").reset_index(drop=True)
+        pd.testing.assert_frame_equal(rows.drop(columns="Window"), expected.drop(columns="Window"))
+        for window, expected_window in zip(rows["Window"], expected["Window"]):
+            np.testing.assert_array_equal(window.normalized(), expected_window.normalized())
+            np.testing.assert_array_equal(window.peaks, expected_window.peaks)
+
+    signal.save(tmp_path / "signal.hdf5", chunk_size=1000)
+    loaded = rhv.Signal.load(tmp_path / "signal.hdf5")
+    np.testing.assert_array_equal(loaded.data, signal.data)
+    assert loaded.channel_names == ["ecg", "ppg"]
+
+    # Loaded windows normalize the segment of their own channel
+    preprocessed.save(tmp_path / "results.hdf5")
+    rhv.save_results(result, tmp_path / "results.hdf5")
+    loaded_results = rhv.load_results(tmp_path / "results.hdf5")
+    assert list(loaded_results["Channel"]) == list(result["Channel"])
+    for window, expected_window in zip(loaded_results["Window"], result["Window"]):
+        np.testing.assert_array_equal(window.normalized(), expected_window.normalized())
+        np.testing.assert_array_equal(window.peaks, expected_window.peaks)
+    with pytest.raises(ValueError):
+        rhv.Signal(np.zeros((2, 100)), sample_rate=100, channel_names=["ecg"])
+
+
+def test_lazy_imports():
+    script = "import sys, rapidhrv; print(*{'dash', 'plotly', 'sklearn'} & sys.modules.keys())"
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, check=True, text=True
+    )
+    assert output.stdout.split() == []
+    if importlib.util.find_spec("dash") is not None:
+        assert callable(rhv.visualize)
+
+
+def test_analyze_many(tmp_path):
+    signal = synthetic_signal(duration=60)
+    signal.save(tmp_path / "subject.hdf5")
+    broken = rhv.Signal(np.full(1200, np.nan), sample_rate=20)
+
+    with pytest.warns(RuntimeWarning, match="NaN"):
+        results = rhv.analyze_many(
+            {"signal": signal, "file": tmp_path / "subject.hdf5", "broken": broken}, n_workers=2
+        )
+    assert set(results) == {"signal", "file"}
+    pd.testing.assert_frame_equal(results["signal"], results["file"])
+    assert "Window" not in results["signal"]
+
+    combined = rhv.analyze_many([signal, signal], n_workers=1, concat=True)
+    assert list(combined["Subject"].unique()) == [0, 1]
+    assert len(combined) == 2 * len(results["signal"])
+
+    with pytest.raises(RuntimeError):
+        rhv.analyze_many([broken], n_workers=1, errors="raise")
+
+
+def test_run_batch(tmp_path, capsys):
+    for i in range(3):
+        synthetic_signal(duration=60).save(tmp_path / f"subject{i}.hdf5")
+    (tmp_path / "config.json").write_text('{"analyze": {"window_overlap": 5}}')
+    (tmp_path / "manifest.txt").write_text("# Recordings\nsubject*.hdf5\nmissing.hdf5\n")
+    output = tmp_path / "results.hdf5"
+    argv = ["--manifest", str(tmp_path / "manifest.txt"), "-o", str(output)]
+
+    with pytest.warns(RuntimeWarning, match="missing"):
+        assert cli.main([*argv, "-c", str(tmp_path / "config.json")]) == 1
+    assert "Processed 3 recording(s)" in capsys.readouterr().out
+
+    results = rhv.load_batch_results(output)
+    assert sorted(results) == [str(tmp_path / f"subject{i}.hdf5") for i in range(3)]
+    expected = rhv.analyze_many(list(results), n_workers=1, window_overlap=5)
+    for subject, result in results.items():
+        pd.testing.assert_frame_equal(
+            result, expected[subject], check_dtype=False, check_exact=False, rtol=1e-6
+        )
+
+    # Resumed, completed recordings are skipped
+    (tmp_path / "manifest.txt").write_text("subject*.hdf5\n")
+    assert cli.main(argv) == 0
+    assert "3 already completed" in capsys.readouterr().out
+
+    synthetic_signal(duration=60).save(tmp_path / "late.hdf5")
+    sources = {"subject0": tmp_path / "subject0.hdf5", "late": tmp_path / "late.hdf5"}
+    throughput = rhv.run_batch(sources, output, n_workers=2)
+    assert list(throughput.index) == ["subject0", "late"] and throughput["error"].isna().all()
+    throughput = rhv.run_batch(sources, output, n_workers=2)
+    assert throughput.empty and "samples_per_second" in throughput
+
+    # Results that cannot be written fail their recording only
+    with pytest.warns(RuntimeWarning, match="failed"):
+        throughput = rhv.run_batch(sources, tmp_path / "missing" / "results.hdf5")
+    assert throughput["error"].str.contains("FileNotFoundError").all()
+
+
+@pytest.mark.parametrize("engine", ["loop", "vectorized", "sliding"])
+def test_window_output(engine):
+    preprocessed = rhv.preprocess(synthetic_signal(duration=60))
+    full = rhv.analyze(preprocessed, window_overlap=5, engine=engine)
+    lazy = rhv.analyze(preprocessed, window_overlap=5, engine=engine, window_output="lazy")
+    lean = rhv.analyze(preprocessed, window_overlap=5, engine=engine, window_output="none")
+
+    assert "Window" not in lean
+    pd.testing.assert_frame_equal(full.drop(columns="Window"), lean)
+    for (normalized, peaks, _), window in zip(full["Window"], lazy["Window"]):
+        lazy_normalized, lazy_peaks, _ = window
+        np.testing.assert_allclose(normalized, lazy_normalized)
+        np.testing.assert_array_equal(peaks, lazy_peaks)
+
+    assert rhv.visualization.window_graph(lazy["Window"][0]) is not None
+
+
+def test_frequency_domain():
+    rng = np.random.default_rng(0)
+    # Periodograms summed directly and by FFT, and Welch's method beyond 256 s
+    series = [np.round(800 + 50 * rng.standard_normal(n)) for n in (3, 12, 12, 40, 400)]
+    offsets = np.concatenate(([0], np.cumsum([len(x) for x in series])))
+    for sfreq in (5, 1000):
+        batch = rhv.analysis.frequency_domain_batch(np.concatenate(series), offsets, sfreq)
+        for i, x in enumerate(series):
+            powers = rhv.analysis.frequency_domain_powers(x, sfreq)
+            np.testing.assert_allclose(list(powers.values()), batch.iloc[i].to_numpy())
+            np.testing.assert_equal(powers["HF"], rhv.analysis.frequency_domain(x, sfreq))
+
+    # Reference: Welch's method over the interpolated series
+    time = np.cumsum(series[3])
+    interpolated = scipy.interpolate.interp1d(time, series[3], kind="cubic")(
+        np.arange(time[0], time[-1], 1000 / 5)
+    )
+    freq, psd = scipy.signal.welch(interpolated, fs=5, nperseg=len(interpolated))
+    in_band = (freq >= 0.15) & (freq < 0.4)
+    hf = np.sum(np.diff(freq[in_band]) * (psd[in_band][1:] + psd[in_band][:-1]) / 2)
+    assert rhv.analysis.frequency_domain(series[3], sfreq=5) == pytest.approx(hf)
+
+    preprocessed = rhv.preprocess(synthetic_signal(duration=60))
+    result = rhv.analyze(preprocessed, window_width=30, extended_frequency_domain=True)
+    assert list(result.columns[7:11]) == ["HF", "VLF", "LF", "LF/HF"]
+
+
+def test_streaming_analyzer():
+    signal = synthetic_signal(duration=120)
+    offline = rhv.analyze(rhv.preprocess(signal), window_overlap=5, window_output="none")
+
+    analyzer = rhv.StreamingAnalyzer(signal.sample_rate, window_overlap=5)
+    chunks = [analyzer.update(signal.data[i : i + 7]) for i in range(0, len(signal.data), 7)]
+    streamed = pd.concat(chunks, ignore_index=True)
+
+    # Complete windows are reported once the stream extends beyond them by its delay
+    assert len(streamed) == np.sum(offline["Time"] + 10 <= 120 - analyzer.delay)
+    assert list(streamed.columns) == rhv.streaming.STREAMING_COLUMNS
+    np.testing.assert_array_equal(streamed["Time"], offline["Time"][: len(streamed)])
+    np.testing.assert_allclose(streamed["BPM"], offline["BPM"][: len(streamed)], atol=0.05)
+    assert np.median(np.abs(streamed["RMSSD"] - offline["RMSSD"][: len(streamed)])) < 1
+    assert analyzer.stats["samples"] == len(signal.data)
+    assert analyzer.throughput > 0
+
+    # Short chunks are convolved directly and long chunks by FFT, to the same output
+    taps, data = np.random.default_rng(0).normal(size=(2, 4101))
+    fir = rhv.streaming._StreamingFIR(taps)
+    np.testing.assert_allclose(
+        np.concatenate([fir(data[:10]), fir(data[10:])]),
+        rhv.streaming._StreamingFIR(taps)(data),
+    )